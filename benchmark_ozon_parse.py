@@ -0,0 +1,71 @@
+"""
+Замер разбора ответа Ozon composer-api на сохранённой странице
+
+    python benchmark_ozon_parse.py [--fixture tests/fixtures/ozon_composer.json] [--runs 200]
+
+Сравнивает прежний разбор (json.loads каждого виджета подряд) с
+utils.ozon.parse_ozon_page, который декодирует только виджеты цены,
+названия и наличия.
+"""
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils import ozon
+
+DEFAULT_FIXTURE = Path(__file__).parent / "tests" / "fixtures" / "ozon_composer.json"
+
+
+def parse_naive(content: bytes) -> Optional[dict]:
+    """Разбор, как он был до отбора виджетов по ключу"""
+    widgets = json.loads(content).get("widgetStates", {})
+
+    product_data = None
+    for value in widgets.values():
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+                if "name" in parsed and "price" in parsed:
+                    product_data = parsed
+                    break
+            except ValueError:
+                continue
+
+    if not product_data:
+        return None
+    price = float(re.sub(r"[^\d.]", "", str(product_data["price"])) or 0)
+    return {"name": product_data.get("name", "Товар Ozon"), "price": price}
+
+
+def measure(parse: Callable[[bytes], Optional[dict]], content: bytes, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(content)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ozon composer-api parse benchmark")
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    content = args.fixture.read_bytes()
+    widgets = len(json.loads(content).get("widgetStates", {}))
+    naive = measure(parse_naive, content, args.runs)
+    current = measure(ozon.parse_ozon_page, content, args.runs)
+
+    print(f"Страница: {len(content) / 1024:.0f} КБ, виджетов: {widgets}, декодер: {ozon.loads.__module__}")
+    print(f"Все виджеты:      {naive * 1000:.2f} мс")
+    print(f"Отбор по ключам:  {current * 1000:.2f} мс (x{naive / current:.1f})")
+    print(f"Результат: {ozon.parse_ozon_page(content)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Замер холодного старта бота: время импорта main.py и RSS процесса
+
+    python benchmark_startup.py [--runs 5]
+
+Каждый прогон — отдельный процесс. Колонки «прогрев» показывают,
+сколько добавляет импорт всех отложенных зависимостей (openai, yt_dlp,
+парсеры документов) — примерно столько стоил старт, когда они
+импортировались на уровне модулей.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+CHILD_CODE = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from utils.lazy import rss_mb, load_all
+cold_rss = rss_mb()
+load_all()
+print(json.dumps({
+    "import": imported - start,
+    "rss": cold_rss,
+    "warm_up": time.perf_counter() - imported,
+    "warm_rss": rss_mb(),
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    # config.py требует ключи; для замера импорта подойдут любые
+    for key in ("BOT_TOKEN", "OPENAI_KEY", "WEATHER_KEY"):
+        env.setdefault(key, "benchmark")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE],
+        cwd=Path(__file__).parent,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import time and RSS")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    def median(key: str) -> float:
+        values = [run[key] for run in runs if run[key] is not None]
+        return statistics.median(values) if values else float("nan")
+
+    print(f"Прогонов: {args.runs}")
+    print(f"Импорт main.py:  {median('import'):.2f} с, RSS {median('rss'):.0f} МБ")
+    print(f"+ прогрев:       {median('warm_up'):.2f} с, RSS {median('warm_rss'):.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
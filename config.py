@@ -16,4 +16,81 @@ if not WEATHER_KEY:
     raise ValueError("WEATHER_KEY not found in .env file")
 
 MAX_HISTORY_LENGTH = 15
-API_TIMEOUT = 10
\ No newline at end of file
+API_TIMEOUT = 10
+
+# Голосовые сообщения
+VOICE_MAX_CONCURRENCY = int(os.getenv("VOICE_MAX_CONCURRENCY", "4"))
+VOICE_CACHE_SIZE = int(os.getenv("VOICE_CACHE_SIZE", "1000"))
+VOICE_SEGMENT_THRESHOLD = int(os.getenv("VOICE_SEGMENT_THRESHOLD", "120"))  # секунд
+VOICE_SEGMENT_LENGTH = int(os.getenv("VOICE_SEGMENT_LENGTH", "60"))  # секунд
+
+# Музыка
+MUSIC_WORKERS = int(os.getenv("MUSIC_WORKERS", "2"))
+MUSIC_JOB_TIMEOUT = int(os.getenv("MUSIC_JOB_TIMEOUT", "300"))  # секунд
+MUSIC_CACHE_MAX_MB = int(os.getenv("MUSIC_CACHE_MAX_MB", "1024"))
+
+# Очистка временных файлов
+TEMP_FILE_MAX_AGE = int(os.getenv("TEMP_FILE_MAX_AGE", "3600"))  # секунд
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", "600"))  # секунд
+
+# Напоминания
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+# Сколько напоминаний отправляются одновременно (остальные ждут в очереди планировщика)
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "16"))
+
+# Исходящие сообщения (лимиты Telegram: ~30 сообщений/с всего и 1/с в один чат)
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "30"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))
+
+# Отслеживание цен: сколько проверок товаров в час допускается на всех пользователей
+PRICE_POLL_BUDGET = int(os.getenv("PRICE_POLL_BUDGET", "600"))
+# Сколько проверок товаров ждут ответа одновременно (не меньше пакета WB — 50 артикулов)
+PRICE_POLL_CONCURRENCY = int(os.getenv("PRICE_POLL_CONCURRENCY", "100"))
+
+# Webhook: если WEBHOOK_URL не задан, бот работает через long polling.
+# WEBHOOK_URL — внешний адрес (обычно reverse proxy с TLS), сервер слушает WEBAPP_HOST:WEBAPP_PORT
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET not found in .env file")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Общее состояние процессов: memory (один процесс), sqlite или redis (несколько процессов).
+# Напоминания и товары всегда лежат в локальной data/bot.db, поэтому все процессы
+# должны работать на одной машине; redis лишь выносит FSM, сессии и аренду из SQLite
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_SYNC_INTERVAL = int(os.getenv("STATE_SYNC_INTERVAL", "30"))  # секунд
+LEADER_LEASE_TTL = int(os.getenv("LEADER_LEASE_TTL", "30"))  # секунд
+
+# Защита от флуда: общий бакет пользователя (токенов в секунду и запас)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "0.5"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "10"))
+
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Трассировка: доля обновлений, для которых пишется трасса (0 — выключено)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "data/traces.jsonl")
+# OTLP/HTTP-коллектор (например, http://localhost:4318); если задан, трассы уходят туда, а не в файл
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "")
+
+# Администраторы бота (Telegram ID через запятую): им доступна команда /debug
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+# Профилирование: хендлеры дольше SLOW_UPDATE_THRESHOLD секунд сохраняются с сэмплами стека (0 — выключено)
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "10"))
+# cProfile для отдельных пользователей и команд (через запятую); меняются и через /debug profile
+PROFILE_USERS = {int(user_id) for user_id in os.getenv("PROFILE_USERS", "").split(",") if user_id.strip()}
+PROFILE_COMMANDS = {name.strip().lstrip("/") for name in os.getenv("PROFILE_COMMANDS", "").split(",") if name.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+# Мониторинг задержек цикла событий (/debug lag on): блокировка дольше порога логируется со стеком
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.2"))  # секунд
+
+# Через сколько секунд после старта фоном импортировать тяжёлые зависимости (openai, yt_dlp...);
+# отрицательное значение — только при первом использовании
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "5"))
@@ -0,0 +1,84 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, BufferedInputFile
+from config import ADMIN_IDS
+from utils.profiling import lag_monitor, slow_sampler, profile_users, profile_commands, dump_tasks
+
+router_admin = Router()
+# Для остальных пользователей команды как будто нет
+router_admin.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+DEBUG_HELP = (
+    "🛠 Отладка:\n\n"
+    "/debug lag on|off — мониторинг блокировок цикла событий\n"
+    "/debug tasks — стеки всех задач asyncio\n"
+    "/debug slow <секунды> — порог медленных хендлеров (0 — выключить)\n"
+    "/debug profile <user_id|команда> — включить cProfile\n"
+    "/debug profile off — выключить cProfile"
+)
+
+
+def debug_status() -> str:
+    lines = [
+        f"Мониторинг цикла: {'включён' if lag_monitor.running else 'выключен'}",
+        f"Задержка цикла: последняя {lag_monitor.last_lag * 1000:.0f} мс, "
+        f"максимум {lag_monitor.max_lag * 1000:.0f} мс",
+        f"Порог медленных хендлеров: {slow_sampler.threshold:g} с",
+        f"cProfile: пользователи {sorted(profile_users) or '—'}, команды {sorted(profile_commands) or '—'}",
+    ]
+    if lag_monitor.stalls:
+        lines.append("\nПоследняя блокировка:\n" + lag_monitor.stalls[-1])
+    return "\n".join(lines)
+
+
+@router_admin.message(Command("debug"))
+async def cmd_debug(message: Message):
+    args = message.text.split()[1:]
+
+    if not args:
+        await message.answer(f"{DEBUG_HELP}\n\n{debug_status()}"[:4096])
+        return
+
+    action = args[0].lower()
+
+    if action == "lag" and len(args) == 2 and args[1] in ("on", "off"):
+        if args[1] == "on":
+            lag_monitor.start()
+        else:
+            lag_monitor.stop()
+        await message.answer(debug_status()[:4096])
+
+    elif action == "tasks":
+        report = dump_tasks()
+        await message.answer_document(
+            BufferedInputFile(report.encode("utf-8"), filename="tasks.txt"),
+            caption=report.split("\n", 1)[0]
+        )
+
+    elif action == "slow" and len(args) == 2:
+        try:
+            slow_sampler.threshold = max(float(args[1]), 0.0)
+        except ValueError:
+            await message.answer("❌ Укажите порог в секундах, например: /debug slow 5")
+            return
+        await message.answer(f"✅ Порог медленных хендлеров: {slow_sampler.threshold:g} с")
+
+    elif action == "profile" and len(args) == 2:
+        target = args[1].lstrip("/").lower()
+        if target == "off":
+            profile_users.clear()
+            profile_commands.clear()
+            await message.answer("✅ cProfile выключен")
+        elif target.isdigit():
+            profile_users.add(int(target))
+            await message.answer(f"✅ cProfile для пользователя {target}")
+        else:
+            profile_commands.add(target)
+            await message.answer(f"✅ cProfile для команды /{target}")
+
+    else:
+        await message.answer(DEBUG_HELP)
+
+
+def get_router_admin():
+    return router_admin
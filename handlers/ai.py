@@ -2,18 +2,18 @@ import asyncio
 import logging
 from aiogram import Router, F, types
 from aiogram.filters import Command
-from openai import OpenAI
-from config import OPENAI_KEY
+from utils.state_store import state_store
+from utils.metrics import track_upstream
+from utils.llm import get_client
 
 router_ai = Router()
 
-# OpenRouter - бесплатный провайдер AI
-client = OpenAI(
-    api_key=OPENAI_KEY,
-    base_url="https://openrouter.ai/api/v1"
-)
+# OpenRouter - бесплатный провайдер AI, клиент создаётся при первом запросе
+LLM_MODEL = "meta-llama/llama-3.3-70b-instruct:free"  # Бесплатная модель
 
-user_sessions = {}
+# Сессии лежат в общем хранилище (см. STATE_BACKEND), чтобы диалог
+# продолжался, в какой бы процесс бота ни пришло следующее сообщение
+SESSION_TTL = 7 * 24 * 3600
 
 SYSTEM_PROMPTS = {
     "default": "You are a helpful AI assistant. Always respond in Russian if the user writes in Russian.",
@@ -24,53 +24,59 @@ SYSTEM_PROMPTS = {
 }
 
 
-def get_session(user_id: int) -> dict:
-    if user_id not in user_sessions:
-        user_sessions[user_id] = {
+async def get_session(user_id: int) -> dict:
+    session = await state_store.get(f"ai_session:{user_id}")
+    if session is None:
+        session = {
             "mode": None,
             "messages": []
         }
-    return user_sessions[user_id]
+    return session
 
 
-def reset_history(user_id: int, mode: str):
-    session = get_session(user_id)
+async def save_session(user_id: int, session: dict):
+    await state_store.set(f"ai_session:{user_id}", session, ttl=SESSION_TTL)
+
+
+async def reset_history(user_id: int, mode: str):
+    session = await get_session(user_id)
     session["mode"] = mode
     session["messages"] = [
         {"role": "system", "content": SYSTEM_PROMPTS[mode]}
     ]
+    await save_session(user_id, session)
 
 
 @router_ai.message(Command("ai"))
 async def enable_default_ai(message: types.Message):
-    reset_history(message.from_user.id, "default")
+    await reset_history(message.from_user.id, "default")
     await message.answer("🤖 Обычный ИИ включён!")
 
 
 @router_ai.message(Command("movie_ai"))
 async def enable_movie_ai(message: types.Message):
-    reset_history(message.from_user.id, "movie")
+    await reset_history(message.from_user.id, "movie")
     await message.answer("🎬 Кино-ИИ включён!")
 
 
 @router_ai.message(Command("ai_off"))
 async def disable_ai(message: types.Message):
-    session = get_session(message.from_user.id)
-    session["mode"] = None
-    session["messages"] = []
+    await state_store.delete(f"ai_session:{message.from_user.id}")
     await message.answer("🛑 ИИ выключен!")
 
 
 @router_ai.message(F.text)
 async def handle_ai_message(message: types.Message):
     user_id = message.from_user.id
-    session = get_session(user_id)
+    session = await get_session(user_id)
     
     if not session["mode"]:
         return
     
     if not session["messages"]:
-        reset_history(user_id, session["mode"])
+        session["messages"] = [
+            {"role": "system", "content": SYSTEM_PROMPTS[session["mode"]]}
+        ]
     
     session["messages"].append({
         "role": "user",
@@ -78,17 +84,17 @@ async def handle_ai_message(message: types.Message):
     })
     
     try:
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="meta-llama/llama-3.3-70b-instruct:free",  # Бесплатная модель
-            messages=session["messages"],
-            temperature=0.7,
-            max_tokens=2048,
-            extra_headers={
-                "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
-                "X-Title": "Telegram Bot"
-            }
-        )
+        with track_upstream("llm", LLM_MODEL):
+            response = await asyncio.to_thread(lambda: get_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=session["messages"],
+                temperature=0.7,
+                max_tokens=2048,
+                extra_headers={
+                    "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
+                    "X-Title": "Telegram Bot"
+                }
+            ))
         
         answer = response.choices[0].message.content
         
@@ -100,6 +106,8 @@ async def handle_ai_message(message: types.Message):
         if len(session["messages"]) > 21:
             session["messages"] = [session["messages"][0]] + session["messages"][-20:]
         
+        await save_session(user_id, session)
+        
         await message.answer(answer)
         
     except Exception as e:
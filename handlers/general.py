@@ -42,10 +42,13 @@ async def handle_help(message: Message):
 /remind <время> <текст> — установить напоминание
 /timer <время> [текст] — быстрый таймер
 /reminders — список напоминаний
+/timezone [пояс] — часовой пояс для напоминаний
 
 📊 Отслеживание цен:
 /track <ссылка> [цена] — отслеживать WB/Ozon
+/track <ссылки по строкам> — несколько товаров сразу (или TXT/CSV с подписью /track)
 /tracked — список отслеживаемых товаров
+/history <номер> — история цены товара
 
 📄 Конспекты и саммаризация:
 /summary [текст/ссылка] — краткое содержание
@@ -31,7 +31,7 @@ async def handle_genre_choice(message: Message, state: FSMContext):
     choice = message.text.strip()
     
     if choice.lower() in ["помощь", "6", "ии", "ai"]:
-        reset_history(message.from_user.id, "movie")
+        await reset_history(message.from_user.id, "movie")
         await message.answer(
             "🎬 Кино-ИИ включён!\n"
             "Опиши, что хочешь посмотреть."
@@ -1,21 +1,36 @@
 import os
+import json
+import time
 import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Optional
 from aiogram import Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from yt_dlp import YoutubeDL
 from aiogram.types import FSInputFile
+from config import MUSIC_WORKERS, MUSIC_JOB_TIMEOUT, MUSIC_CACHE_MAX_MB
+from utils.disk_cache import DiskCache
+from utils.download_pool import DownloadPool
+from utils.metrics import Gauge, CACHE_ENTRIES, QUEUE_DEPTH
+from utils.tracing import span
+from utils.lazy import lazy_import
+
+# yt_dlp импортируется при первом поиске или скачивании
+yt_dlp = lazy_import("yt_dlp")
 
 DOWNLOAD_DIR = "downloads"
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+download_cache = DiskCache(DOWNLOAD_DIR, MUSIC_CACHE_MAX_MB * 1024 * 1024)
 
 router_music = Router()
 
 YDL_OPTIONS = {
     'format': 'bestaudio/best',
-    'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
+    'outtmpl': os.path.join(DOWNLOAD_DIR, '%(id)s.%(ext)s'),
     'noplaylist': True,
     'quiet': True,
     'no_warnings': True,
+    'socket_timeout': 30,
     'postprocessors': [{
         'key': 'FFmpegExtractAudio',
         'preferredcodec': 'mp3',
@@ -23,41 +38,177 @@ YDL_OPTIONS = {
     }],
 }
 
+YDL_SEARCH_OPTIONS = {
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',
+}
+
+# video_id -> {"file_id": ..., "title": ...}: трек уже загружен в Telegram
+AUDIO_CACHE_FILE = Path("data/music_cache.json")
+AUDIO_CACHE_FILE.parent.mkdir(exist_ok=True)
+audio_cache: Dict[str, dict] = {}
+
+# нормализованный запрос -> (video_id, title, время)
+QUERY_CACHE_TTL = 24 * 3600
+QUERY_CACHE_SIZE = 5000
+query_cache: Dict[str, tuple] = {}
+search_in_flight: Dict[str, asyncio.Future] = {}
+
+download_pool = DownloadPool(size=MUSIC_WORKERS, timeout=MUSIC_JOB_TIMEOUT)
 
-def sanitize_filename(title: str) -> str:
-    """Удаляем все опасные символы из имени файла для Telegram"""
-    return "".join(c for c in title if c.isalnum() or c in ("_", "-"))
+QUEUE_DEPTH.add("downloads", lambda: download_pool.depth)
+CACHE_ENTRIES.add("music_files", lambda: len(audio_cache))
+CACHE_ENTRIES.add("music_queries", lambda: len(query_cache))
+Gauge("bot_music_disk_cache_bytes", "Size of downloaded tracks on disk", lambda: download_cache.total_bytes)
 
 
-async def download_track(query: str) -> str | None:
-    """Ищет трек на YouTube и скачивает его. Возвращает путь к файлу или None"""
+def load_audio_cache():
+    if not AUDIO_CACHE_FILE.exists():
+        return
+
+    try:
+        with open(AUDIO_CACHE_FILE, "r", encoding="utf-8") as f:
+            audio_cache.update(json.load(f))
+        logging.info(f"Loaded {len(audio_cache)} cached tracks")
+    except Exception as e:
+        logging.error(f"Error loading music cache: {e}")
+
+
+def save_audio_cache():
+    try:
+        with open(AUDIO_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(audio_cache, f, ensure_ascii=False)
+    except Exception as e:
+        logging.error(f"Error saving music cache: {e}")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+async def search_track(query: str) -> Optional[dict]:
+    """Находит видео на YouTube без скачивания. Возвращает {"id", "title"} или None"""
+    key = normalize_query(query)
+    cached = query_cache.get(key)
+    if cached and time.time() - cached[2] < QUERY_CACHE_TTL:
+        return {"id": cached[0], "title": cached[1]}
+
+    # Одинаковые запросы, пришедшие одновременно, ищем один раз
+    while key in search_in_flight:
+        owner = search_in_flight[key]
+        try:
+            return await asyncio.shield(owner)
+        except asyncio.CancelledError:
+            # Отменили не нас, а поиск, который мы ждали, — ищем сами
+            if not owner.cancelled():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    search_in_flight[key] = future
+
+    try:
+        track = await _search_track(query)
+        future.set_result(track)
+        return track
+    finally:
+        # Поиск отменён или упал: ожидающие не должны висеть на future вечно
+        if not future.done():
+            future.cancel()
+        del search_in_flight[key]
+
+
+async def _search_track(query: str) -> Optional[dict]:
     try:
         loop = asyncio.get_event_loop()
         info = await loop.run_in_executor(
             None,
-            lambda: YoutubeDL(YDL_OPTIONS).extract_info(f"ytsearch1:{query}", download=True)
+            lambda: yt_dlp.YoutubeDL(YDL_SEARCH_OPTIONS).extract_info(f"ytsearch1:{query}", download=False)
         )
+    except Exception as e:
+        logging.error(f"Music search error: {query} | Error: {e}")
+        return None
+
+    entries = info.get('entries') or []
+    if not entries:
+        return None
+
+    track = {"id": entries[0]['id'], "title": entries[0].get('title') or query}
+
+    if len(query_cache) >= QUERY_CACHE_SIZE:
+        query_cache.pop(next(iter(query_cache)))
+    query_cache[normalize_query(query)] = (track["id"], track["title"], time.time())
+
+    return track
 
-        # Получаем название и расширение скачанного файла
-        track = info['entries'][0]
-        title = track['title']
-        ext = "mp3"  # yt-dlp конвертирует в mp3 через postprocessor
-        safe_title = sanitize_filename(title)
-        file_path = os.path.join(DOWNLOAD_DIR, f"{safe_title}.{ext}")
 
-        # Если yt-dlp по какой-то причине дал другое имя файла, ищем его в папке
-        if not os.path.exists(file_path):
-            for f in os.listdir(DOWNLOAD_DIR):
-                if f.startswith(title[:10]):
-                    file_path = os.path.join(DOWNLOAD_DIR, f)
-                    break
+def _download(video_id: str) -> Optional[str]:
+    """Блокирующее скачивание; путь к итоговому файлу берём из хука постпроцессора"""
+    result = {}
+
+    def hook(d):
+        if d.get('status') == 'finished':
+            result['path'] = d.get('info_dict', {}).get('filepath') or result.get('path')
+
+    options = {**YDL_OPTIONS, 'postprocessor_hooks': [hook]}
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+
+    file_path = result.get('path')
+    if not file_path:
+        # Постпроцессоры не запускались (например, файл уже был в mp3)
+        downloads = info.get('requested_downloads') or []
+        file_path = downloads[0].get('filepath') if downloads else None
 
-        return file_path if os.path.exists(file_path) else None
+    return file_path if file_path and os.path.exists(file_path) else None
 
+
+def submit_download(video_id: str) -> asyncio.Future:
+    """Ставит скачивание в общий пул; повторный вызов для того же видео вернёт тот же future"""
+    return download_pool.submit(video_id, lambda: _download(video_id))
+
+
+async def download_track(video_id: str, future: Optional[asyncio.Future] = None) -> str | None:
+    """Дожидается скачивания трека. Возвращает путь к файлу или None"""
+    cached = download_cache.get(f"{video_id}.mp3")
+    if cached:
+        return str(cached)
+
+    if future is None:
+        future = submit_download(video_id)
+
+    try:
+        file_path = await asyncio.shield(future)
     except Exception as e:
-        print(f"Ошибка при скачивании: {e}")
+        logging.error(f"Ошибка при скачивании: {video_id} | Error: {e}")
         return None
 
+    if file_path:
+        download_cache.add(file_path)
+    return file_path
+
+
+async def send_cached_track(message: types.Message, video_id: str) -> bool:
+    """
+    Отправляет трек по сохранённому file_id. False, если кэша нет или Telegram его отверг
+
+    Кэш сбрасывается только на TelegramBadRequest (file_id недействителен):
+    сетевые ошибки и лимиты пробрасываются, годный file_id не теряется.
+    """
+    cached = audio_cache.get(video_id)
+    if not cached:
+        return False
+
+    try:
+        await message.answer_audio(audio=cached["file_id"], title=cached["title"], caption="🎧 Вот ваш трек!")
+        return True
+    except TelegramBadRequest as e:
+        logging.warning(f"Cached file_id rejected: {video_id} | Error: {e}")
+        audio_cache.pop(video_id, None)
+        save_audio_cache()
+        return False
+
 
 @router_music.message(Command("music"))
 async def cmd_music(message: types.Message):
@@ -66,20 +217,48 @@ async def cmd_music(message: types.Message):
         await message.answer("Введите название трека, например:\n/music imagine dragons believer")
         return
 
-    await message.answer(f"🔎 Ищу и скачиваю трек: <b>{query}</b>…")
+    track = await search_track(query)
+    if not track:
+        await message.answer("❌ Трек не найден.")
+        return
+
+    if await send_cached_track(message, track["id"]):
+        return
+
+    # Ставим задачу в очередь сразу, чтобы показать пользователю позицию
+    future = None
+    position = 0
+    if not download_cache.get(f"{track['id']}.mp3"):
+        future = submit_download(track["id"])
+        position = download_pool.position(track["id"])
 
-    file_path = await download_track(query)
+    if position:
+        await message.answer(f"⏳ Трек в очереди на скачивание, позиция: {position}")
+    else:
+        await message.answer(f"🔎 Скачиваю трек: <b>{track['title']}</b>…")
+
+    with span("music.download", video_id=track["id"], queue_position=position):
+        file_path = await download_track(track["id"], future)
     if not file_path:
         await message.answer("❌ Не удалось скачать трек.")
         return
 
     try:
-        audio_file = FSInputFile(file_path)
-        await message.answer_audio(audio=audio_file, title=query, caption="🎧 Вот ваш трек!")
+        with download_cache.pinned(file_path):
+            audio_file = FSInputFile(file_path)
+            sent = await message.answer_audio(audio=audio_file, title=track["title"], caption="🎧 Вот ваш трек!")
     except Exception as e:
-        print(f"Ошибка при отправке аудио: {e}")
+        logging.error(f"Ошибка при отправке аудио: {e}")
         await message.answer("❌ Произошла ошибка при отправке трека.")
+        return
+
+    if sent.audio:
+        audio_cache[track["id"]] = {"file_id": sent.audio.file_id, "title": track["title"]}
+        save_audio_cache()
 
 
 def get_router_music():
     return router_music
+
+
+load_audio_cache()
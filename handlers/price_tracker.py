@@ -1,16 +1,493 @@
 import logging
 import asyncio
 import re
-from datetime import datetime
-from typing import Dict, List, Optional
+import time
+import requests
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import Command
-from utils.api_client import fetch_json
+from config import PRICE_POLL_BUDGET, PRICE_POLL_CONCURRENCY, STATE_BACKEND
+from utils.database import db
+from utils.delivery import delivery_queue
+from utils.metrics import Gauge, CACHE_ENTRIES, SCHEDULED_JOBS
+from utils.ozon import parse_ozon_page
+from utils.text_reader import detect_encoding
+from utils.scheduler import Scheduler
+from utils.wildberries import WildberriesClient, fetch_basket_card
 
 router_price = Router()
 
+# user_id -> подписки пользователя в порядке добавления
 tracked_items: Dict[int, List[dict]] = {}
+# id подписки -> подписка
+item_index: Dict[int, dict] = {}
+# (shop, product_id) -> общий для всех подписчиков товар
+products: Dict[Tuple[str, str], dict] = {}
+# Позиция в журнале изменений, до которой синхронизированы подписки
+sync_cursor = 0
+
+# Лестница интервалов опроса товара: изменение цены сбрасывает на нижнюю
+# ступень, каждая проверка без изменений поднимает на одну выше
+POLL_INTERVALS = (1800, 3600, 7200, 21600, 43200, 86400)
+INITIAL_POLL_LEVEL = 3  # 6 часов, как до адаптивного опроса
+NEAR_TARGET_POLL_LEVEL = 1  # товары в пределах TARGET_PROXIMITY от целевой цены
+TARGET_PROXIMITY = 0.1
+# Время опроса округляется до слота, чтобы товары WB попадали в общие пакеты
+POLL_SLOT = 300
+# Суммарная потребность в запросах в час (сумма 3600 / интервал)
+poll_demand = 0.0
+
+# Сколько запросов к одной площадке выполняется одновременно
+SHOP_CONCURRENCY = {"wildberries": 5, "ozon": 2}
+shop_semaphores = {shop: asyncio.Semaphore(limit) for shop, limit in SHOP_CONCURRENCY.items()}
+# Запросы к WB собираются в пакеты, лимит применяется к пакетам, а не к товарам
+BATCHED_SHOPS = {"wildberries"}
+wb_client = WildberriesClient(max_concurrency=SHOP_CONCURRENCY["wildberries"])
+ITEM_TIMEOUT = 15  # секунд на один товар
+
+# Повторные нажатия «Проверить» в течение TTL не ходят на площадки
+PRODUCT_CACHE_TTL = 120
+product_cache: Dict[str, Tuple[float, dict]] = {}
+
+MAX_TRACKED_ITEMS = 10
+# Список ссылок файлом: TXT/CSV, по строке «ссылка[,;пробел]целевая_цена»
+MAX_TRACK_FILE_SIZE = 256 * 1024
+TRACK_ENTRY_RE = re.compile(
+    r'(https?://[^\s,;"\']+)["\']?(?:[ \t]*[,;]?[ \t]*["\']?(\d+(?:[.,]\d+)?)(?![^\s"\']))?'
+)
+# Артикул WB в ссылке; один шаблон и для ключа товара, и для запроса карточки,
+# иначе ссылка без слэша после артикула проходит проверку, но не разбирается
+WB_ARTICLE_RE = re.compile(r'/catalog/(\d+)')
+
+# Как часто обновляем сообщение с прогрессом проверки
+PROGRESS_EDIT_INTERVAL = 1.0
+
+ITEM_COLUMNS = (
+    "id", "user_id", "chat_id", "shop", "product_id", "url", "name",
+    "current_price", "target_price", "last_check"
+)
+
+# Последняя записанная цена товара: историю пишем только при изменении
+last_recorded: Dict[Tuple[str, str], int] = {}
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+# ==================== ХРАНЕНИЕ ====================
+
+def init_price_tables():
+    db.executescript_sync("""
+        CREATE TABLE IF NOT EXISTS tracked_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            shop TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            name TEXT NOT NULL,
+            current_price REAL NOT NULL,
+            target_price REAL,
+            last_check TEXT,
+            UNIQUE (user_id, shop, product_id)
+        );
+        CREATE TABLE IF NOT EXISTS price_history (
+            shop TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            PRIMARY KEY (shop, product_id, ts)
+        ) WITHOUT ROWID;
+    """)
+
+    db.track_changes_sync("tracked_items", enabled=STATE_BACKEND != "memory")
+
+
+def item_from_row(row: tuple) -> dict:
+    item = dict(zip(ITEM_COLUMNS, row))
+    item["last_check"] = datetime.fromisoformat(item["last_check"]) if item["last_check"] else None
+    item["currency"] = "₽"
+    return item
+
+
+def load_tracked_items():
+    global sync_cursor
+    try:
+        init_price_tables()
+        sync_cursor = db.change_cursor_sync()
+        rows = db.execute_sync(
+            f"SELECT {', '.join(ITEM_COLUMNS)} FROM tracked_items ORDER BY id"
+        )
+        
+        for row in rows:
+            index_item(item_from_row(row))
+        
+        logging.info(f"Loaded {len(rows)} tracked items")
+    except Exception as e:
+        logging.error(f"Error loading tracked items: {e}")
+
+
+async def save_item(item: dict):
+    item["id"] = await db.insert(
+        f"INSERT INTO tracked_items ({', '.join(ITEM_COLUMNS[1:])}) "
+        f"VALUES ({', '.join('?' for _ in ITEM_COLUMNS[1:])})",
+        (
+            item["user_id"], item["chat_id"], item["shop"], item["product_id"], item["url"],
+            item["name"], item["current_price"], item["target_price"], item["last_check"].isoformat()
+        )
+    )
+
+
+async def save_product_price(product: dict):
+    try:
+        await db.execute(
+            "UPDATE tracked_items SET current_price = ?, last_check = ? WHERE shop = ? AND product_id = ?",
+            (product["price"], product["last_check"].isoformat(), product["shop"], product["product_id"])
+        )
+    except Exception as e:
+        logging.error(f"Error updating price of {product['shop']}/{product['product_id']}: {e}")
+
+
+async def delete_saved_item(item: dict):
+    try:
+        await db.execute("DELETE FROM tracked_items WHERE id = ?", (item["id"],))
+    except Exception as e:
+        logging.error(f"Error deleting tracked item {item.get('id')}: {e}")
+
+
+async def record_price(shop: str, product_id: str, price: float):
+    """Добавляет точку в историю, только если цена изменилась (цены храним в копейках)"""
+    key = (shop, product_id)
+    kopecks = round(price * 100)
+    
+    try:
+        if key not in last_recorded:
+            rows = await db.execute(
+                "SELECT price FROM price_history WHERE shop = ? AND product_id = ? "
+                "ORDER BY ts DESC LIMIT 1",
+                key
+            )
+            if rows:
+                last_recorded[key] = rows[0][0]
+        
+        if last_recorded.get(key) == kopecks:
+            return
+        
+        await db.execute(
+            "INSERT OR REPLACE INTO price_history (shop, product_id, ts, price) VALUES (?, ?, ?, ?)",
+            (shop, product_id, int(time.time()), kopecks)
+        )
+        last_recorded[key] = kopecks
+    except Exception as e:
+        logging.error(f"Error recording price for {shop}/{product_id}: {e}")
+
+
+async def get_price_history(shop: str, product_id: str, points: int = 24) -> Optional[dict]:
+    """
+    Сводка по истории цены с прореживанием на стороне SQLite
+
+    Returns:
+        {"min", "max", "first", "last", "count", "series"} или None, если истории нет;
+        series — не больше points средних значений по равным интервалам времени
+    """
+    rows = await db.execute(
+        "SELECT MIN(price), MAX(price), COUNT(*), MIN(ts), MAX(ts) FROM price_history "
+        "WHERE shop = ? AND product_id = ?",
+        (shop, product_id)
+    )
+    low, high, count, start, end = rows[0]
+    if not count:
+        return None
+    
+    bucket = max(1, (end - start) // points + 1)
+    series = await db.execute(
+        "SELECT (ts - ?) / ? AS b, AVG(price) FROM price_history "
+        "WHERE shop = ? AND product_id = ? GROUP BY b ORDER BY b",
+        (start, bucket, shop, product_id)
+    )
+    
+    return {
+        "min": low / 100,
+        "max": high / 100,
+        "first": series[0][1] / 100,
+        "last": series[-1][1] / 100,
+        "count": count,
+        "start": datetime.fromtimestamp(start),
+        "series": [avg / 100 for _, avg in series],
+    }
+
+
+# ==================== ТОВАРЫ И ПОДПИСЧИКИ ====================
+
+def subscribe(item: dict) -> dict:
+    """Привязывает подписку к общему товару, создавая его при необходимости"""
+    key = (item["shop"], item["product_id"])
+    product = products.get(key)
+    
+    if product is None:
+        product = products[key] = {
+            "shop": item["shop"],
+            "product_id": item["product_id"],
+            "url": item["url"],
+            "name": item["name"],
+            "price": item["current_price"],
+            "last_check": item["last_check"],
+            "subscribers": set(),
+            "level": INITIAL_POLL_LEVEL,
+            "rate": 0.0
+        }
+    
+    product["subscribers"].add(item["id"])
+    item_index[item["id"]] = item
+    schedule_poll(product)
+    return product
+
+
+def index_item(item: dict) -> dict:
+    """Добавляет подписку в память (повторный вызов заменяет запись) и возвращает товар"""
+    user_items = tracked_items.setdefault(item["user_id"], [])
+    existing = item_index.get(item["id"])
+    if existing in user_items:
+        user_items[user_items.index(existing)] = item
+    else:
+        user_items.append(item)
+    return subscribe(item)
+
+
+def unsubscribe(item: dict):
+    item_index.pop(item["id"], None)
+    
+    key = (item["shop"], item["product_id"])
+    product = products.get(key)
+    if product:
+        product["subscribers"].discard(item["id"])
+        if not product["subscribers"]:
+            del products[key]
+            poll_scheduler.cancel(key)
+            set_poll_rate(product, 0.0)
+    
+    user_items = tracked_items.get(item["user_id"], [])
+    if item in user_items:
+        user_items.remove(item)
+
+
+def price_change_message(item: dict, old_price: float, new_price: float) -> Optional[str]:
+    shop_emoji = "🟣" if item['shop'] == "wildberries" else "🔵"
+    
+    if new_price < old_price:
+        price_drop = old_price - new_price
+        percent_drop = (price_drop / old_price) * 100
+        
+        message = (
+            f"📉 Цена снизилась!\n\n"
+            f"{shop_emoji} {item['shop'].upper()}\n"
+            f"📦 {item['name']}\n\n"
+            f"💰 Было: {old_price:,.0f} ₽\n"
+            f"💰 Стало: {new_price:,.0f} ₽\n"
+            f"📊 Снижение: {price_drop:,.0f} ₽ (-{percent_drop:.1f}%)\n\n"
+            f"🔗 {item['url']}"
+        )
+        
+        if item["target_price"] and new_price <= item["target_price"]:
+            message = "🎯 " + message + "\n\n✅ Целевая цена!"
+        
+        return message
+    
+    if new_price > old_price:
+        price_increase = new_price - old_price
+        percent_increase = (price_increase / old_price) * 100
+        
+        if percent_increase > 10:
+            return (
+                f"📈 Цена выросла!\n\n"
+                f"{shop_emoji} {item['shop'].upper()}\n"
+                f"📦 {item['name']}\n\n"
+                f"💰 Было: {old_price:,.0f} ₽\n"
+                f"💰 Стало: {new_price:,.0f} ₽\n"
+                f"📊 Рост: {price_increase:,.0f} ₽ (+{percent_increase:.1f}%)\n\n"
+                f"🔗 {item['url']}"
+            )
+    
+    return None
+
+
+async def apply_price(product: dict, new_price: float, skip_user: Optional[int] = None):
+    """
+    Применяет свежую цену товара: изменение определяется один раз,
+    уведомления рассылаются всем подписчикам (кроме skip_user)
+    """
+    old_price = product["price"]
+    product["last_check"] = datetime.now()
+    
+    if new_price != old_price:
+        product["price"] = new_price
+        product["level"] = 0
+        
+        for item_id in product["subscribers"]:
+            item = item_index[item_id]
+            item_old_price = item["current_price"]
+            item["current_price"] = new_price
+            item["last_check"] = product["last_check"]
+            
+            if item["user_id"] == skip_user:
+                continue
+            
+            message = price_change_message(item, item_old_price, new_price)
+            if message:
+                delivery_queue.send(item["chat_id"], message)
+        
+        # Цена пошла — проверяем товар чаще уже со следующего раза
+        schedule_poll(product)
+    
+    await save_product_price(product)
+    await record_price(product["shop"], product["product_id"], new_price)
+
+
+def sparkline(values: List[float]) -> str:
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return "".join(SPARK_CHARS[round((v - low) * scale)] for v in values)
+
+
+def canonical_key(url: str) -> Optional[Tuple[str, str]]:
+    """(shop, product_id) по ссылке: разные ссылки на один товар дают один ключ"""
+    shop = get_shop(url)
+    if shop == "wildberries":
+        match = WB_ARTICLE_RE.search(url)
+    elif shop == "ozon":
+        # Последнее число в слаге: /product/naushniki-2-v-1-123456789/
+        match = re.search(r'/product/(?:[\w-]*-)?(\d+)', url)
+    else:
+        return None
+    return (shop, match.group(1)) if match else None
+
+
+def parse_track_entries(text: str) -> Tuple[Dict[Tuple[str, str], Tuple[str, Optional[float]]], List[str]]:
+    """
+    Достаёт из текста ссылки с необязательной целевой ценой после каждой
+
+    Returns:
+        ({(shop, product_id): (url, target_price)}, [нераспознанные ссылки]);
+        повторы одного товара схлопываются в первую запись
+    """
+    entries = {}
+    invalid = []
+    
+    for url, target in TRACK_ENTRY_RE.findall(text):
+        key = canonical_key(url)
+        if key is None:
+            invalid.append(url)
+            continue
+        if key not in entries:
+            entries[key] = (url, float(target.replace(",", ".")) if target else None)
+    
+    return entries, invalid
+
+
+async def add_tracked_item(message: Message, url: str, product_info: dict, target_price: Optional[float]) -> dict:
+    """Сохраняет подписку и привязывает её к товару; при ошибке БД бросает исключение"""
+    user_id = message.from_user.id
+    item = {
+        "url": url,
+        "product_id": product_info["product_id"],
+        "name": product_info["name"],
+        "current_price": product_info["price"],
+        "target_price": target_price,
+        "last_check": datetime.now(),
+        "currency": "₽",
+        "shop": product_info["shop"],
+        "chat_id": message.chat.id,
+        "user_id": user_id
+    }
+    
+    await save_item(item)
+    
+    product = index_item(item)
+    await apply_price(product, item["current_price"], skip_user=user_id)
+    return item
+
+
+async def track_many(message: Message, entries: Dict[Tuple[str, str], Tuple[str, Optional[float]]], invalid: List[str]):
+    """Добавляет несколько товаров сразу и отвечает одной сводкой"""
+    user_id = message.from_user.id
+    user_items = tracked_items.setdefault(user_id, [])
+    tracked_keys = {(i["shop"], i["product_id"]) for i in user_items}
+    
+    new_keys = [key for key in entries if key not in tracked_keys]
+    already = len(entries) - len(new_keys)
+    room = max(0, MAX_TRACKED_ITEMS - len(user_items))
+    to_add, over_limit = new_keys[:room], new_keys[room:]
+    
+    added, failed = [], []
+    
+    if to_add:
+        await message.answer(f"⏳ Проверяю товары: {len(to_add)}")
+        
+        # Лимиты площадок и пакетирование WB применяются внутри fetch_product_info
+        infos = await asyncio.gather(*(fetch_product_info(entries[key][0]) for key in to_add))
+        
+        for key, product_info in zip(to_add, infos):
+            url, target_price = entries[key]
+            if not product_info:
+                failed.append(url)
+                continue
+            try:
+                added.append(await add_tracked_item(message, url, product_info, target_price))
+            except Exception as e:
+                logging.error(f"Error saving tracked item: {e}")
+                failed.append(url)
+    
+    lines = []
+    for item in added:
+        shop_emoji = "🟣" if item["shop"] == "wildberries" else "🔵"
+        line = f"✅ {shop_emoji} {item['name'][:40]} — {item['current_price']:,.0f} ₽"
+        if item["target_price"]:
+            line += f" → 🎯 {item['target_price']:,.0f} ₽"
+        lines.append(line)
+    
+    notes = []
+    if already:
+        notes.append(f"⚠️ Уже отслеживаются: {already}")
+    if over_limit:
+        notes.append(f"❌ Не поместились в лимит ({MAX_TRACKED_ITEMS} товаров): {len(over_limit)}")
+    if failed:
+        notes.append(f"❌ Не удалось получить информацию: {len(failed)}")
+        notes.extend(f"   {url[:80]}" for url in failed[:5])
+    if invalid:
+        notes.append(f"❌ Не ссылки на товар WB/Ozon: {len(invalid)}")
+    
+    blocks = [f"📊 Добавлено товаров: {len(added)} из {len(entries) + len(invalid)}", "\n".join(lines), "\n".join(notes)]
+    await message.answer("\n\n".join(block for block in blocks if block))
+
+
+@router_price.message(F.document, F.caption.startswith("/track"))
+async def track_from_file(message: Message):
+    """/track в подписи к TXT/CSV файлу со списком ссылок"""
+    document = message.document
+    
+    if document.file_size and document.file_size > MAX_TRACK_FILE_SIZE:
+        await message.answer("❌ Файл слишком большой (максимум 256 KB)")
+        return
+    
+    try:
+        file = await message.bot.get_file(document.file_id)
+        data = (await message.bot.download_file(file.file_path)).read()
+        text = data.decode(detect_encoding(data), errors="replace")
+    except Exception as e:
+        logging.error(f"Track file error: {e}")
+        await message.answer("❌ Ошибка при чтении файла")
+        return
+    
+    entries, invalid = parse_track_entries(text + "\n" + message.caption)
+    
+    if not entries:
+        await message.answer("❌ В файле нет ссылок на товары WB или Ozon")
+        return
+    
+    await track_many(message, entries, invalid)
 
 
 @router_price.message(Command("track"))
@@ -24,10 +501,17 @@ async def track_price(message: Message):
             "/track <ссылка> [целевая_цена]\n\n"
             "Примеры:\n"
             "/track https://www.wildberries.ru/catalog/12345/detail.aspx\n"
-            "/track https://www.ozon.ru/product/12345 5000"
+            "/track https://www.ozon.ru/product/12345 5000\n\n"
+            "Несколько товаров — по ссылке на строку, "
+            "или TXT/CSV файл с подписью /track"
         )
         return
     
+    entries, invalid = parse_track_entries(message.text)
+    if len(entries) + len(invalid) > 1:
+        await track_many(message, entries, invalid)
+        return
+    
     url = parts[1]
     target_price = None
     
@@ -48,7 +532,7 @@ async def track_price(message: Message):
     
     await message.answer("⏳ Проверяю товар...")
     
-    product_info = await get_product_info(url)
+    product_info = await fetch_product_info(url)
     
     if not product_info:
         await message.answer("❌ Не удалось получить информацию о товаре")
@@ -59,8 +543,8 @@ async def track_price(message: Message):
     if user_id not in tracked_items:
         tracked_items[user_id] = []
     
-    if len(tracked_items[user_id]) >= 10:
-        await message.answer("❌ Достигнут лимит (10 товаров)")
+    if len(tracked_items[user_id]) >= MAX_TRACKED_ITEMS:
+        await message.answer(f"❌ Достигнут лимит ({MAX_TRACKED_ITEMS} товаров)")
         return
     
     for item in tracked_items[user_id]:
@@ -68,19 +552,12 @@ async def track_price(message: Message):
             await message.answer("⚠️ Этот товар уже отслеживается")
             return
     
-    item = {
-        "url": url,
-        "product_id": product_info["product_id"],
-        "name": product_info["name"],
-        "current_price": product_info["price"],
-        "target_price": target_price,
-        "last_check": datetime.now(),
-        "currency": "₽",
-        "shop": product_info["shop"],
-        "chat_id": message.chat.id
-    }
-    
-    tracked_items[user_id].append(item)
+    try:
+        item = await add_tracked_item(message, url, product_info, target_price)
+    except Exception as e:
+        logging.error(f"Error saving tracked item: {e}")
+        await message.answer("❌ Не удалось сохранить товар")
+        return
     
     shop_emoji = "🟣" if item["shop"] == "wildberries" else "🔵"
     response = (
@@ -100,8 +577,6 @@ async def track_price(message: Message):
         response += "\n✉️ Уведомления об изменении цены."
     
     await message.answer(response)
-    
-    asyncio.create_task(monitor_price(message.bot, user_id, len(tracked_items[user_id]) - 1))
 
 
 @router_price.message(Command("tracked"))
@@ -124,7 +599,7 @@ async def show_tracked(message: Message):
         
         response += "\n\n"
     
-    response += "🔄 Проверка каждые 6 часов"
+    response += "🔄 Проверка от 30 минут до суток: чаще, если цена меняется или близка к цели"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🗑 Удалить", callback_data="price_delete")],
@@ -144,40 +619,72 @@ async def check_prices_now(callback: CallbackQuery):
     
     await callback.answer("⏳ Проверяю...")
     
+    items = list(tracked_items[user_id])
+    progress = await callback.message.answer(f"⏳ Проверяю товары: 0/{len(items)}")
+    
+    async def check(item: dict) -> Optional[str]:
+        product_info = await fetch_product_info(item["url"])
+        product = products.get((item["shop"], item["product_id"]))
+        
+        if not product_info or not product:
+            return None
+        
+        old_price = item["current_price"]
+        new_price = product_info["price"]
+        await apply_price(product, new_price, skip_user=user_id)
+        
+        if new_price == old_price:
+            return None
+        
+        diff = old_price - new_price
+        percent = (diff / old_price) * 100
+        shop_emoji = "🟣" if item['shop'] == "wildberries" else "🔵"
+        
+        if diff > 0:
+            return (
+                f"{shop_emoji} {item['name'][:30]}...\n"
+                f"📉 {old_price:,.0f} → {new_price:,.0f} ₽ (-{percent:.1f}%)"
+            )
+        return (
+            f"{shop_emoji} {item['name'][:30]}...\n"
+            f"📈 {old_price:,.0f} → {new_price:,.0f} ₽ (+{abs(percent):.1f}%)"
+        )
+    
     results = []
-    for item in tracked_items[user_id]:
-        product_info = await get_product_info(item["url"])
+    done = 0
+    last_edit = time.monotonic()
+    
+    for task in asyncio.as_completed([check(item) for item in items]):
+        try:
+            result = await task
+        except Exception as e:
+            logging.error(f"Price check error: {e}")
+            result = None
         
-        if product_info:
-            old_price = item["current_price"]
-            new_price = product_info["price"]
-            
-            if new_price != old_price:
-                diff = old_price - new_price
-                percent = (diff / old_price) * 100
-                
-                shop_emoji = "🟣" if item['shop'] == "wildberries" else "🔵"
-                
-                if diff > 0:
-                    results.append(
-                        f"{shop_emoji} {item['name'][:30]}...\n"
-                        f"📉 {old_price:,.0f} → {new_price:,.0f} ₽ (-{percent:.1f}%)"
-                    )
-                else:
-                    results.append(
-                        f"{shop_emoji} {item['name'][:30]}...\n"
-                        f"📈 {old_price:,.0f} → {new_price:,.0f} ₽ (+{abs(percent):.1f}%)"
-                    )
-                
-                item["current_price"] = new_price
-                item["last_check"] = datetime.now()
+        done += 1
+        if result:
+            results.append(result)
+        
+        # Промежуточные итоги показываем не чаще раза в секунду
+        if done < len(items) and time.monotonic() - last_edit >= PROGRESS_EDIT_INTERVAL:
+            last_edit = time.monotonic()
+            text = f"⏳ Проверяю товары: {done}/{len(items)}"
+            if results:
+                text += "\n\n" + "\n\n".join(results)
+            try:
+                await progress.edit_text(text)
+            except Exception as e:
+                logging.warning(f"Progress edit failed: {e}")
     
     if results:
         response = "🔄 Изменения:\n\n" + "\n\n".join(results)
     else:
         response = "✅ Цены не изменились"
     
-    await callback.message.answer(response)
+    try:
+        await progress.edit_text(response)
+    except Exception:
+        await callback.message.answer(response)
 
 
 @router_price.callback_query(F.data == "price_delete")
@@ -189,12 +696,12 @@ async def delete_tracked_start(callback: CallbackQuery):
         return
     
     buttons = []
-    for idx, item in enumerate(tracked_items[user_id]):
+    for item in tracked_items[user_id]:
         shop_emoji = "🟣" if item['shop'] == "wildberries" else "🔵"
         buttons.append([
             InlineKeyboardButton(
                 text=f"🗑 {shop_emoji} {item['name'][:30]}...",
-                callback_data=f"price_del_{idx}"
+                callback_data=f"price_del_{item['id']}"
             )
         ])
     
@@ -207,10 +714,13 @@ async def delete_tracked_start(callback: CallbackQuery):
 @router_price.callback_query(F.data.startswith("price_del_"))
 async def delete_tracked_item(callback: CallbackQuery):
     user_id = callback.from_user.id
-    idx = int(callback.data.split("_")[2])
+    item_id = int(callback.data.split("_")[2])
+    item = item_index.get(item_id)
     
-    if user_id in tracked_items and 0 <= idx < len(tracked_items[user_id]):
-        tracked_items[user_id].pop(idx)
+    if item and item["user_id"] == user_id:
+        # Сначала база: синхронизация в других процессах не должна вернуть запись обратно
+        await delete_saved_item(item)
+        unsubscribe(item)
         await callback.answer("✅ Удалено")
         await callback.message.edit_text("✅ Товар удалён")
     else:
@@ -222,46 +732,129 @@ async def cancel_delete(callback: CallbackQuery):
     await callback.message.edit_text("❌ Отменено")
 
 
-async def get_product_info(url: str) -> Optional[dict]:
+@router_price.message(Command("history"))
+async def show_history(message: Message):
+    parts = message.text.split(maxsplit=1)
+    user_id = message.from_user.id
+    items = tracked_items.get(user_id, [])
+    
+    if len(parts) < 2:
+        await message.answer(
+            "📈 История цены\n\n"
+            "Формат: /history <номер из /tracked или артикул>\n"
+            "Пример: /history 1"
+        )
+        return
+    
+    query = parts[1].strip()
+    item = None
+    
+    if query.isdigit() and 1 <= int(query) <= len(items):
+        item = items[int(query) - 1]
+    else:
+        item = next((i for i in items if i["product_id"] == query), None)
+    
+    if not item:
+        await message.answer("❌ Товар не найден. Посмотрите номера в /tracked")
+        return
+    
+    history = await get_price_history(item["shop"], item["product_id"])
+    
+    if not history:
+        await message.answer("📭 История цены пока пуста")
+        return
+    
+    change = history["last"] - history["first"]
+    percent = change / history["first"] * 100 if history["first"] else 0
+    
+    if change < 0:
+        trend = f"📉 {change:,.0f} ₽ ({percent:.1f}%)"
+    elif change > 0:
+        trend = f"📈 +{change:,.0f} ₽ (+{percent:.1f}%)"
+    else:
+        trend = "➖ без изменений"
+    
+    await message.answer(
+        f"📈 {item['name'][:60]}\n\n"
+        f"💰 Сейчас: {item['current_price']:,.0f} ₽\n"
+        f"⬇️ Минимум: {history['min']:,.0f} ₽\n"
+        f"⬆️ Максимум: {history['max']:,.0f} ₽\n"
+        f"📊 Тренд: {trend}\n\n"
+        f"{sparkline(history['series'])}\n"
+        f"С {history['start'].strftime('%d.%m.%Y')}, точек в истории: {history['count']}"
+    )
+
+
+def get_shop(url: str) -> Optional[str]:
     if "wildberries.ru" in url:
-        return await parse_wildberries(url)
+        return "wildberries"
     elif "ozon.ru" in url:
+        return "ozon"
+    return None
+
+
+async def get_product_info(url: str) -> Optional[dict]:
+    shop = get_shop(url)
+    if shop == "wildberries":
+        return await parse_wildberries(url)
+    elif shop == "ozon":
         return await parse_ozon(url)
     return None
 
 
+async def fetch_product_info(url: str, use_cache: bool = True) -> Optional[dict]:
+    """
+    get_product_info с лимитом параллельных запросов к площадке,
+    таймаутом на товар и коротким кэшем результатов
+    """
+    now = time.monotonic()
+    cached = product_cache.get(url)
+    if use_cache and cached and now - cached[0] < PRODUCT_CACHE_TTL:
+        return cached[1]
+    
+    shop = get_shop(url)
+    semaphore = shop_semaphores.get(shop)
+    if semaphore is None:
+        return None
+    
+    try:
+        if shop in BATCHED_SHOPS:
+            info = await asyncio.wait_for(get_product_info(url), timeout=ITEM_TIMEOUT)
+        else:
+            async with semaphore:
+                info = await asyncio.wait_for(get_product_info(url), timeout=ITEM_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.error(f"Product info timeout: {url}")
+        return None
+    
+    if info:
+        if len(product_cache) > 5000:
+            product_cache.clear()
+        product_cache[url] = (time.monotonic(), info)
+    return info
+
+
 async def parse_wildberries(url: str) -> Optional[dict]:
     try:
-        match = re.search(r'/catalog/(\d+)/', url)
+        match = WB_ARTICLE_RE.search(url)
         if not match:
             return None
         
         article = match.group(1)
-        vol = article[:len(article) - 5]
-        part = article[:len(article) - 3]
-        basket = get_wb_basket(int(vol))
-        
-        api_url = f"https://basket-{basket:02d}.wbbasket.ru/vol{vol}/part{part}/{article}/info/ru/card.json"
-        data = await fetch_json(api_url)
+        card = await wb_client.get_card(article)
         
-        if not data:
+        if not card or not card["price"]:
             return None
         
-        name = data.get("imt_name", "Товар Wildberries")
-        
-        price = 0
-        if "extended" in data and "basicPriceU" in data["extended"]:
-            price = data["extended"]["basicPriceU"] / 100
-        elif "salePriceU" in data:
-            price = data["salePriceU"] / 100
-        
-        if price == 0:
-            return None
+        name = card["name"]
+        if not name:
+            data = await fetch_basket_card(article)
+            name = (data or {}).get("imt_name", "Товар Wildberries")
         
         return {
             "product_id": article,
             "name": name,
-            "price": price,
+            "price": card["price"],
             "shop": "wildberries"
         }
     
@@ -270,53 +863,19 @@ async def parse_wildberries(url: str) -> Optional[dict]:
         return None
 
 
-def get_wb_basket(vol: int) -> int:
-    if vol <= 143:
-        return 1
-    elif vol <= 287:
-        return 2
-    elif vol <= 431:
-        return 3
-    elif vol <= 719:
-        return 4
-    elif vol <= 1007:
-        return 5
-    elif vol <= 1061:
-        return 6
-    elif vol <= 1115:
-        return 7
-    elif vol <= 1169:
-        return 8
-    elif vol <= 1313:
-        return 9
-    elif vol <= 1601:
-        return 10
-    elif vol <= 1655:
-        return 11
-    elif vol <= 1919:
-        return 12
-    elif vol <= 2045:
-        return 13
-    elif vol <= 2189:
-        return 14
-    else:
-        return 15
-
-
 async def parse_ozon(url: str) -> Optional[dict]:
     try:
-        match = re.search(r'-(\d+)/?', url)
-        if not match:
+        key = canonical_key(url)
+        if not key:
             return None
         
-        product_id = match.group(1)
+        product_id = key[1]
         api_url = f"https://www.ozon.ru/api/composer-api.bx/page/json/v2?url=/product/{product_id}/"
         
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
         
-        import requests
         response = await asyncio.to_thread(
             lambda: requests.get(api_url, headers=headers, timeout=10)
         )
@@ -324,42 +883,14 @@ async def parse_ozon(url: str) -> Optional[dict]:
         if response.status_code != 200:
             return None
         
-        data = response.json()
-        widgets = data.get("widgetStates", {})
-        
-        product_data = None
-        for key, value in widgets.items():
-            if isinstance(value, str):
-                try:
-                    import json
-                    parsed = json.loads(value)
-                    if "name" in parsed and "price" in parsed:
-                        product_data = parsed
-                        break
-                except:
-                    continue
-        
-        if not product_data:
-            for key, value in widgets.items():
-                if "webPrice" in key or "webAPrice" in key:
-                    try:
-                        import json
-                        parsed = json.loads(value) if isinstance(value, str) else value
-                        if "price" in parsed:
-                            product_data = parsed
-                            break
-                    except:
-                        continue
-        
-        if not product_data:
-            return None
+        # Ответ на сотни килобайт разбираем вне event loop
+        product_data = await asyncio.to_thread(parse_ozon_page, response.content)
         
-        name = product_data.get("name", "Товар Ozon")
+        if not product_data or not product_data["available"]:
+            return None
         
-        price = 0
-        if "price" in product_data:
-            price_str = product_data["price"]
-            price = float(re.sub(r'[^\d.]', '', str(price_str)))
+        name = product_data["name"]
+        price = product_data["price"]
         
         if price == 0:
             return None
@@ -376,67 +907,134 @@ async def parse_ozon(url: str) -> Optional[dict]:
         return None
 
 
-async def monitor_price(bot, user_id: int, item_index: int):
-    while True:
-        try:
-            await asyncio.sleep(21600)  # 6 часов
-            
-            if user_id not in tracked_items or item_index >= len(tracked_items[user_id]):
-                break
-            
-            item = tracked_items[user_id][item_index]
-            product_info = await get_product_info(item["url"])
-            
-            if not product_info:
-                continue
-            
-            new_price = product_info["price"]
-            old_price = item["current_price"]
-            
-            item["current_price"] = new_price
-            item["last_check"] = datetime.now()
-            
-            shop_emoji = "🟣" if item['shop'] == "wildberries" else "🔵"
-            
-            if new_price < old_price:
-                price_drop = old_price - new_price
-                percent_drop = (price_drop / old_price) * 100
-                
-                message = (
-                    f"📉 Цена снизилась!\n\n"
-                    f"{shop_emoji} {item['shop'].upper()}\n"
-                    f"📦 {item['name']}\n\n"
-                    f"💰 Было: {old_price:,.0f} ₽\n"
-                    f"💰 Стало: {new_price:,.0f} ₽\n"
-                    f"📊 Снижение: {price_drop:,.0f} ₽ (-{percent_drop:.1f}%)\n\n"
-                    f"🔗 {item['url']}"
-                )
-                
-                if item["target_price"] and new_price <= item["target_price"]:
-                    message = "🎯 " + message + "\n\n✅ Целевая цена!"
-                
-                await bot.send_message(item["chat_id"], message)
-            
-            elif new_price > old_price:
-                price_increase = new_price - old_price
-                percent_increase = (price_increase / old_price) * 100
-                
-                if percent_increase > 10:
-                    message = (
-                        f"📈 Цена выросла!\n\n"
-                        f"{shop_emoji} {item['shop'].upper()}\n"
-                        f"📦 {item['name']}\n\n"
-                        f"💰 Было: {old_price:,.0f} ₽\n"
-                        f"💰 Стало: {new_price:,.0f} ₽\n"
-                        f"📊 Рост: {price_increase:,.0f} ₽ (+{percent_increase:.1f}%)\n\n"
-                        f"🔗 {item['url']}"
-                    )
-                    
-                    await bot.send_message(item["chat_id"], message)
+# ==================== АДАПТИВНЫЙ ОПРОС ====================
+
+def near_target(product: dict) -> bool:
+    for item_id in product["subscribers"]:
+        target = item_index[item_id]["target_price"]
+        if target and product["price"] <= target * (1 + TARGET_PROXIMITY):
+            return True
+    return False
+
+
+def set_poll_rate(product: dict, rate: float):
+    global poll_demand
+    poll_demand += rate - product["rate"]
+    product["rate"] = rate
+
+
+def poll_interval(product: dict) -> float:
+    """
+    Интервал до следующей проверки товара
+
+    Желаемый интервал берётся из лестницы POLL_INTERVALS; если все товары
+    вместе просят больше PRICE_POLL_BUDGET запросов в час, интервалы
+    растягиваются пропорционально.
+    """
+    level = product["level"]
+    if near_target(product):
+        level = min(level, NEAR_TARGET_POLL_LEVEL)
+    
+    interval = POLL_INTERVALS[level]
+    set_poll_rate(product, 3600 / interval)
+    
+    return interval * max(1.0, poll_demand / PRICE_POLL_BUDGET)
+
+
+def schedule_poll(product: dict, since: Optional[datetime] = None):
+    """Ставит следующую проверку через интервал от since (по умолчанию — от последней проверки)"""
+    now = datetime.now()
+    when = (since or product["last_check"] or now) + timedelta(seconds=poll_interval(product))
+    
+    slot = -(-max(when, now).timestamp() // POLL_SLOT) * POLL_SLOT
+    poll_scheduler.schedule((product["shop"], product["product_id"]), datetime.fromtimestamp(slot))
+
+
+async def poll_product(key: Tuple[str, str]):
+    product = products.get(key)
+    if not product:
+        return
+    
+    product_info = None
+    try:
+        product_info = await fetch_product_info(product["url"], use_cache=False)
         
-        except Exception as e:
-            logging.error(f"Monitor error: {e}")
+        if product_info and product["subscribers"]:
+            if product_info["price"] == product["price"]:
+                product["level"] = min(product["level"] + 1, len(POLL_INTERVALS) - 1)
+            await apply_price(product, product_info["price"])
+    
+    except Exception as e:
+        logging.error(f"Monitor error for {product['shop']}/{product['product_id']}: {e}")
+    
+    finally:
+        # Товар могли удалить, пока шёл запрос
+        if products.get(key) is product:
+            schedule_poll(product, since=datetime.now())
+
+
+# Проверки WB склеиваются в пакеты только из одновременно ждущих артикулов:
+# лимит ниже batch_size дробил бы пакет. Запросы к площадкам ограничивают shop_semaphores
+poll_scheduler = Scheduler(
+    poll_product, "Price poller",
+    max_concurrency=max(PRICE_POLL_CONCURRENCY, wb_client.batch_size)
+)
+SCHEDULED_JOBS.add("price_poll", lambda: len(poll_scheduler))
+CACHE_ENTRIES.add("products", lambda: len(product_cache))
+Gauge("bot_tracked_products", "Distinct products being polled", lambda: len(products))
+Gauge("bot_price_poll_demand", "Requested product checks per hour before the budget", lambda: poll_demand)
+
+
+def start_price_polling():
+    """Ведущий процесс: расписание опроса строится по всем товарам при избрании"""
+    for product in products.values():
+        schedule_poll(product)
+    poll_scheduler.start()
+
+
+def stop_price_polling():
+    poll_scheduler.stop()
+
+
+async def sync_tracked_items(authoritative: bool):
+    """
+    Подтягивает подписки, добавленные и удалённые другими процессами бота
+
+    Из базы читаются только строки из журнала изменений. Ведущий процесс
+    сам опрашивает цены, поэтому у известных ему подписок цену из базы
+    не берёт; остальные процессы обновляют из базы и цену.
+    """
+    global sync_cursor
+    select_sql = f"SELECT {', '.join(ITEM_COLUMNS)} FROM tracked_items"
+    cursor, changed = await db.changes("tracked_items", sync_cursor)
+    if changed is None:
+        rows = await db.execute(select_sql)
+        changed = set(item_index) | {row[0] for row in rows}
+    else:
+        rows = await db.select_in(select_sql, "id", changed) if changed else []
+    
+    seen = set()
+    for row in rows:
+        stored = item_from_row(row)
+        seen.add(stored["id"])
+        if authoritative and stored["id"] in item_index:
+            continue
+        
+        product = index_item(stored)
+        if not authoritative:
+            product["price"] = stored["current_price"]
+            product["last_check"] = stored["last_check"]
+    
+    for item_id in changed - seen:
+        item = item_index.get(item_id)
+        if item:
+            unsubscribe(item)
+    
+    sync_cursor = cursor
 
 
 def get_router_price():
-    return router_price
\ No newline at end of file
+    return router_price
+
+
+load_tracked_items()
@@ -1,43 +1,141 @@
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List
+from datetime import datetime, timezone, tzinfo
+from typing import Dict, List, Optional
 import json
 from pathlib import Path
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import Command
+from config import DEFAULT_TIMEZONE, REMINDER_CONCURRENCY, STATE_BACKEND
+from utils.database import db
+from utils.delivery import delivery_queue, PRIORITY_HIGH
+from utils.recurrence import (
+    parse_schedule,
+    parse_relative_time,
+    parse_timezone,
+    rule_from_string,
+    timezone_name,
+    IntervalRule,
+    Rule
+)
+from utils.metrics import SCHEDULED_JOBS
+from utils.scheduler import Scheduler
 
 router_reminders = Router()
 
 reminders: Dict[int, List[dict]] = {}
-reminder_counter = 0
+reminder_index: Dict[int, dict] = {}
 
+user_timezones: Dict[int, tzinfo] = {}
+default_timezone = parse_timezone(DEFAULT_TIMEZONE) or timezone.utc
+
+# Старый формат хранения; при первом запуске переносится в SQLite
 REMINDERS_FILE = Path("data/reminders.json")
-REMINDERS_FILE.parent.mkdir(exist_ok=True)
+
+REMINDER_COLUMNS = ("id", "user_id", "chat_id", "text", "time", "repeat", "kind", "version")
+
+# Позиции в журнале изменений, до которых уже синхронизированы таблицы
+sync_cursors: Dict[str, int] = {"reminders": 0, "user_timezones": 0}
+
+
+def init_reminders_table():
+    db.executescript_sync("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            time TEXT NOT NULL,
+            repeat TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_reminders_time ON reminders (time);
+        CREATE TABLE IF NOT EXISTS user_timezones (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL
+        );
+    """)
+    db.ensure_column_sync("reminders", "kind", "TEXT NOT NULL DEFAULT 'reminder'")
+    # Растёт при каждом переносе времени: по нему процессы видят, чья запись новее
+    db.ensure_column_sync("reminders", "version", "INTEGER NOT NULL DEFAULT 0")
+    
+    multiprocess = STATE_BACKEND != "memory"
+    db.track_changes_sync("reminders", enabled=multiprocess)
+    db.track_changes_sync("user_timezones", key="user_id", enabled=multiprocess)
+
+
+def parse_stored_time(value: str) -> datetime:
+    """Время из базы; старые записи без пояса считаем местным временем сервера"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc)
 
 
-def save_reminders():
+def get_user_timezone(user_id: int) -> tzinfo:
+    return user_timezones.get(user_id, default_timezone)
+
+
+async def save_user_timezone(user_id: int, tz: tzinfo):
+    user_timezones[user_id] = tz
     try:
-        data = {}
-        for user_id, user_reminders in reminders.items():
-            data[str(user_id)] = [
-                {
-                    **r,
-                    "time": r["time"].isoformat() if isinstance(r["time"], datetime) else r["time"]
-                }
-                for r in user_reminders
-            ]
-        
-        with open(REMINDERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        await db.execute(
+            "INSERT INTO user_timezones (user_id, timezone) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone",
+            (user_id, timezone_name(tz))
+        )
     except Exception as e:
-        logging.error(f"Error saving reminders: {e}")
+        logging.error(f"Error saving timezone for {user_id}: {e}")
 
 
-def load_reminders():
-    global reminders, reminder_counter
-    
+def format_local(reminder: dict, fmt: str) -> str:
+    return reminder["time"].astimezone(get_user_timezone(reminder["user_id"])).strftime(fmt)
+
+
+def reminder_row(r: dict) -> tuple:
+    return (
+        r["id"], r["user_id"], r["chat_id"], r["text"],
+        r["time"].isoformat(), r["repeat"], r.get("kind", "reminder"), r.get("version", 0)
+    )
+
+
+UPSERT_REMINDER_SQL = f"""
+    INSERT INTO reminders ({", ".join(REMINDER_COLUMNS)})
+    VALUES ({", ".join("?" for _ in REMINDER_COLUMNS)})
+    ON CONFLICT (id) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in REMINDER_COLUMNS[1:])}
+"""
+
+
+async def update_reminder_time(reminder: dict) -> bool:
+    """
+    Сохраняет перенесённое время напоминания
+
+    Именно UPDATE, а не UPSERT: запись, удалённую другим процессом, нельзя
+    вернуть. Returns: False, если напоминания в базе уже нет.
+    """
+    reminder["version"] = reminder.get("version", 0) + 1
+    try:
+        updated = await db.update(
+            "UPDATE reminders SET time = ?, version = version + 1 WHERE id = ?",
+            (reminder["time"].isoformat(), reminder["id"])
+        )
+    except Exception as e:
+        logging.error(f"Error saving reminder {reminder['id']}: {e}")
+        return True
+    return updated > 0
+
+
+async def delete_saved_reminder(reminder_id: int) -> bool:
+    """Returns: False, если напоминание уже удалил другой процесс"""
+    try:
+        return await db.update("DELETE FROM reminders WHERE id = ?", (reminder_id,)) > 0
+    except Exception as e:
+        logging.error(f"Error deleting reminder {reminder_id}: {e}")
+        return True
+
+
+def migrate_reminders_json():
+    """Переносит напоминания из data/reminders.json в SQLite"""
     if not REMINDERS_FILE.exists():
         return
     
@@ -45,18 +143,53 @@ def load_reminders():
         with open(REMINDERS_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
         
+        rows = []
         for user_id_str, user_reminders in data.items():
-            user_id = int(user_id_str)
-            reminders[user_id] = []
-            
             for r in user_reminders:
-                r["time"] = datetime.fromisoformat(r["time"])
-                reminders[user_id].append(r)
-                
-                if r["id"] >= reminder_counter:
-                    reminder_counter = r["id"] + 1
+                r["user_id"] = int(user_id_str)
+                r["time"] = parse_stored_time(r["time"])
+                r.setdefault("repeat", None)
+                r.setdefault("kind", "reminder")
+                rows.append(reminder_row(r))
+        
+        db.executemany_sync(UPSERT_REMINDER_SQL, rows)
+        REMINDERS_FILE.rename(REMINDERS_FILE.with_suffix(".json.bak"))
+        logging.info(f"Migrated {len(rows)} reminders from {REMINDERS_FILE}")
+    except Exception as e:
+        logging.error(f"Error migrating reminders: {e}")
+
+
+def reminder_from_row(row: tuple) -> dict:
+    r = dict(zip(REMINDER_COLUMNS, row))
+    r["time"] = parse_stored_time(r["time"])
+    r["rule"] = rule_from_string(r["repeat"])
+    return r
+
+
+def load_user_timezones(rows: List[tuple]):
+    for user_id, tz_name in rows:
+        tz = parse_timezone(tz_name)
+        if tz:
+            user_timezones[user_id] = tz
+
+
+def load_reminders():
+    try:
+        init_reminders_table()
+        migrate_reminders_json()
+        
+        # Курсор берём до чтения: изменения, попавшие между ними, просто применятся повторно
+        cursor = db.change_cursor_sync()
+        sync_cursors.update(reminders=cursor, user_timezones=cursor)
+        rows = db.execute_sync(
+            f"SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders ORDER BY time"
+        )
+        load_user_timezones(db.execute_sync("SELECT user_id, timezone FROM user_timezones"))
+        
+        for row in rows:
+            index_reminder(reminder_from_row(row))
         
-        logging.info(f"Loaded {sum(len(r) for r in reminders.values())} reminders")
+        logging.info(f"Loaded {len(reminder_index)} reminders")
     except Exception as e:
         logging.error(f"Error loading reminders: {e}")
 
@@ -75,61 +208,49 @@ async def set_reminder(message: Message):
             "• /remind 2h Позвонить маме\n"
             "• /remind 1d Оплатить счета\n"
             "• /remind завтра 15:00 Встреча\n"
-            "• /remind каждый_день 09:00 Зарядка\n\n"
+            "• /remind каждый_день 09:00 Зарядка\n"
+            "• /remind по будням 09:30 Стендап\n"
+            "• /remind пн,ср,пт 19:00 Спортзал\n"
+            "• /remind every 2h Выпить воды\n"
+            "• /remind cron 0 9 1 * * Оплатить аренду\n\n"
             "Время:\n"
             "• 10m = 10 минут\n"
             "• 2h = 2 часа\n"
-            "• 1d = 1 день"
+            "• 1d = 1 день\n\n"
+            "Часовой пояс: /timezone"
         )
         return
     
-    time_str = parts[1].lower()
-    text = parts[2]
-    
-    remind_time, repeat_type = parse_time(time_str)
+    user_id = message.from_user.id
+    tz = get_user_timezone(user_id)
+    schedule = parse_schedule(message.text.split(maxsplit=1)[1], datetime.now(timezone.utc), tz)
     
-    if not remind_time:
+    if not schedule:
         await message.answer(
             "❌ Неверный формат времени.\n"
-            "Используйте: 10m, 2h, 1d, завтра"
+            "Используйте: 10m, 2h, 1d, завтра 15:00, каждый_день 09:00, "
+            "по будням 09:00, every 2h, cron 0 9 * * 1-5"
         )
         return
     
-    global reminder_counter
-    reminder_id = reminder_counter
-    reminder_counter += 1
-    
-    user_id = message.from_user.id
-    
-    reminder = {
-        "id": reminder_id,
-        "text": text,
-        "time": remind_time,
-        "repeat": repeat_type,
-        "chat_id": message.chat.id
-    }
-    
-    if user_id not in reminders:
-        reminders[user_id] = []
-    
-    reminders[user_id].append(reminder)
-    save_reminders()
+    try:
+        reminder = await create_reminder(
+            user_id, message.chat.id, schedule.text, schedule.first, schedule.rule
+        )
+    except Exception as e:
+        logging.error(f"Error saving reminder: {e}")
+        await message.answer("❌ Не удалось сохранить напоминание")
+        return
     
-    time_format = remind_time.strftime("%d.%m.%Y %H:%M")
+    time_format = format_local(reminder, "%d.%m.%Y %H:%M")
     response = f"✅ Напоминание установлено!\n\n"
-    response += f"📝 {text}\n"
-    response += f"⏰ {time_format}\n"
+    response += f"📝 {schedule.text}\n"
+    response += f"⏰ {time_format} ({timezone_name(tz)})\n"
     
-    if repeat_type:
-        repeat_names = {
-            "daily": "каждый день",
-            "weekly": "каждую неделю"
-        }
-        response += f"🔄 Повтор: {repeat_names.get(repeat_type, repeat_type)}"
+    if schedule.rule:
+        response += f"🔄 Повтор: {schedule.rule.describe()}"
     
     await message.answer(response)
-    
-    asyncio.create_task(send_reminder_task(message.bot, user_id, reminder_id))
 
 
 @router_reminders.message(Command("reminders"))
@@ -148,8 +269,9 @@ async def show_reminders(message: Message):
     response = "⏰ Ваши напоминания:\n\n"
     
     for r in sorted_reminders:
-        time_str = r["time"].strftime("%d.%m %H:%M")
-        response += f"• {time_str} - {r['text']}"
+        time_str = format_local(r, "%d.%m %H:%M")
+        icon = "⏱" if r["kind"] == "timer" else "•"
+        response += f"{icon} {time_str} - {r['text']}"
         
         if r["repeat"]:
             response += " 🔄"
@@ -173,7 +295,7 @@ async def delete_reminder_start(callback: CallbackQuery):
     
     buttons = []
     for r in reminders[user_id]:
-        time_str = r["time"].strftime("%d.%m %H:%M")
+        time_str = format_local(r, "%d.%m %H:%M")
         buttons.append([
             InlineKeyboardButton(
                 text=f"🗑 {time_str} - {r['text'][:30]}",
@@ -192,14 +314,13 @@ async def delete_reminder(callback: CallbackQuery):
     user_id = callback.from_user.id
     reminder_id = int(callback.data.split("_")[2])
     
-    if user_id in reminders:
-        for i, r in enumerate(reminders[user_id]):
-            if r["id"] == reminder_id:
-                removed = reminders[user_id].pop(i)
-                save_reminders()
-                await callback.answer(f"✅ Удалено")
-                await callback.message.edit_text("✅ Напоминание удалено")
-                return
+    reminder = reminder_index.get(reminder_id)
+    
+    if reminder and reminder["user_id"] == user_id:
+        await remove_reminder(reminder)
+        await callback.answer(f"✅ Удалено")
+        await callback.message.edit_text("✅ Напоминание удалено")
+        return
     
     await callback.answer("❌ Не найдено")
 
@@ -233,123 +354,211 @@ async def set_timer(message: Message):
         await message.answer("❌ Неверный формат. Используйте: 5m, 30m, 1h")
         return
     
-    await message.answer(f"⏱ Таймер на {time_str} установлен!")
-    
-    await asyncio.sleep(delta.total_seconds())
+    try:
+        await create_reminder(
+            message.from_user.id, message.chat.id, text,
+            datetime.now(timezone.utc) + delta, None, kind="timer"
+        )
+    except Exception as e:
+        logging.error(f"Error saving timer: {e}")
+        await message.answer("❌ Не удалось сохранить таймер")
+        return
     
-    await message.answer(f"⏰ {text}")
+    await message.answer(
+        f"⏱ Таймер на {time_str} установлен!\n"
+        f"Отменить можно в /reminders"
+    )
 
 
-def parse_time(time_str: str) -> tuple:
-    time_str = time_str.lower().replace("_", " ")
+@router_reminders.message(Command("timezone"))
+async def set_timezone(message: Message):
+    parts = message.text.split(maxsplit=1)
+    user_id = message.from_user.id
     
-    if "каждый день" in time_str or "daily" in time_str:
-        parts = time_str.split()
-        if len(parts) > 2:
-            time_part = parts[2]
-            try:
-                hour, minute = map(int, time_part.split(":"))
-                now = datetime.now()
-                remind_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                
-                if remind_time <= now:
-                    remind_time += timedelta(days=1)
-                
-                return (remind_time, "daily")
-            except:
-                pass
-        
-        return (datetime.now() + timedelta(days=1), "daily")
+    if len(parts) < 2:
+        await message.answer(
+            f"🌍 Ваш часовой пояс: {timezone_name(get_user_timezone(user_id))}\n\n"
+            "Изменить:\n"
+            "• /timezone Europe/Moscow\n"
+            "• /timezone Asia/Yekaterinburg\n"
+            "• /timezone +3"
+        )
+        return
     
-    if "каждую неделю" in time_str or "weekly" in time_str:
-        return (datetime.now() + timedelta(weeks=1), "weekly")
+    tz = parse_timezone(parts[1])
+    if not tz:
+        await message.answer("❌ Неизвестный часовой пояс. Пример: Europe/Moscow или +3")
+        return
     
-    delta = parse_relative_time(time_str)
-    if delta:
-        return (datetime.now() + delta, None)
-    
-    if "завтра" in time_str:
-        parts = time_str.split()
-        if len(parts) > 1:
-            time_part = parts[1]
-            try:
-                hour, minute = map(int, time_part.split(":"))
-                remind_time = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
-                remind_time += timedelta(days=1)
-                return (remind_time, None)
-            except:
-                pass
-        
-        return (datetime.now() + timedelta(days=1), None)
+    await save_user_timezone(user_id, tz)
+    
+    # Повторы «в 09:00» считаются в поясе пользователя — пересчитываем их
+    for r in list(reminders.get(user_id, [])):
+        if r["rule"] and not isinstance(r["rule"], IntervalRule):
+            r["time"] = r["rule"].next_after(datetime.now(timezone.utc), tz)
+            if await update_reminder_time(r):
+                scheduler.schedule(r["id"], r["time"])
+            else:
+                unindex_reminder(r)
     
-    return (None, None)
+    await message.answer(f"✅ Часовой пояс: {timezone_name(tz)}")
 
 
-def parse_relative_time(time_str: str) -> timedelta:
-    try:
-        if time_str.endswith('m'):
-            minutes = int(time_str[:-1])
-            return timedelta(minutes=minutes)
-        elif time_str.endswith('h'):
-            hours = int(time_str[:-1])
-            return timedelta(hours=hours)
-        elif time_str.endswith('d'):
-            days = int(time_str[:-1])
-            return timedelta(days=days)
-    except ValueError:
-        pass
-    
-    return None
-
-
-async def send_reminder_task(bot, user_id: int, reminder_id: int):
-    try:
-        while True:
-            if user_id not in reminders:
-                break
-            
-            reminder = None
-            for r in reminders[user_id]:
-                if r["id"] == reminder_id:
-                    reminder = r
-                    break
-            
-            if not reminder:
-                break
-            
-            now = datetime.now()
-            wait_seconds = (reminder["time"] - now).total_seconds()
-            
-            if wait_seconds > 0:
-                await asyncio.sleep(wait_seconds)
-            
-            await bot.send_message(
-                reminder["chat_id"],
-                f"⏰ Напоминание:\n{reminder['text']}"
-            )
-            
-            if reminder["repeat"]:
-                if reminder["repeat"] == "daily":
-                    reminder["time"] += timedelta(days=1)
-                elif reminder["repeat"] == "weekly":
-                    reminder["time"] += timedelta(weeks=1)
-                
-                save_reminders()
-            else:
-                reminders[user_id].remove(reminder)
-                save_reminders()
-                break
+async def create_reminder(
+    user_id: int,
+    chat_id: int,
+    text: str,
+    remind_time: datetime,
+    rule: Optional[Rule],
+    kind: str = "reminder"
+) -> dict:
+    reminder = {
+        "id": None,
+        "text": text,
+        "time": remind_time,
+        "repeat": rule.serialize() if rule else None,
+        "rule": rule,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "kind": kind,
+        "version": 0
+    }
     
-    except Exception as e:
-        logging.error(f"Reminder task error: {e}")
+    # id выдаёт база, чтобы несколько процессов бота не раздали одинаковые
+    reminder["id"] = await db.insert(
+        f"INSERT INTO reminders ({', '.join(REMINDER_COLUMNS[1:])}) "
+        f"VALUES ({', '.join('?' for _ in REMINDER_COLUMNS[1:])})",
+        reminder_row(reminder)[1:]
+    )
+    
+    return index_reminder(reminder)
 
 
-def restart_all_reminders(bot):
-    for user_id, user_reminders in reminders.items():
-        for reminder in user_reminders:
-            asyncio.create_task(
-                send_reminder_task(bot, user_id, reminder["id"])
-            )
+def index_reminder(reminder: dict) -> dict:
+    """Добавляет напоминание в память и планировщик (повторный вызов заменяет запись)"""
+    existing = reminder_index.get(reminder["id"])
+    user_reminders = reminders.setdefault(reminder["user_id"], [])
+    if existing in user_reminders:
+        user_reminders.remove(existing)
+    
+    user_reminders.append(reminder)
+    reminder_index[reminder["id"]] = reminder
+    scheduler.schedule(reminder["id"], reminder["time"])
+    return reminder
+
+
+def unindex_reminder(reminder: dict):
+    scheduler.cancel(reminder["id"])
+    reminder_index.pop(reminder["id"], None)
+    
+    user_reminders = reminders.get(reminder["user_id"], [])
+    if reminder in user_reminders:
+        user_reminders.remove(reminder)
+    if not user_reminders:
+        reminders.pop(reminder["user_id"], None)
+
+
+async def remove_reminder(reminder: dict):
+    # Сначала база: синхронизация в других процессах не должна вернуть запись обратно
+    await delete_saved_reminder(reminder["id"])
+    unindex_reminder(reminder)
+
+
+async def fire_reminder(reminder_id: int):
+    reminder = reminder_index.get(reminder_id)
+    if not reminder:
+        return
+    
+    rule = reminder["rule"]
+    now = datetime.now(timezone.utc)
+    missed = 0
+    
+    if rule:
+        # Пропуски за время простоя склеиваем в одно уведомление
+        next_time, missed = rule.advance(reminder["time"], now, get_user_timezone(reminder["user_id"]))
+    
+    if reminder["kind"] == "timer":
+        text = f"⏰ {reminder['text']}"
+    else:
+        text = f"⏰ Напоминание:\n{reminder['text']}"
+    
+    if missed:
+        text += f"\n\n⚠️ Пропущено повторов, пока бот был недоступен: {missed}"
+    
+    # Сначала база: напоминание, удалённое в другом процессе, не отправляем
+    if rule:
+        reminder["time"] = next_time
+        if not await update_reminder_time(reminder):
+            unindex_reminder(reminder)
+            return
+        scheduler.schedule(reminder_id, reminder["time"])
+    else:
+        deleted = await delete_saved_reminder(reminder_id)
+        unindex_reminder(reminder)
+        if not deleted:
+            return
+    
+    delivery_queue.send(reminder["chat_id"], text, priority=PRIORITY_HIGH)
+
+
+scheduler = Scheduler(
+    fire_reminder, "Reminder scheduler", max_concurrency=REMINDER_CONCURRENCY
+)
+SCHEDULED_JOBS.add("reminders", lambda: len(scheduler))
+
+
+def restart_all_reminders():
+    """Ведущий процесс: куча планировщика строится из индекса один раз при избрании"""
+    for reminder in reminder_index.values():
+        scheduler.schedule(reminder["id"], reminder["time"])
+    
+    scheduler.start()
+
+
+def stop_reminders():
+    scheduler.stop()
+
+
+async def sync_reminders():
+    """
+    Подтягивает напоминания и часовые пояса, изменённые другими процессами бота
+
+    Из базы читаются только строки, попавшие в журнал изменений. Запись
+    применяется, если она новая или её версия выше известной: так ведущий
+    процесс видит перенос времени (например, смену пояса в другом процессе),
+    но не откатывает собственный перенос после срабатывания.
+    """
+    cursor, changed = await db.changes("user_timezones", sync_cursors["user_timezones"])
+    if changed is None:
+        load_user_timezones(await db.execute("SELECT user_id, timezone FROM user_timezones"))
+    elif changed:
+        load_user_timezones(await db.select_in(
+            "SELECT user_id, timezone FROM user_timezones", "user_id", changed
+        ))
+    sync_cursors["user_timezones"] = cursor
+    
+    select_sql = f"SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders"
+    cursor, changed = await db.changes("reminders", sync_cursors["reminders"])
+    if changed is None:
+        rows = await db.execute(select_sql)
+        changed = set(reminder_index) | {row[0] for row in rows}
+    else:
+        rows = await db.select_in(select_sql, "id", changed) if changed else []
+    
+    seen = set()
+    for row in rows:
+        stored = reminder_from_row(row)
+        seen.add(stored["id"])
+        known = reminder_index.get(stored["id"])
+        if known is None or stored["version"] > known.get("version", 0):
+            index_reminder(stored)
+    
+    for reminder_id in changed - seen:
+        reminder = reminder_index.get(reminder_id)
+        if reminder:
+            unindex_reminder(reminder)
+    
+    sync_cursors["reminders"] = cursor
 
 
 def get_router_reminders():
@@ -5,26 +5,35 @@ from pathlib import Path
 from aiogram import Router, F
 from aiogram.types import Message, Document
 from aiogram.filters import Command
-from openai import OpenAI
-from config import OPENAI_KEY
-import PyPDF2
-import pdfplumber
+from utils.text_reader import read_text_file, truncate_text
+from utils.metrics import track_upstream
+from utils.tracing import span
+from utils.lazy import lazy_import
+from utils.llm import get_client
 import requests
-from bs4 import BeautifulSoup
 import io
+from urllib.parse import urlparse
+
+# Тяжёлые парсеры импортируются при первом документе или статье
+PyPDF2 = lazy_import("PyPDF2")
+pdfplumber = lazy_import("pdfplumber")
+bs4 = lazy_import("bs4")
 
 router_summary = Router()
 
 # OpenRouter для AI
-client = OpenAI(
-    api_key=OPENAI_KEY,
-    base_url="https://openrouter.ai/api/v1"
-)
+LLM_MODEL = "meta-llama/llama-3.3-70b-instruct:free"  # Бесплатная модель
 
 # Папка для временных файлов
 TEMP_DIR = Path("temp_docs")
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Сколько символов текста уходит в промпт
+MAX_TEXT_LENGTH = 15000
+
+# Лимит Telegram Bot API на скачивание файлов
+MAX_TEXT_FILE_SIZE = 20 * 1024 * 1024
+
 
 # ==================== КОМАНДЫ ====================
 
@@ -138,10 +147,12 @@ async def handle_pdf(message: Message, document: Document):
         file_path = file.file_path
         
         temp_file = TEMP_DIR / f"{document.file_id}.pdf"
-        await message.bot.download_file(file_path, temp_file)
+        with span("telegram.download", size=document.file_size):
+            await message.bot.download_file(file_path, temp_file)
         
         # Читаем PDF
-        text = extract_pdf_text(temp_file)
+        with span("pdf.extract"):
+            text = await asyncio.to_thread(extract_pdf_text, temp_file)
         
         # Удаляем временный файл
         os.remove(temp_file)
@@ -198,17 +209,25 @@ def extract_pdf_text(file_path: Path) -> str:
 
 async def handle_text_file(message: Message, document: Document):
     """Обработка текстового файла"""
+    if document.file_size and document.file_size > MAX_TEXT_FILE_SIZE:
+        await message.answer("❌ Файл слишком большой (максимум 20 MB)")
+        return
+    
+    temp_file = TEMP_DIR / f"{document.file_id}.txt"
+    
     try:
         file = await message.bot.get_file(document.file_id)
         file_path = file.file_path
         
-        temp_file = TEMP_DIR / f"{document.file_id}.txt"
-        await message.bot.download_file(file_path, temp_file)
+        with span("telegram.download", size=document.file_size):
+            await message.bot.download_file(file_path, temp_file)
         
-        with open(temp_file, 'r', encoding='utf-8') as f:
-            text = f.read()
+        # Читаем только то, что попадёт в промпт
+        text = await asyncio.to_thread(read_text_file, temp_file, MAX_TEXT_LENGTH)
         
-        os.remove(temp_file)
+        if text is None:
+            await message.answer("❌ Не удалось прочитать файл")
+            return
         
         if len(text) < 100:
             await message.answer("❌ Текст слишком короткий")
@@ -222,6 +241,9 @@ async def handle_text_file(message: Message, document: Document):
     except Exception as e:
         logging.error(f"Text file error: {e}")
         await message.answer("❌ Ошибка при чтении файла")
+    
+    finally:
+        temp_file.unlink(missing_ok=True)
 
 
 # ==================== ОБРАБОТКА URL ====================
@@ -232,30 +254,21 @@ async def summary_url(message: Message, url: str):
     
     try:
         # Скачиваем страницу
-        response = await asyncio.to_thread(
-            lambda: requests.get(url, timeout=10, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            })
-        )
+        with span("http", host=urlparse(url).hostname) as trace_span:
+            response = await asyncio.to_thread(
+                lambda: requests.get(url, timeout=10, headers={
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                })
+            )
+            trace_span.set(status=response.status_code, bytes=len(response.content))
         
         if response.status_code != 200:
             await message.answer("❌ Не удалось загрузить страницу")
             return
         
         # Парсим HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Удаляем скрипты и стили
-        for script in soup(["script", "style", "nav", "footer", "header"]):
-            script.decompose()
-        
-        # Извлекаем текст
-        text = soup.get_text()
-        
-        # Чистим текст
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
+        with span("html.parse"):
+            text = await asyncio.to_thread(extract_html_text, response.text)
         
         if len(text) < 200:
             await message.answer("❌ Не удалось извлечь содержимое статьи")
@@ -271,14 +284,30 @@ async def summary_url(message: Message, url: str):
         await message.answer("❌ Ошибка при обработке URL")
 
 
+def extract_html_text(html: str) -> str:
+    """Извлекает текст статьи из HTML"""
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    
+    # Удаляем скрипты и стили
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.decompose()
+    
+    # Извлекаем текст
+    text = soup.get_text()
+    
+    # Чистим текст
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
 # ==================== AI ФУНКЦИИ ====================
 
 async def summarize_text(text: str, max_length: int = 1000) -> str:
     """Создаёт краткое содержание текста"""
     
-    # Если текст очень длинный, режем на части
-    if len(text) > 15000:
-        text = text[:15000] + "..."
+    # TXT приходит уже обрезанным read_text_file — повторно отметку не добавляем
+    text = truncate_text(text, MAX_TEXT_LENGTH)
     
     prompt = f"""Создай краткое содержание следующего текста. 
 Конспект должен быть структурированным, понятным и содержать основные мысли.
@@ -290,19 +319,19 @@ async def summarize_text(text: str, max_length: int = 1000) -> str:
 Краткое содержание:"""
     
     try:
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="meta-llama/llama-3.3-70b-instruct:free",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=max_length,
-            extra_headers={
-                "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
-                "X-Title": "Summary Bot"
-            }
-        )
+        with track_upstream("llm", LLM_MODEL):
+            response = await asyncio.to_thread(lambda: get_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=max_length,
+                extra_headers={
+                    "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
+                    "X-Title": "Summary Bot"
+                }
+            ))
         
         return response.choices[0].message.content.strip()
     
@@ -314,8 +343,7 @@ async def summarize_text(text: str, max_length: int = 1000) -> str:
 async def extract_key_points(text: str) -> str:
     """Извлекает ключевые моменты из текста"""
     
-    if len(text) > 15000:
-        text = text[:15000] + "..."
+    text = truncate_text(text, MAX_TEXT_LENGTH)
     
     prompt = f"""Извлеки ключевые моменты из следующего текста.
 Представь их в виде списка (5-7 пунктов).
@@ -328,19 +356,19 @@ async def extract_key_points(text: str) -> str:
 Ключевые моменты:"""
     
     try:
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="meta-llama/llama-3.3-70b-instruct:free",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=800,
-            extra_headers={
-                "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
-                "X-Title": "Summary Bot"
-            }
-        )
+        with track_upstream("llm", LLM_MODEL):
+            response = await asyncio.to_thread(lambda: get_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=800,
+                extra_headers={
+                    "HTTP-Referer": "https://github.com/deadogdas/tg_bot",
+                    "X-Title": "Summary Bot"
+                }
+            ))
         
         return response.choices[0].message.content.strip()
     
@@ -1,16 +1,21 @@
 import logging
-import os
-import asyncio
 from pathlib import Path
 from aiogram import Router, F
 from aiogram.types import Message, Voice
-from openai import OpenAI
-from config import OPENAI_KEY
+from config import (
+    OPENAI_KEY,
+    VOICE_MAX_CONCURRENCY,
+    VOICE_CACHE_SIZE,
+    VOICE_SEGMENT_THRESHOLD,
+    VOICE_SEGMENT_LENGTH
+)
+from utils.metrics import CACHE_ENTRIES
+from utils.tracing import span
+from utils.transcriber import Transcriber, TranscriptionBackend, WhisperBackend, PARTIAL_MARK
 
 router_voice = Router()
 
 if OPENAI_KEY:
-    client = OpenAI(api_key=OPENAI_KEY)
     VOICE_ENABLED = True
 else:
     VOICE_ENABLED = False
@@ -19,6 +24,27 @@ else:
 TEMP_DIR = Path("temp_audio")
 TEMP_DIR.mkdir(exist_ok=True)
 
+transcriber = None
+CACHE_ENTRIES.add("transcripts", lambda: len(transcriber.cache) if transcriber else 0)
+
+
+def set_transcription_backend(backend: TranscriptionBackend):
+    """Подменяет бэкенд распознавания (например, на StubBackend в тестах)"""
+    global transcriber, VOICE_ENABLED
+    transcriber = Transcriber(
+        backend,
+        max_concurrency=VOICE_MAX_CONCURRENCY,
+        cache_size=VOICE_CACHE_SIZE,
+        segment_threshold=VOICE_SEGMENT_THRESHOLD,
+        segment_length=VOICE_SEGMENT_LENGTH
+    )
+    VOICE_ENABLED = True
+
+
+if VOICE_ENABLED:
+    # Клиент OpenAI создаётся при первом распознавании
+    set_transcription_backend(WhisperBackend())
+
 
 @router_voice.message(F.voice)
 async def handle_voice(message: Message):
@@ -28,50 +54,34 @@ async def handle_voice(message: Message):
             "Добавьте OPENAI_KEY в .env файл."
         )
         return
-    
+
     voice: Voice = message.voice
     await message.bot.send_chat_action(message.chat.id, "typing")
-    
+
+    async def download() -> Path:
+        file = await message.bot.get_file(voice.file_id)
+        temp_file = TEMP_DIR / f"{voice.file_unique_id}.ogg"
+        with span("telegram.download", size=voice.file_size):
+            await message.bot.download_file(file.file_path, temp_file)
+        return temp_file
+
     try:
-        file_id = voice.file_id
-        file = await message.bot.get_file(file_id)
-        file_path = file.file_path
-        
-        temp_file = TEMP_DIR / f"{file_id}.ogg"
-        await message.bot.download_file(file_path, temp_file)
-        
-        transcription = await transcribe_audio(temp_file)
-        
-        os.remove(temp_file)
-        
+        transcription = await transcriber.transcribe(
+            voice.file_unique_id,
+            download,
+            duration=voice.duration or 0
+        )
+
         if transcription:
-            await message.answer(f"🎤 Распознанный текст:\n\n{transcription}")
+            note = "\n\n⚠️ Часть записи распознать не удалось" if PARTIAL_MARK in transcription else ""
+            await message.answer(f"🎤 Распознанный текст:\n\n{transcription}{note}")
         else:
             await message.answer("❌ Не удалось распознать речь")
-    
+
     except Exception as e:
         logging.error(f"Voice transcription error: {e}")
         await message.answer("❌ Ошибка при обработке голосового сообщения")
 
 
-async def transcribe_audio(audio_file: Path) -> str:
-    try:
-        def _transcribe():
-            with open(audio_file, "rb") as audio:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio,
-                    language="ru"
-                )
-                return transcript.text
-        
-        text = await asyncio.to_thread(_transcribe)
-        return text
-    
-    except Exception as e:
-        logging.error(f"Whisper API error: {e}")
-        return None
-
-
 def get_router_voice():
-    return router_voice
\ No newline at end of file
+    return router_voice
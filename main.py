@@ -1,29 +1,145 @@
+import time
+
+# Замер холодного старта: сколько занимают импорты модулей бота
+IMPORT_START = time.perf_counter()
+
 import asyncio
 import logging
+from typing import Set
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    BOT_TOKEN, TEMP_FILE_MAX_AGE, JANITOR_INTERVAL,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    STATE_BACKEND, STATE_SYNC_INTERVAL, LEADER_LEASE_TTL, METRICS_HOST, METRICS_PORT,
+    TRACE_SAMPLE_RATE, WARMUP_DELAY
+)
 from utils.logger import setup_logger
+from utils.disk_cache import run_janitor
+from utils.delivery import delivery_queue
+from utils.database import db
+from utils.leader import LeaderElection
+from utils.state_store import state_store, StoreFSMStorage
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.metrics import MetricsMiddleware
+from middlewares.profiling import ProfilingMiddleware
+from middlewares.tracing import TracingMiddleware, TracingRequestMiddleware
+from utils.metrics import start_metrics_server
+from utils.tracing import run_trace_exporter
+from utils.lazy import warm_up, format_rss
+from utils.llm import get_client, OPENAI_BASE_URL
 
 from handlers.general import get_router_general
+from handlers.admin import get_router_admin
 from handlers.ai import get_ai_router
 from handlers.movies import get_router_movies
 from handlers.currency import get_router_currency
-from handlers.voice import get_router_voice
-from handlers.price_tracker import get_router_price
-from handlers.reminders import get_router_reminders, restart_all_reminders
+from handlers.voice import get_router_voice, TEMP_DIR as VOICE_TEMP_DIR
+from handlers.price_tracker import (
+    get_router_price, start_price_polling, stop_price_polling, sync_tracked_items
+)
+from handlers.reminders import (
+    get_router_reminders, restart_all_reminders, stop_reminders, sync_reminders
+)
 from weather.weather import get_router_weather
-from handlers.summary import get_router_summary
+from handlers.summary import get_router_summary, TEMP_DIR as SUMMARY_TEMP_DIR
 from handlers.music import get_router_music
 
+IMPORT_TIME = time.perf_counter() - IMPORT_START
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Приём обновлений через aiohttp-сервер вместо long polling"""
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    
+    app = web.Application()
+    # Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются;
+    # обработка идёт в фоне, Telegram сразу получает 200
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logging.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+# Ссылки на фоновые задачи: цикл событий хранит только слабые
+background_tasks: Set[asyncio.Task] = set()
+
+
+def start_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def start_schedulers():
+    # Перезапускаем все активные напоминания
+    restart_all_reminders()
+    
+    # Восстанавливаем мониторинг цен после перезапуска
+    start_price_polling()
+
+
+def stop_schedulers():
+    stop_reminders()
+    stop_price_polling()
+
+
+async def run_state_sync(leader: LeaderElection):
+    """Подтягивает напоминания и товары, изменённые другими процессами бота"""
+    while True:
+        await asyncio.sleep(STATE_SYNC_INTERVAL)
+        try:
+            await sync_reminders()
+            await sync_tracked_items(authoritative=leader.is_leader)
+            if leader.is_leader:
+                await db.prune_changes()
+        except Exception as e:
+            logging.error(f"State sync error: {e}")
+
 
 async def main():
     setup_logger()
+    logging.info(f"Imports took {IMPORT_TIME:.2f}s, RSS {format_rss()}")
     
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    dp = Dispatcher(storage=StoreFSMStorage(state_store))
+    
+    # Без выборки middleware не регистрируются: выключенная трассировка ничего не стоит
+    if TRACE_SAMPLE_RATE:
+        dp.update.outer_middleware(TracingMiddleware())
+        bot.session.middleware(TracingRequestMiddleware())
+        start_background(run_trace_exporter())
+    
+    # Флуд отсекается до роутинга: хендлеры и внешние API его не видят
+    dp.update.outer_middleware(ThrottlingMiddleware())
+    # Внутренние middleware диспетчера действуют и на хендлеры вложенных роутеров
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.message.middleware(ProfilingMiddleware())
+    dp.callback_query.middleware(ProfilingMiddleware())
     
     # Регистрация роутеров
     dp.include_router(get_router_general())
+    dp.include_router(get_router_admin())
     dp.include_router(get_router_movies())
     dp.include_router(get_router_currency())
     dp.include_router(get_router_weather())
@@ -34,11 +150,39 @@ async def main():
     dp.include_router(get_router_music())
     dp.include_router(get_ai_router())
     
-    # Перезапускаем все активные напоминания
-    restart_all_reminders(bot)
+    # Все уведомления уходят через общую очередь с лимитами Telegram
+    delivery_queue.start(bot)
+    
+    # Напоминания и опрос цен работают только в одном процессе — ведущем
+    leader = LeaderElection(
+        state_store, "schedulers", ttl=LEADER_LEASE_TTL,
+        on_elected=start_schedulers, on_demoted=stop_schedulers
+    )
+    leader.start()
+    
+    if STATE_BACKEND != "memory":
+        start_background(run_state_sync(leader))
+    
+    # Чистим временные файлы, оставшиеся после ошибок
+    start_background(
+        run_janitor([VOICE_TEMP_DIR, SUMMARY_TEMP_DIR], TEMP_FILE_MAX_AGE, JANITOR_INTERVAL)
+    )
+    
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    
+    # openai, yt_dlp и парсеры документов подгружаются, когда бот уже принимает обновления
+    if WARMUP_DELAY >= 0:
+        start_background(warm_up(WARMUP_DELAY, get_client, lambda: get_client(OPENAI_BASE_URL)))
     
     logging.info("Bot started successfully")
-    await dp.start_polling(bot)
+    
+    if WEBHOOK_URL:
+        await run_webhook(dp, bot)
+    else:
+        # Иначе getUpdates вернёт конфликт, если раньше был установлен webhook
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from utils.metrics import Counter, Histogram
+from utils.tracing import span
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds",
+    "Handler execution time",
+    ("router", "handler")
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Exceptions raised by handlers",
+    ("router", "handler", "error")
+)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: вызывается уже для выбранного хендлера,
+    поэтому видит его в data["handler"]. Роутер — модуль, где объявлен хендлер.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        router = callback.__module__.rsplit(".", 1)[-1]
+        name = callback.__name__
+
+        start = time.perf_counter()
+        try:
+            with span(f"handler {router}.{name}"):
+                return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(router, name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, router, name)
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from middlewares.throttling import event_kind
+from utils.profiling import (
+    slow_sampler, profile_users, profile_commands, should_profile, save_report, UpdateProfiler
+)
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: медленные хендлеры сохраняются с сэмплами стека,
+    хендлеры отмеченных пользователей и команд — с полным cProfile.
+    Отчёты вместе с контекстом обновления пишутся в PROFILE_DIR.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not slow_sampler.threshold and not profile_users and not profile_commands:
+            return await handler(event, data)
+
+        update = data["event_update"]
+        user = data.get("event_from_user")
+        callback = data["handler"].callback
+        context = {
+            "update_id": update.update_id,
+            "handler": f"{callback.__module__}.{callback.__name__}",
+            "user_id": user.id if user else None,
+            "kind": event_kind(update),
+        }
+
+        if should_profile(context["user_id"], context["kind"]):
+            async with UpdateProfiler(context):
+                return await handler(event, data)
+
+        if not slow_sampler.threshold:
+            return await handler(event, data)
+
+        entry = slow_sampler.watch(context)
+        try:
+            return await handler(event, data)
+        finally:
+            report = slow_sampler.finish(entry)
+            if report:
+                path = await asyncio.to_thread(save_report, "slow", report)
+                logging.warning(
+                    f"Slow update {context['update_id']} in {context['handler']} "
+                    f"took {context['duration']}, stack samples: {path}"
+                )
@@ -0,0 +1,139 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from config import THROTTLE_RATE, THROTTLE_BURST
+from utils.delivery import TokenBucket
+from utils.metrics import Counter
+
+# Сколько токенов общего бакета пользователя списывает событие
+COMMAND_COSTS = {
+    "music": 5,
+    "summary": 3,
+    "keypoints": 3,
+    "voice": 3,
+    "document": 3,
+    "track": 2,
+    "usd": 0.5,
+    "eur": 0.5,
+    "cny": 0.5,
+}
+DEFAULT_COST = 1
+
+# Отдельные бакеты на дорогие команды: (запусков в минуту, запас)
+COMMAND_LIMITS = {
+    "music": (2, 3),
+    "summary": (3, 3),
+    "keypoints": (3, 3),
+    "voice": (4, 4),
+    "document": (3, 3),
+}
+
+MAX_TRACKED_USERS = 10000
+
+THROTTLED_UPDATES = Counter("bot_throttled_updates_total", "Updates dropped by flood control", ("kind",))
+
+
+def event_kind(update: Update) -> Optional[str]:
+    """Команда без / и @bot, либо тип сообщения; None — событие не ограничиваем"""
+    message = update.message
+    if message:
+        text = message.text or message.caption or ""
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0][1:].split("@")[0].lower()
+        if message.voice:
+            return "voice"
+        if message.document:
+            return "document"
+        return "text"
+    if update.callback_query:
+        return "callback"
+    return None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на Update: отбрасывает события пользователя,
+    исчерпавшего свои токены, ещё до роутинга и хендлеров
+
+    Об ограничении пользователь узнаёт один раз за окно ожидания,
+    остальные отброшенные события проходят молча.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.user_buckets: Dict[int, TokenBucket] = {}
+        self.command_buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self.notified_until: Dict[int, float] = {}
+
+    def _prune(self, now: float):
+        self.user_buckets = {u: b for u, b in self.user_buckets.items() if not b.is_full(now)}
+        self.command_buckets = {k: b for k, b in self.command_buckets.items() if not b.is_full(now)}
+        self.notified_until = {u: t for u, t in self.notified_until.items() if t > now}
+
+    def check(self, user_id: int, kind: str, now: float) -> float:
+        """0 — событие пропускаем (токены списаны), иначе сколько секунд ждать"""
+        if len(self.user_buckets) > MAX_TRACKED_USERS:
+            self._prune(now)
+
+        user_bucket = self.user_buckets.get(user_id)
+        if user_bucket is None:
+            user_bucket = self.user_buckets[user_id] = TokenBucket(self.rate, self.burst)
+        cost = min(COMMAND_COSTS.get(kind, DEFAULT_COST), self.burst)
+
+        command_bucket = None
+        if kind in COMMAND_LIMITS:
+            command_bucket = self.command_buckets.get((user_id, kind))
+            if command_bucket is None:
+                per_minute, burst = COMMAND_LIMITS[kind]
+                command_bucket = TokenBucket(per_minute / 60, burst)
+                self.command_buckets[(user_id, kind)] = command_bucket
+
+        wait = user_bucket.wait_time(now, cost)
+        if command_bucket:
+            wait = max(wait, command_bucket.wait_time(now))
+        if wait:
+            return wait
+
+        user_bucket.take(now, cost)
+        if command_bucket:
+            command_bucket.take(now)
+        return 0.0
+
+    async def notify(self, update: Update, user_id: int, wait: float, now: float):
+        if self.notified_until.get(user_id, 0) > now:
+            return
+        self.notified_until[user_id] = now + wait
+
+        text = f"⏳ Слишком много запросов. Попробуйте через {wait:.0f} с"
+        try:
+            if update.message:
+                await update.message.answer(text)
+            elif update.callback_query:
+                await update.callback_query.answer(text)
+        except Exception as e:
+            logging.error(f"Throttle notice for {user_id} failed: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        kind = event_kind(event)
+        if user is None or kind is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        wait = self.check(user.id, kind, now)
+        if wait:
+            logging.info(f"Throttled {kind} from user {user.id} for {wait:.1f}s")
+            # Неизвестные команды схлопываем, чтобы не плодить серии метрики
+            THROTTLED_UPDATES.inc(kind if kind in COMMAND_COSTS or kind in ("text", "callback") else "other")
+            await self.notify(event, user.id, max(wait, 1), now)
+            return None
+
+        return await handler(event, data)
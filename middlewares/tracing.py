@@ -0,0 +1,44 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from config import TRACE_SAMPLE_RATE
+from middlewares.throttling import event_kind
+from utils.tracing import start_trace, span
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Внешний middleware на Update: одна трасса на обновление, с выборкой"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        with start_trace(
+            "update",
+            self.sample_rate,
+            update_id=event.update_id,
+            kind=event_kind(event) or event.event_type,
+            user_id=user.id if user else None
+        ):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: span на каждый вызов Bot API (sendMessage, getFile...)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramMethod],
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Any:
+        with span(f"telegram.{method.__api_method__}"):
+            return await make_request(bot, method)
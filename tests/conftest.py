@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# Тесты запускаются из корня репозитория: python -m pytest
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.py требует ключи при импорте; в тестах сеть не используется
+for key in ("BOT_TOKEN", "OPENAI_KEY", "WEATHER_KEY"):
+    os.environ.setdefault(key, "test")
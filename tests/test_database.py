@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from utils.database import Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(tmp_path / "test.db")
+    database.executescript_sync("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    database.track_changes_sync("items")
+    yield database
+    database.close()
+
+
+def test_update_returns_rowcount(database):
+    async def scenario():
+        await database.insert("INSERT INTO items (id, name) VALUES (1, 'a')")
+        updated = await database.update("UPDATE items SET name = 'b' WHERE id = ?", (1,))
+        missing = await database.update("UPDATE items SET name = 'b' WHERE id = ?", (2,))
+        return updated, missing
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_changes_since_cursor(database):
+    async def scenario():
+        cursor = database.change_cursor_sync()
+        await database.insert("INSERT INTO items (id, name) VALUES (1, 'a')")
+        await database.insert("INSERT INTO items (id, name) VALUES (2, 'b')")
+        cursor, changed = await database.changes("items", cursor)
+        first = changed
+
+        await database.execute("UPDATE items SET name = 'c' WHERE id = 2")
+        await database.execute("DELETE FROM items WHERE id = 1")
+        cursor, changed = await database.changes("items", cursor)
+        unchanged = await database.changes("items", cursor)
+        return first, changed, unchanged, cursor
+
+    first, changed, unchanged, cursor = asyncio.run(scenario())
+    assert first == {1, 2}
+    assert changed == {1, 2}
+    assert unchanged == (cursor, set())
+
+
+def test_pruned_log_requires_full_resync(database):
+    async def scenario():
+        await database.insert("INSERT INTO items (id, name) VALUES (1, 'a')")
+        await database.insert("INSERT INTO items (id, name) VALUES (2, 'b')")
+        await database.prune_changes(retention=-10)
+        return await database.changes("items", 0), await database.changes("items", 2)
+
+    stale, current = asyncio.run(scenario())
+    assert stale == (2, None)
+    assert current == (2, set())
+
+
+def test_untracked_table_does_not_log(tmp_path):
+    database = Database(tmp_path / "test.db")
+    database.executescript_sync("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    database.track_changes_sync("items")
+    database.track_changes_sync("items", enabled=False)
+    database.execute_sync("INSERT INTO items (id, name) VALUES (1, 'a')")
+    assert database.change_cursor_sync() == 0
+    database.close()
+
+
+def test_select_in_chunks(database):
+    database.executemany_sync(
+        "INSERT INTO items (id, name) VALUES (?, ?)", [(i, str(i)) for i in range(1200)]
+    )
+    rows = asyncio.run(database.select_in("SELECT id FROM items", "id", range(0, 1200, 2)))
+    assert sorted(row[0] for row in rows) == list(range(0, 1200, 2))
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from utils.delivery import DeliveryQueue, TokenBucket, PRIORITY_HIGH
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=4)
+    start = bucket.updated
+    assert bucket.wait_time(start) == 0
+    bucket.take(start, cost=4)
+    assert bucket.wait_time(start) == pytest.approx(0.5)
+    assert bucket.wait_time(start + 0.5) == 0
+    assert not bucket.is_full(start + 1)
+    # Не копит больше capacity
+    assert bucket.is_full(start + 100)
+    assert bucket.tokens == 4
+
+
+def test_token_bucket_cost():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.take(bucket.updated)
+    assert bucket.wait_time(bucket.updated, cost=3) == pytest.approx(3)
+
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.sent = []
+        # text -> сколько раз подряд отправка падает с сетевой ошибкой
+        self.failures = dict(failures or {})
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.001)
+        if self.failures.get(text):
+            self.failures[text] -= 1
+            raise OSError("network")
+        self.sent.append((chat_id, text))
+
+
+def deliver(bot, messages, timeout: float = 3):
+    async def scenario():
+        queue = DeliveryQueue(global_rate=1000, chat_rate=1000, chat_burst=100)
+        queue.start(bot)
+        for chat_id, text, priority in messages:
+            queue.send(chat_id, text, priority=priority)
+        for _ in range(int(timeout / 0.01)):
+            if not queue.depth and not queue.sending:
+                break
+            await asyncio.sleep(0.01)
+        queue.task.cancel()
+        return queue
+
+    return asyncio.run(scenario())
+
+
+def test_priority_order():
+    bot = FakeBot()
+    deliver(bot, [(1, "normal", 5), (2, "urgent", PRIORITY_HIGH), (3, "low", 9)])
+    assert [text for _, text in bot.sent] == ["urgent", "normal", "low"]
+
+
+def test_retry_keeps_order_within_chat():
+    bot = FakeBot(failures={"first": 1})
+    queue = deliver(bot, [(1, "first", 5), (1, "second", 5), (2, "other", 5), (1, "third", 5)])
+    assert [text for chat_id, text in bot.sent if chat_id == 1] == ["first", "second", "third"]
+    # Другие чаты не ждут повтора
+    assert bot.sent.index((2, "other")) < bot.sent.index((1, "first"))
+    assert queue.stats()["retried"] == 1
+    assert not queue.chat_owners and not queue.held
+
+
+def test_dropped_message_releases_chat():
+    bot = FakeBot(failures={"doomed": 10})
+
+    async def scenario():
+        queue = DeliveryQueue(global_rate=1000, chat_rate=1000, chat_burst=100, max_attempts=1)
+        queue.start(bot)
+        queue.send(1, "doomed")
+        queue.send(1, "next")
+        await asyncio.sleep(0.1)
+        queue.task.cancel()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert bot.sent == [(1, "next")]
+    assert queue.stats()["failed"] == 1
@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+from utils.ozon import parse_ozon_page, parse_price, parse_widget_states
+
+FIXTURE = Path(__file__).parent / "fixtures" / "ozon_composer.json"
+
+
+def test_fixture_page():
+    result = parse_ozon_page(FIXTURE.read_bytes())
+    assert result == {
+        "name": "Наушники беспроводные TWS Pro с шумоподавлением",
+        "price": 2490.0,
+        # webOutOfStock лежит после цены и названия
+        "available": False,
+    }
+
+
+def test_out_of_stock_after_price_and_heading():
+    widgets = {
+        "webPrice-1-default-1": json.dumps({"price": "1 299 ₽"}),
+        "webProductHeading-2-default-1": json.dumps({"title": "Чайник"}),
+        "webGallery-3-default-1": "{}",
+        "webOutOfStock-4-default-1": "{}",
+    }
+    assert parse_widget_states(widgets)["available"] is False
+
+
+def test_available_with_decoded_widgets():
+    widgets = {
+        "webAPrice-1-default-1": {"cardPrice": "999,50 ₽", "name": "Кружка"},
+        "header-2-default-1": "не json — не декодируется",
+    }
+    assert parse_widget_states(widgets) == {"name": "Кружка", "price": 999.5, "available": True}
+
+
+def test_no_price_widget():
+    assert parse_widget_states({"webProductHeading-1-default-1": json.dumps({"title": "Чайник"})}) is None
+
+
+def test_parse_price():
+    assert parse_price("1 299,50 ₽") == 1299.5
+    assert parse_price(450) == 450.0
+    assert parse_price("нет") == 0
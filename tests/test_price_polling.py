@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from handlers import price_tracker
+from utils import wildberries
+
+
+def test_due_wb_items_share_one_card_request(monkeypatch):
+    articles = [str(100000000 + i) for i in range(50)]
+    requested = []
+
+    async def fetch_json(url, timeout=10):
+        requested.append(url)
+        await asyncio.sleep(0.01)
+        return {"data": {"products": [
+            {"id": int(article), "name": f"Товар {article}", "salePriceU": 99900} for article in articles
+        ]}}
+
+    async def apply_price(product, new_price, skip_user=None):
+        product["price"] = new_price
+
+    monkeypatch.setattr(wildberries, "fetch_json", fetch_json)
+    monkeypatch.setattr(price_tracker, "apply_price", apply_price)
+    monkeypatch.setattr(price_tracker, "products", {})
+
+    async def scenario():
+        scheduler = price_tracker.poll_scheduler
+        for article in articles:
+            price_tracker.products[("wildberries", article)] = {
+                "shop": "wildberries",
+                "product_id": article,
+                "url": f"https://www.wildberries.ru/catalog/{article}/detail.aspx",
+                "price": 1000.0,
+                "last_check": None,
+                "subscribers": {1},
+                "level": 0,
+                "rate": 0.0,
+            }
+            scheduler.schedule(("wildberries", article), datetime.now() - timedelta(seconds=1))
+
+        scheduler.start()
+        try:
+            for _ in range(100):
+                if all(p["price"] == 999.0 for p in price_tracker.products.values()):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            scheduler.stop()
+            for key in list(price_tracker.products):
+                scheduler.cancel(key)
+
+    asyncio.run(scenario())
+    assert all(p["price"] == 999.0 for p in price_tracker.products.values())
+    assert len(requested) == 1
+    assert all(article in requested[0] for article in articles)
+
+
+def test_cancelled_batch_releases_waiters(monkeypatch):
+    async def fetch_json(url, timeout=10):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(wildberries, "fetch_json", fetch_json)
+
+    async def scenario():
+        client = wildberries.WildberriesClient(batch_window=0.01)
+        waiters = [asyncio.create_task(client.get_card(str(article))) for article in (1, 2)]
+        await asyncio.sleep(0.05)
+        assert len(client.tasks) == 1
+        for task in list(client.tasks):
+            task.cancel()
+        done, pending = await asyncio.wait(waiters, timeout=1)
+        return done, pending, client
+
+    done, pending, client = asyncio.run(scenario())
+    assert not pending
+    assert all(task.cancelled() for task in done)
+    assert not client.tasks
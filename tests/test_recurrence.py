@@ -0,0 +1,128 @@
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+from utils.recurrence import (
+    CronRule,
+    IntervalRule,
+    WeekdayRule,
+    parse_relative_time,
+    parse_schedule,
+    parse_timezone,
+    rule_from_string,
+    timezone_name,
+)
+
+MSK = timezone(timedelta(hours=3))
+# Понедельник, 15:00 по Москве
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_interval_advance_counts_missed_without_iterating():
+    rule = IntervalRule(timedelta(hours=1))
+    last = NOW - timedelta(hours=5, minutes=30)
+    next_time, missed = rule.advance(last, NOW, MSK)
+    assert next_time == NOW + timedelta(minutes=30)
+    assert missed == 5
+
+
+def test_interval_advance_not_due():
+    rule = IntervalRule(timedelta(hours=1))
+    assert rule.advance(NOW, NOW + timedelta(minutes=10), MSK) == (NOW + timedelta(hours=1), 0)
+
+
+def test_weekday_rule_uses_user_timezone():
+    rule = WeekdayRule([0, 2, 4], time(9, 0))
+    # Понедельник 09:00 МСК уже прошёл — следующая среда
+    assert rule.next_after(NOW, MSK) == utc(2026, 10, 21, 6, 0)
+    # В UTC-10 понедельник ещё утро (02:00) — срабатывание сегодня
+    assert rule.next_after(NOW, timezone(timedelta(hours=-10))) == utc(2026, 10, 19, 19, 0)
+
+
+def test_weekday_rule_advance_collapses_missed_runs():
+    rule = WeekdayRule(list(range(7)), time(9, 0))
+    last = utc(2026, 10, 15, 6, 0)
+    next_time, missed = rule.advance(last, NOW, MSK)
+    assert next_time == utc(2026, 10, 20, 6, 0)
+    assert missed == 4
+
+
+def test_cron_weekdays_and_steps():
+    rule = CronRule("*/15 9-10 * * 1-5")
+    assert rule.next_after(NOW, MSK) == utc(2026, 10, 20, 6, 0)
+    assert rule.next_after(utc(2026, 10, 20, 6, 0), MSK) == utc(2026, 10, 20, 6, 15)
+    # Пятница 10:45 → понедельник 09:00
+    assert rule.next_after(utc(2026, 10, 23, 7, 45), MSK) == utc(2026, 10, 26, 6, 0)
+
+
+def test_cron_day_or_weekday_like_cron():
+    # 13-е число или пятница
+    rule = CronRule("0 12 13 * 5")
+    assert rule.next_after(NOW, timezone.utc) == utc(2026, 10, 23, 12, 0)
+    assert rule.next_after(utc(2026, 11, 7, 0, 0), timezone.utc) == utc(2026, 11, 13, 12, 0)
+
+
+def test_cron_leap_day():
+    rule = CronRule("0 0 29 2 *")
+    assert rule.next_after(NOW, timezone.utc) == utc(2028, 2, 29, 0, 0)
+
+
+@pytest.mark.parametrize("expression", ["* * *", "60 * * * *", "0 0 31 2 *", "0 0 0 * *"])
+def test_cron_invalid(expression):
+    with pytest.raises(ValueError):
+        CronRule(expression).next_after(NOW, timezone.utc)
+
+
+@pytest.mark.parametrize("value", [
+    "daily", "weekly", "every:7200", "at:09:00", "days:0,1,2,3,4:09:30", "cron:0 9 1 * *"
+])
+def test_serialize_round_trip(value):
+    assert rule_from_string(value).serialize() == value
+
+
+def test_rule_from_string_empty_and_unknown():
+    assert rule_from_string(None) is None
+    with pytest.raises(ValueError):
+        rule_from_string("yearly")
+
+
+@pytest.mark.parametrize("value, name", [
+    ("+3", "+03:00"), ("UTC+05:30", "+05:30"), ("gmt-4", "-04:00"),
+])
+def test_offset_timezones(value, name):
+    assert timezone_name(parse_timezone(value)) == name
+
+
+def test_unknown_timezone():
+    assert parse_timezone("Mars/Olympus") is None
+    assert parse_timezone("+15") is None
+
+
+def test_parse_relative_time():
+    assert parse_relative_time("10m") == timedelta(minutes=10)
+    assert parse_relative_time("2h") == timedelta(hours=2)
+    assert parse_relative_time("когда-нибудь") is None
+
+
+@pytest.mark.parametrize("text, first, rule", [
+    ("10m Проверить", utc(2026, 10, 19, 12, 10), None),
+    ("завтра 15:00 Встреча", utc(2026, 10, 20, 12, 0), None),
+    ("каждый_день 09:00 Зарядка", utc(2026, 10, 20, 6, 0), "at:09:00"),
+    ("по будням 09:30 Стендап", utc(2026, 10, 20, 6, 30), "days:0,1,2,3,4:09:30"),
+    ("пн,ср,пт 19:00 Спорт", utc(2026, 10, 19, 16, 0), "days:0,2,4:19:00"),
+    ("every 2h Вода", utc(2026, 10, 19, 14, 0), "every:7200"),
+    ("cron 0 9 1 * * Аренда", utc(2026, 11, 1, 6, 0), "cron:0 9 1 * *"),
+])
+def test_parse_schedule(text, first, rule):
+    schedule = parse_schedule(text, NOW, MSK)
+    assert schedule.first == first
+    assert (schedule.rule.serialize() if schedule.rule else None) == rule
+    assert schedule.text == text.rsplit(" ", 1)[1]
+
+
+def test_parse_schedule_rejects_garbage():
+    assert parse_schedule("ерунда", NOW, MSK) is None
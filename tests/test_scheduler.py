@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from utils.scheduler import Scheduler
+
+
+def at(seconds: float) -> datetime:
+    return datetime.now() + timedelta(seconds=seconds)
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_jobs_fire_in_time_order():
+    async def scenario():
+        fired = []
+
+        async def callback(job_id):
+            fired.append(job_id)
+
+        scheduler = Scheduler(callback, max_concurrency=16)
+        scheduler.start()
+        scheduler.schedule("late", at(0.06))
+        scheduler.schedule("early", at(0.02))
+        scheduler.schedule("past", at(-1))
+        await asyncio.sleep(0.15)
+        scheduler.stop()
+        return fired, scheduler
+
+    fired, scheduler = run(scenario)
+    assert fired == ["past", "early", "late"]
+    assert len(scheduler) == 0
+
+
+def test_cancel_and_reschedule():
+    async def scenario():
+        fired = []
+
+        async def callback(job_id):
+            fired.append((job_id, datetime.now()))
+
+        scheduler = Scheduler(callback, max_concurrency=16)
+        scheduler.start()
+        scheduler.schedule("cancelled", at(0.02))
+        scheduler.schedule("moved", at(0.02))
+        assert scheduler.cancel("cancelled")
+        assert not scheduler.cancel("cancelled")
+        scheduler.schedule("moved", at(0.08))
+        start = datetime.now()
+        await asyncio.sleep(0.15)
+        scheduler.stop()
+        return fired, start
+
+    fired, start = run(scenario)
+    assert [job_id for job_id, _ in fired] == ["moved"]
+    assert fired[0][1] - start >= timedelta(seconds=0.07)
+
+
+def test_cancel_compacts_heap():
+    async def scenario():
+        async def callback(job_id):
+            pass
+
+        scheduler = Scheduler(callback, max_concurrency=16)
+        scheduler.start()
+        for job_id in range(1000):
+            scheduler.schedule(job_id, at(3600))
+        for job_id in range(990):
+            scheduler.cancel(job_id)
+        scheduler.stop()
+        return scheduler
+
+    scheduler = run(scenario)
+    assert len(scheduler) == 10
+    # Устаревшие записи вычищаются, а не копятся до вершины кучи
+    assert len(scheduler.heap) <= max(64, 2 * len(scheduler))
+
+
+def test_stopped_scheduler_keeps_only_entries():
+    async def scenario():
+        fired = []
+
+        async def callback(job_id):
+            fired.append(job_id)
+
+        scheduler = Scheduler(callback, max_concurrency=16)
+        # Процесс-ведомый: синхронизация много раз переставляет одни и те же задачи
+        for _ in range(100):
+            for job_id in range(10):
+                scheduler.schedule(job_id, at(-1))
+        heap_before_start = len(scheduler.heap)
+
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        scheduler.stop()
+        return heap_before_start, fired
+
+    heap_before_start, fired = run(scenario)
+    assert heap_before_start == 0
+    assert sorted(fired) == list(range(10))
+
+
+def test_concurrency_is_bounded():
+    async def scenario():
+        running = peak = 0
+
+        async def callback(job_id):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        scheduler = Scheduler(callback, max_concurrency=3)
+        for job_id in range(20):
+            scheduler.schedule(job_id, at(-1))
+        scheduler.start()
+        await asyncio.sleep(0.2)
+        scheduler.stop()
+        return peak, scheduler
+
+    peak, scheduler = run(scenario)
+    assert peak == 3
+    assert len(scheduler) == 0
+    assert not scheduler.firing
+
+
+def test_failing_job_does_not_stop_scheduler():
+    async def scenario():
+        fired = []
+
+        async def callback(job_id):
+            fired.append(job_id)
+            if job_id == "bad":
+                raise RuntimeError("boom")
+
+        scheduler = Scheduler(callback, max_concurrency=16)
+        scheduler.start()
+        scheduler.schedule("bad", at(0.01))
+        scheduler.schedule("good", at(0.03))
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        return fired
+
+    assert run(scenario) == ["bad", "good"]
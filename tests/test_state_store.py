@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("dotenv")
+
+from utils.database import Database
+from utils.leader import LeaderElection
+from utils.state_store import MemoryStore, SQLiteStore, create_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryStore()
+        return
+    database = Database(tmp_path / "state.db")
+    yield SQLiteStore(database)
+    database.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_values_round_trip_through_json(store):
+    async def scenario():
+        value = {"messages": [{"role": "user", "content": "привет"}]}
+        await store.set("session", value)
+        value["messages"].clear()
+        stored = await store.get("session")
+        await store.delete("session")
+        return stored, await store.get("session")
+
+    stored, deleted = run(scenario())
+    # Изменение исходного объекта не меняет сохранённый
+    assert stored == {"messages": [{"role": "user", "content": "привет"}]}
+    assert deleted is None
+
+
+def test_ttl_expires(store):
+    async def scenario():
+        await store.set("short", 1, ttl=0.05)
+        await store.set("long", 2, ttl=60)
+        await asyncio.sleep(0.1)
+        return await store.get("short"), await store.get("long")
+
+    assert run(scenario()) == (None, 2)
+
+
+def test_lease_is_exclusive_until_released(store):
+    async def scenario():
+        first = await store.acquire_lease("jobs", "a", ttl=60)
+        second = await store.acquire_lease("jobs", "b", ttl=60)
+        renewed = await store.acquire_lease("jobs", "a", ttl=60)
+        await store.release_lease("jobs", "b")  # чужую аренду не снять
+        still_held = await store.acquire_lease("jobs", "b", ttl=60)
+        await store.release_lease("jobs", "a")
+        taken_over = await store.acquire_lease("jobs", "b", ttl=60)
+        return first, second, renewed, still_held, taken_over
+
+    assert run(scenario()) == (True, False, True, False, True)
+
+
+def test_expired_lease_is_taken_over(store):
+    async def scenario():
+        await store.acquire_lease("jobs", "a", ttl=0.05)
+        blocked = await store.acquire_lease("jobs", "b", ttl=60)
+        await asyncio.sleep(0.1)
+        return blocked, await store.acquire_lease("jobs", "b", ttl=60)
+
+    assert run(scenario()) == (False, True)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_store("etcd")
+
+
+def test_single_leader_and_failover(store):
+    async def scenario():
+        events = []
+
+        def election(name):
+            return LeaderElection(
+                store, "schedulers", ttl=0.15,
+                on_elected=lambda: events.append((name, "elected")),
+                on_demoted=lambda: events.append((name, "demoted"))
+            )
+
+        first, second = election("first"), election("second")
+        first.start()
+        await asyncio.sleep(0.02)
+        second.start()
+        await asyncio.sleep(0.2)
+        leaders = [e.is_leader for e in (first, second)]
+
+        # Ведущий остановился и отдал аренду — её забирает второй процесс
+        await first.stop()
+        await asyncio.sleep(0.2)
+        after_stop = [e.is_leader for e in (first, second)]
+        await second.stop()
+        return leaders, after_stop, events
+
+    leaders, after_stop, events = run(scenario())
+    assert leaders == [True, False]
+    assert after_stop == [False, True]
+    assert events == [
+        ("first", "elected"), ("first", "demoted"), ("second", "elected"), ("second", "demoted")
+    ]
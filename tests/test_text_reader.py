@@ -0,0 +1,54 @@
+import codecs
+
+from utils.text_reader import (
+    SAMPLE_SIZE,
+    TRUNCATION_MARK,
+    detect_encoding,
+    read_text_file,
+    truncate_text,
+)
+
+RUSSIAN = "Съешь же ещё этих мягких французских булок, да выпей чаю. " * 20
+
+
+def write(tmp_path, data: bytes):
+    path = tmp_path / "upload.txt"
+    path.write_bytes(data)
+    return path
+
+
+def test_cp1251(tmp_path):
+    data = RUSSIAN.encode("cp1251")
+    assert detect_encoding(data).replace("-", "").lower() in ("cp1251", "windows1251")
+    assert read_text_file(write(tmp_path, data), 10000) == RUSSIAN
+
+
+def test_utf8_bom(tmp_path):
+    data = codecs.BOM_UTF8 + RUSSIAN.encode("utf-8")
+    assert detect_encoding(data) == "utf-8-sig"
+    # BOM не попадает в текст
+    assert read_text_file(write(tmp_path, data), 10000) == RUSSIAN
+
+
+def test_multibyte_character_split_at_sample_boundary(tmp_path):
+    # «ж» (2 байта в UTF-8) начинается последним байтом сэмпла
+    data = b"a" * (SAMPLE_SIZE - 1) + "жизнь".encode("utf-8")
+    assert detect_encoding(data[:SAMPLE_SIZE]) == "utf-8"
+    assert read_text_file(write(tmp_path, data), SAMPLE_SIZE * 2) == "a" * (SAMPLE_SIZE - 1) + "жизнь"
+
+
+def test_truncation_at_limit(tmp_path):
+    path = write(tmp_path, RUSSIAN.encode("utf-8"))
+
+    text = read_text_file(path, 100)
+    assert len(text) == 100
+    assert text == RUSSIAN[:100 - len(TRUNCATION_MARK)] + TRUNCATION_MARK
+    # Обрезанный текст больше не меняется
+    assert truncate_text(text, 100) == text
+
+    # Ровно limit символов — не обрезка
+    assert read_text_file(path, len(RUSSIAN)) == RUSSIAN
+
+
+def test_missing_file(tmp_path):
+    assert read_text_file(tmp_path / "missing.txt", 100) is None
@@ -0,0 +1,146 @@
+import asyncio
+from pathlib import Path
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from utils import transcriber as transcriber_module
+from utils.transcriber import Transcriber, StubBackend, PARTIAL_MARK
+
+
+class SlowBackend(StubBackend):
+    def __init__(self, text: str = "текст"):
+        super().__init__(text)
+        self.started = asyncio.Event()
+
+    async def transcribe(self, audio_file: Path):
+        self.started.set()
+        await asyncio.sleep(0.05)
+        return await super().transcribe(audio_file)
+
+
+class FailingSegmentBackend(StubBackend):
+    """Падает на сегментах с заданными номерами"""
+
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = failing
+
+    async def transcribe(self, audio_file: Path):
+        await super().transcribe(audio_file)
+        index = int(audio_file.stem.rsplit("part", 1)[1])
+        if index in self.failing:
+            raise RuntimeError("backend error")
+        return f"часть{index}"
+
+
+def make_fetch(tmp_path: Path, counter: list):
+    async def fetch() -> Path:
+        counter.append(1)
+        path = tmp_path / f"voice{len(counter)}.ogg"
+        path.write_bytes(b"ogg")
+        return path
+    return fetch
+
+
+def fake_segments(monkeypatch, count: int):
+    async def find_silences(audio_file):
+        return []
+
+    async def split_audio(audio_file, cuts):
+        segments = []
+        for index in range(count):
+            segment = audio_file.with_name(f"{audio_file.stem}_part{index}{audio_file.suffix}")
+            segment.write_bytes(b"ogg")
+            segments.append(segment)
+        return segments
+
+    monkeypatch.setattr(transcriber_module, "find_silences", find_silences)
+    monkeypatch.setattr(transcriber_module, "split_audio", split_audio)
+
+
+def test_parallel_requests_are_deduplicated(tmp_path):
+    async def scenario():
+        backend = SlowBackend()
+        transcriber = Transcriber(backend)
+        fetched = []
+        fetch = make_fetch(tmp_path, fetched)
+        results = await asyncio.gather(*(transcriber.transcribe("voice", fetch) for _ in range(3)))
+        # Повтор после завершения берётся из кэша
+        results.append(await transcriber.transcribe("voice", fetch))
+        return backend, fetched, results, transcriber
+
+    backend, fetched, results, transcriber = asyncio.run(scenario())
+    assert results == ["текст"] * 4
+    assert len(fetched) == 1
+    assert len(backend.calls) == 1
+    assert transcriber.in_flight == {}
+
+
+def test_cancelled_owner_does_not_hang_waiters(tmp_path):
+    async def scenario():
+        backend = SlowBackend()
+        transcriber = Transcriber(backend)
+        fetch = make_fetch(tmp_path, [])
+        owner = asyncio.create_task(transcriber.transcribe("voice", fetch))
+        await backend.started.wait()
+        waiter = asyncio.create_task(transcriber.transcribe("voice", fetch))
+        await asyncio.sleep(0)
+        owner.cancel()
+        result = await asyncio.wait_for(waiter, timeout=1)
+        return owner, result, transcriber
+
+    owner, result, transcriber = asyncio.run(scenario())
+    assert owner.cancelled()
+    assert result == "текст"
+    assert transcriber.in_flight == {}
+
+
+def test_owner_error_reaches_waiters(tmp_path):
+    async def scenario():
+        transcriber = Transcriber(SlowBackend())
+        started = asyncio.Event()
+
+        async def fetch() -> Path:
+            started.set()
+            await asyncio.sleep(0.01)
+            raise OSError("download failed")
+
+        owner = asyncio.create_task(transcriber.transcribe("voice", fetch))
+        await started.wait()
+        waiter = asyncio.create_task(transcriber.transcribe("voice", fetch))
+        done = await asyncio.gather(owner, waiter, return_exceptions=True)
+        return done, transcriber
+
+    done, transcriber = asyncio.run(scenario())
+    assert all(isinstance(result, OSError) for result in done)
+    assert transcriber.in_flight == {}
+
+
+def test_failed_segment_marks_result_partial(tmp_path, monkeypatch):
+    fake_segments(monkeypatch, 3)
+
+    async def scenario():
+        backend = FailingSegmentBackend(failing={1})
+        transcriber = Transcriber(backend, segment_threshold=10)
+        fetch = make_fetch(tmp_path, [])
+        text = await transcriber.transcribe("voice", fetch, duration=180)
+        return text, transcriber
+
+    text, transcriber = asyncio.run(scenario())
+    assert text == f"часть0 {PARTIAL_MARK} часть2"
+    # Неполный результат не кэшируется
+    assert transcriber.get_cached("voice") is None
+    assert not list(tmp_path.iterdir())
+
+
+def test_all_segments_failed_returns_none(tmp_path, monkeypatch):
+    fake_segments(monkeypatch, 2)
+
+    async def scenario():
+        transcriber = Transcriber(FailingSegmentBackend(failing={0, 1}), segment_threshold=10)
+        return await transcriber.transcribe("voice", make_fetch(tmp_path, []), duration=180)
+
+    assert asyncio.run(scenario()) is None
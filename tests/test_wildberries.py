@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+
+from utils import wildberries
+from utils.wildberries import BasketRouter, basket_card_url
+
+
+@pytest.fixture
+def router(tmp_path):
+    return BasketRouter(tmp_path / "baskets.json")
+
+
+@pytest.mark.parametrize("vol, basket", [(0, 1), (143, 1), (144, 2), (1061, 6), (4566, 26), (99999, 26)])
+def test_lookup_by_default_table(router, vol, basket):
+    assert router.lookup(vol) == basket
+
+
+def test_learn_new_basket_and_persist(router, tmp_path):
+    router.learn(4800, 27)
+    assert router.lookup(4799) == 26
+    assert router.lookup(4800) == 27
+
+    reloaded = BasketRouter(tmp_path / "baskets.json")
+    assert reloaded.lookup(4800) == 27
+
+
+def test_learn_shifts_neighbour_bounds(router):
+    # vol 1400 оказался на 12-м хосте, хотя таблица предсказывала 10-й
+    router.learn(1400, 12)
+    assert router.lookup(1400) == 12
+    # Старшие хосты начинаются строго после найденного vol и по возрастанию
+    assert router.bounds == sorted(router.bounds)
+    assert len(set(router.bounds)) == len(router.bounds)
+    assert router.lookup(1399) == 10
+
+
+def test_candidates_nearest_first(router):
+    assert router.candidates(1400) == [11, 9, 12, 8, 13, 7]
+    # Не выходит за первый хост и дальше PROBE_RADIUS за последний
+    assert router.candidates(0) == [2, 3, 4]
+    assert max(router.candidates(99999)) == 26 + wildberries.PROBE_RADIUS
+
+
+def test_basket_card_url():
+    assert basket_card_url(3, "30012345") == (
+        "https://basket-03.wbbasket.ru/vol300/part30012/30012345/info/ru/card.json"
+    )
+
+
+def test_fetch_basket_card_probes_and_learns(router, monkeypatch):
+    requested = []
+
+    async def fetch_json(url, timeout=10):
+        requested.append(url)
+        return {"imt_name": "Товар"} if "basket-12." in url else None
+
+    monkeypatch.setattr(wildberries, "basket_router", router)
+    monkeypatch.setattr(wildberries, "fetch_json", fetch_json)
+
+    data = asyncio.run(wildberries.fetch_basket_card("140012345"))
+    assert data == {"imt_name": "Товар"}
+    assert router.lookup(1400) == 12
+
+    # Следующий запрос с того же vol идёт сразу на нужный хост
+    requested.clear()
+    asyncio.run(wildberries.fetch_basket_card("140054321"))
+    assert len(requested) == 1
+
+
+def test_missing_card_is_not_probed_again(router, monkeypatch):
+    requested = []
+
+    async def fetch_json(url, timeout=10):
+        requested.append(url)
+        return None
+
+    monkeypatch.setattr(wildberries, "basket_router", router)
+    monkeypatch.setattr(wildberries, "fetch_json", fetch_json)
+
+    assert asyncio.run(wildberries.fetch_basket_card("140012345")) is None
+    probes = len(requested)
+    assert probes == 1 + len(router.candidates(1400))
+
+    asyncio.run(wildberries.fetch_basket_card("140012345"))
+    assert len(requested) == probes + 1
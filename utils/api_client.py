@@ -1,7 +1,11 @@
 import asyncio
 import logging
+import time
 from typing import Optional
+from urllib.parse import urlparse
 import requests
+from utils.metrics import UPSTREAM_LATENCY
+from utils.tracing import span
 
 
 async def fetch_json(url: str, timeout: int = 10) -> Optional[dict]:
@@ -15,25 +19,38 @@ async def fetch_json(url: str, timeout: int = 10) -> Optional[dict]:
     Returns:
         dict или None в случае ошибки
     """
-    try:
-        response = await asyncio.to_thread(
-            lambda: requests.get(url, timeout=timeout)
-        )
-        response.raise_for_status()
-        return response.json()
+    host = urlparse(url).hostname or "unknown"
+    start = time.perf_counter()
+    outcome = "ok"
+    
+    with span("http", host=host) as trace_span:
+        try:
+            response = await asyncio.to_thread(
+                lambda: requests.get(url, timeout=timeout)
+            )
+            response.raise_for_status()
+            return response.json()
+        
+        except requests.Timeout:
+            outcome = "timeout"
+            logging.error(f"Request timeout: {url}")
+            return None
         
-    except requests.Timeout:
-        logging.error(f"Request timeout: {url}")
-        return None
+        except requests.HTTPError as e:
+            outcome = f"http_{e.response.status_code}"
+            logging.error(f"HTTP error: {url} | Status: {e.response.status_code}")
+            return None
         
-    except requests.HTTPError as e:
-        logging.error(f"HTTP error: {url} | Status: {e.response.status_code}")
-        return None
+        except requests.RequestException as e:
+            outcome = "error"
+            logging.error(f"Request failed: {url} | Error: {e}")
+            return None
         
-    except requests.RequestException as e:
-        logging.error(f"Request failed: {url} | Error: {e}")
-        return None
+        except ValueError as e:
+            outcome = "invalid_json"
+            logging.error(f"Invalid JSON response: {url} | Error: {e}")
+            return None
         
-    except ValueError as e:
-        logging.error(f"Invalid JSON response: {url} | Error: {e}")
-        return None
\ No newline at end of file
+        finally:
+            trace_span.set(outcome=outcome)
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, "http", host, outcome)
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+DB_FILE = Path("data/bot.db")
+
+# Сколько хранить журнал изменений: отставший дольше процесс перечитает таблицы целиком
+CHANGE_LOG_RETENTION = 3600  # секунд
+# Ограничение SQLite на число параметров запроса
+MAX_QUERY_PARAMS = 500
+
+
+class Database:
+    """
+    SQLite в режиме WAL с одним фоновым потоком для всех запросов
+
+    Единственный поток сериализует доступ к соединению, а event loop
+    не блокируется на записи. Синхронные методы нужны только при старте.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _execute(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def _insert(self, sql: str, params: Sequence) -> int:
+        return self.conn.execute(sql, params).lastrowid
+
+    def _update(self, sql: str, params: Sequence) -> int:
+        return self.conn.execute(sql, params).rowcount
+
+    def _select_in(self, sql: str, column: str, values: List) -> List[tuple]:
+        rows = []
+        for start in range(0, len(values), MAX_QUERY_PARAMS):
+            chunk = values[start:start + MAX_QUERY_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows.extend(self.conn.execute(f"{sql} WHERE {column} IN ({placeholders})", chunk))
+        return rows
+
+    def _change_cursor(self) -> int:
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+    def _changes(self, table: str, since: int) -> Tuple[int, Optional[Set[int]]]:
+        cursor = self._change_cursor()
+        first = self.conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+        # Нужные записи уже вычищены — изменения не восстановить
+        if since + 1 < (first or cursor + 1):
+            return cursor, None
+        rows = self.conn.execute(
+            "SELECT row_id FROM change_log WHERE tbl = ? AND seq > ? AND seq <= ?",
+            (table, since, cursor)
+        )
+        return cursor, {row[0] for row in rows}
+
+    def _executemany(self, sql: str, rows: Iterable[Sequence]):
+        with self.conn:
+            self.conn.executemany(sql, rows)
+
+    def execute_sync(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        return self.executor.submit(self._execute, sql, params).result()
+
+    def executescript_sync(self, script: str):
+        self.executor.submit(self.conn.executescript, script).result()
+
+    def executemany_sync(self, sql: str, rows: Iterable[Sequence]):
+        self.executor.submit(self._executemany, sql, list(rows)).result()
+
+    def track_changes_sync(self, table: str, key: str = "id", enabled: bool = True):
+        """
+        Триггеры, записывающие ключи изменённых строк таблицы в change_log
+
+        По журналу другие процессы бота перечитывают только изменившиеся
+        строки. В однопроцессном режиме журнал не нужен — триггеры удаляются.
+        """
+        script = """
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tbl TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+            );
+        """
+        for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            trigger = f"{table}_{event.lower()}_log"
+            if enabled:
+                script += f"""
+                    CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {table} BEGIN
+                        INSERT INTO change_log (tbl, row_id) VALUES ('{table}', {ref}.{key});
+                    END;
+                """
+            else:
+                script += f"DROP TRIGGER IF EXISTS {trigger};"
+        self.executescript_sync(script)
+
+    def change_cursor_sync(self) -> int:
+        """Номер последней записи журнала; берётся до полной загрузки таблиц"""
+        return self.executor.submit(self._change_cursor).result()
+
+    def ensure_column_sync(self, table: str, column: str, declaration: str):
+        """Добавляет колонку в существующую таблицу, если её ещё нет"""
+        columns = {row[1] for row in self.execute_sync(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self.execute_sync(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    async def execute(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._execute, sql, params)
+
+    async def insert(self, sql: str, params: Sequence = ()) -> int:
+        """INSERT, возвращающий rowid новой строки"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._insert, sql, params)
+
+    async def update(self, sql: str, params: Sequence = ()) -> int:
+        """UPDATE или DELETE, возвращающий число затронутых строк"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._update, sql, params)
+
+    async def executemany(self, sql: str, rows: Iterable[Sequence]):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._executemany, sql, list(rows))
+
+    async def select_in(self, sql: str, column: str, values: Iterable) -> List[tuple]:
+        """SELECT ... WHERE column IN (values), разбитый на пачки по MAX_QUERY_PARAMS"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._select_in, sql, column, list(values))
+
+    async def changes(self, table: str, since: int) -> Tuple[int, Optional[Set[int]]]:
+        """
+        Ключи строк table, изменённых после записи журнала since
+
+        Returns:
+            (новый курсор, ключи); ключи None, если журнал уже вычищен
+            дальше since и таблицу нужно перечитать целиком
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._changes, table, since)
+
+    async def prune_changes(self, retention: float = CHANGE_LOG_RETENTION):
+        await self.execute(
+            "DELETE FROM change_log WHERE ts < strftime('%s', 'now') - ?",
+            (int(retention),)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.conn.close()
+
+
+db = Database(DB_FILE)
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from config import DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_RATE
+from utils.metrics import Gauge, QUEUE_DEPTH
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, cost: float = 1) -> float:
+        """Сколько ждать до появления cost токенов (0 — можно отправлять)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, now: float, cost: float = 1):
+        self._refill(now)
+        self.tokens -= cost
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class Delivery:
+    __slots__ = ("chat_id", "text", "kwargs", "priority", "seq", "enqueued", "attempts")
+
+    def __init__(self, chat_id: int, text: str, kwargs: dict, priority: int, seq: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class DeliveryQueue:
+    """
+    Общая очередь исходящих сообщений
+
+    Готовые к отправке сообщения упорядочены по приоритету, а те, чей чат
+    упёрся в лимит (или получил RetryAfter), ждут в отдельной куче по времени
+    готовности — так один «горячий» чат не задерживает остальные.
+
+    В каждом чате одновременно обрабатывается одно сообщение: пока оно
+    ждёт лимита, отправляется или ждёт повтора после ошибки, следующие
+    сообщения чата придерживаются, и порядок внутри чата не нарушается.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 1,
+        max_attempts: int = 5,
+        max_in_flight: int = 10
+    ):
+        self.bot = None
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.max_attempts = max_attempts
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+
+        self.ready: List[Tuple[int, int, Delivery]] = []
+        self.delayed: List[Tuple[float, int, Delivery]] = []
+        # chat_id -> сообщение, которое сейчас обрабатывается в чате
+        self.chat_owners: Dict[int, Delivery] = {}
+        # chat_id -> придержанные сообщения чата по (priority, seq)
+        self.held: Dict[int, List[Tuple[int, int, Delivery]]] = {}
+        self.sending: Set[asyncio.Task] = set()
+        self.counter = itertools.count()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.ready) + len(self.delayed) + sum(len(held) for held in self.held.values())
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_avg": self.latency_sum / self.sent if self.sent else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def start(self, bot):
+        self.bot = bot
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    def send(self, chat_id: int, text: str, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Ставит сообщение в очередь и сразу возвращает управление"""
+        delivery = Delivery(chat_id, text, kwargs, priority, next(self.counter))
+        heapq.heappush(self.ready, (priority, delivery.seq, delivery))
+        if self.wakeup:
+            self.wakeup.set()
+
+    def _delay(self, delivery: Delivery, until: float):
+        heapq.heappush(self.delayed, (until, delivery.seq, delivery))
+
+    def _release_chat(self, chat_id: int):
+        """Сообщение чата обработано: выпускаем следующее придержанное"""
+        self.chat_owners.pop(chat_id, None)
+        held = self.held.get(chat_id)
+        if not held:
+            return
+        heapq.heappush(self.ready, heapq.heappop(held))
+        if not held:
+            del self.held[chat_id]
+        self.wakeup.set()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {
+                    cid: b for cid, b in self.chat_buckets.items() if not b.is_full(now)
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+
+            while self.delayed and self.delayed[0][0] <= now:
+                _, _, delivery = heapq.heappop(self.delayed)
+                # Исходный порядковый номер сохраняет очерёдность сообщений внутри чата
+                heapq.heappush(self.ready, (delivery.priority, delivery.seq, delivery))
+
+            if not self.ready:
+                self.wakeup.clear()
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self.global_bucket.wait_time(now)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            item = heapq.heappop(self.ready)
+            delivery = item[2]
+
+            owner = self.chat_owners.setdefault(delivery.chat_id, delivery)
+            if owner is not delivery:
+                heapq.heappush(self.held.setdefault(delivery.chat_id, []), item)
+                continue
+
+            bucket = self._chat_bucket(delivery.chat_id, now)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait:
+                self._delay(delivery, now + chat_wait)
+                continue
+
+            bucket.take(now)
+            self.global_bucket.take(now)
+
+            await self.in_flight.acquire()
+            task = asyncio.create_task(self._deliver(delivery))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _deliver(self, delivery: Delivery):
+        delivery.attempts += 1
+
+        try:
+            await self.bot.send_message(delivery.chat_id, delivery.text, **delivery.kwargs)
+
+            latency = time.monotonic() - delivery.enqueued
+            self.sent += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self._release_chat(delivery.chat_id)
+
+        except TelegramRetryAfter as e:
+            logging.warning(f"Flood control for chat {delivery.chat_id}: retry in {e.retry_after}s")
+            # Остальные сообщения в этот чат тоже должны подождать
+            bucket = self._chat_bucket(delivery.chat_id, time.monotonic())
+            bucket.tokens = min(bucket.tokens, 1 - e.retry_after * bucket.rate)
+            self._retry(delivery, e.retry_after)
+
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат не существует — повтор не поможет
+            self.failed += 1
+            logging.error(f"Delivery to {delivery.chat_id} rejected: {e}")
+            self._release_chat(delivery.chat_id)
+
+        except Exception as e:
+            logging.error(f"Delivery to {delivery.chat_id} failed (attempt {delivery.attempts}): {e}")
+            self._retry(delivery, 2 ** delivery.attempts)
+
+        finally:
+            self.in_flight.release()
+
+    def _retry(self, delivery: Delivery, delay: float):
+        if delivery.attempts >= self.max_attempts:
+            self.failed += 1
+            logging.error(f"Delivery to {delivery.chat_id} dropped after {delivery.attempts} attempts")
+            self._release_chat(delivery.chat_id)
+            return
+
+        # Чат остаётся за этим сообщением: следующие не обгонят его во время паузы
+        self.retried += 1
+        self._delay(delivery, time.monotonic() + delay)
+        self.wakeup.set()
+
+
+delivery_queue = DeliveryQueue(global_rate=DELIVERY_GLOBAL_RATE, chat_rate=DELIVERY_CHAT_RATE)
+
+QUEUE_DEPTH.add("delivery", lambda: delivery_queue.depth)
+Gauge(
+    "bot_delivery_messages",
+    "Outgoing messages by result since start",
+    lambda: {(key,): delivery_queue.stats()[key] for key in ("sent", "failed", "retried")},
+    ("result",)
+)
+Gauge(
+    "bot_delivery_latency_seconds",
+    "Time from enqueue to successful send",
+    lambda: {(key,): delivery_queue.stats()[f"latency_{key}"] for key in ("avg", "max")},
+    ("stat",)
+)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+
+class DiskCache:
+    """
+    Папка-кэш с бюджетом по байтам и вытеснением LRU
+
+    Индекс (имя -> размер) живёт в памяти в порядке последнего доступа
+    и перестраивается из файловой системы при старте.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.pins: Dict[str, int] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        """Перечитывает папку; порядок LRU — по времени последнего доступа"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    # На noatime-разделах atime не обновляется, поэтому учитываем и mtime
+                    entries.append((max(stat.st_atime, stat.st_mtime), entry.name, stat.st_size))
+
+        entries.sort()
+        self.index = OrderedDict((name, size) for _, name, size in entries)
+        self.total_bytes = sum(self.index.values())
+        logging.info(
+            f"Disk cache {self.directory}: {len(self.index)} files, "
+            f"{self.total_bytes / (1024 * 1024):.1f} MB"
+        )
+        self.evict()
+
+    def get(self, name: str) -> Optional[Path]:
+        """Путь к файлу, если он есть в кэше; отмечает доступ"""
+        if name not in self.index:
+            return None
+
+        path = self.directory / name
+        if not path.exists():
+            self._forget(name)
+            return None
+
+        self.touch(name)
+        return path
+
+    def touch(self, name: str):
+        self.index.move_to_end(name)
+        try:
+            os.utime(self.directory / name)
+        except OSError:
+            pass
+
+    def add(self, path: str | Path) -> Path:
+        """Регистрирует файл, уже лежащий в папке кэша, и освобождает место при необходимости"""
+        path = Path(path)
+        name = path.name
+
+        self._forget(name)
+        size = path.stat().st_size
+        self.index[name] = size
+        self.total_bytes += size
+
+        with self.pinned(path):
+            self.evict()
+        return path
+
+    @contextmanager
+    def pinned(self, path: str | Path):
+        """Файл не вытесняется, пока идёт работа с ним (например, отправка)"""
+        name = Path(path).name
+        self.pins[name] = self.pins.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self.pins[name] -= 1
+            if not self.pins[name]:
+                del self.pins[name]
+
+    def evict(self):
+        for name in list(self.index):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if name in self.pins:
+                continue
+
+            try:
+                (self.directory / name).unlink(missing_ok=True)
+            except OSError as e:
+                logging.error(f"Disk cache eviction failed: {name} | Error: {e}")
+                continue
+
+            self._forget(name)
+            logging.info(f"Disk cache evicted: {name}")
+
+    def _forget(self, name: str):
+        size = self.index.pop(name, None)
+        if size is not None:
+            self.total_bytes -= size
+
+
+def clean_old_files(directories: Iterable[str | Path], max_age: float) -> int:
+    """Удаляет файлы старше max_age секунд. Возвращает количество удалённых"""
+    deadline = time.time() - max_age
+    removed = 0
+
+    for directory in directories:
+        directory = Path(directory)
+        if not directory.exists():
+            continue
+
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < deadline:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    logging.error(f"Janitor failed to remove {entry.path}: {e}")
+
+    return removed
+
+
+async def run_janitor(directories: Iterable[str | Path], max_age: float, interval: float):
+    """Периодически чистит временные папки от файлов, оставшихся после ошибок"""
+    directories = list(directories)
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(clean_old_files, directories, max_age)
+            if removed:
+                logging.info(f"Janitor removed {removed} orphaned temp files")
+        except Exception as e:
+            logging.error(f"Janitor error: {e}")
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class DownloadJob:
+    def __init__(self, key: str, func: Callable[[], Any]):
+        self.key = key
+        self.func = func
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class DownloadPool:
+    """
+    Ограниченный пул для тяжёлых блокирующих загрузок (yt-dlp + ffmpeg)
+
+    Одинаковые задачи (по ключу) во время выполнения склеиваются в одну,
+    ожидающие задачи стоят в очереди FIFO и знают свою позицию. По таймауту
+    ожидающие получают ошибку, но слот освобождается только с возвратом потока.
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 300):
+        self.size = size
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="download")
+        self.queue: Optional[asyncio.Queue] = None
+        self.waiting: List[DownloadJob] = []
+        self.jobs: Dict[str, DownloadJob] = {}
+        self.workers: List[asyncio.Task] = []
+        self.busy = 0
+
+    def _ensure_workers(self):
+        if self.workers:
+            return
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.size)]
+
+    def position(self, key: str) -> int:
+        """Сколько задач впереди (0 — задача уже выполняется или начнётся сразу)"""
+        for index, job in enumerate(self.waiting):
+            if job.key == key:
+                return index + 1 if self.busy >= self.size else 0
+        return 0
+
+    def submit(self, key: str, func: Callable[[], Any]) -> asyncio.Future:
+        """
+        Ставит задачу в очередь
+
+        Returns:
+            Future с результатом func; для уже выполняющегося ключа — тот же future
+        """
+        self._ensure_workers()
+
+        if key in self.jobs:
+            return self.jobs[key].future
+
+        job = DownloadJob(key, func)
+        self.jobs[key] = job
+        self.waiting.append(job)
+        self.queue.put_nowait(job)
+        return job.future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            job = await self.queue.get()
+            self.waiting.remove(job)
+            self.busy += 1
+
+            running = loop.run_in_executor(self.executor, job.func)
+            try:
+                result = await asyncio.wait_for(asyncio.shield(running), timeout=self.timeout)
+                job.future.set_result(result)
+            except asyncio.TimeoutError:
+                logging.error(f"Download job timed out: {job.key}")
+                job.future.set_exception(TimeoutError(f"Download timed out: {job.key}"))
+                # Поток не прервать: слот (и ключ) заняты, пока он не вернётся,
+                # иначе зависшие загрузки набрали бы потоков сверх size
+                try:
+                    await running
+                except Exception:
+                    pass
+                logging.info(f"Timed out download job finished: {job.key}")
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                # Исключение забирают ожидающие; без них не засоряем лог предупреждением
+                if job.future.done() and not job.future.cancelled():
+                    job.future.exception()
+                self.busy -= 1
+                del self.jobs[job.key]
+                self.queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        return len(self.waiting)
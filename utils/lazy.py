@@ -0,0 +1,106 @@
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Callable, Dict, Optional
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к атрибуту
+
+    Тяжёлые зависимости функций (openai, pdfplumber, yt_dlp...) не нужны
+    для старта бота: роутеры регистрируются сразу, а модуль подгружается
+    в первом хендлере, которому он понадобился, или фоновым прогревом.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    # Свои методы — с подчёркиванием, чтобы не заслонять атрибуты модуля
+    def _loaded(self) -> bool:
+        return self._module is not None
+
+    def _load(self) -> ModuleType:
+        # Прогрев идёт в потоке: не даём двум потокам замерять один импорт
+        with self._lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                logging.info(f"Imported {self._name} in {time.perf_counter() - start:.2f}s")
+        return self._module
+
+    def __getattr__(self, attr: str):
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, attr)
+
+
+lazy_modules: Dict[str, LazyModule] = {}
+
+
+def lazy_import(name: str) -> LazyModule:
+    module = lazy_modules.get(name)
+    if module is None:
+        module = lazy_modules[name] = LazyModule(name)
+    return module
+
+
+def load_all():
+    """Синхронно импортирует все отложенные модули (для замеров)"""
+    for name, module in list(lazy_modules.items()):
+        try:
+            module._load()
+        except ImportError as e:
+            logging.warning(f"Optional module {name} is not installed: {e}")
+
+
+async def warm_up(delay: float = 0, *factories: Callable[[], object]):
+    """
+    Фоновый прогрев после старта: импорты и создание клиентов идут в потоке,
+    чтобы первый пользователь функции не ждал их в хендлере
+    """
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    for name, module in list(lazy_modules.items()):
+        if module._loaded():
+            continue
+        try:
+            await asyncio.to_thread(module._load)
+        except ImportError as e:
+            logging.warning(f"Optional module {name} is not installed: {e}")
+    for factory in factories:
+        try:
+            await asyncio.to_thread(factory)
+        except Exception as e:
+            logging.error(f"Warm-up of {factory} failed: {e}")
+    logging.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s, RSS {format_rss()}")
+
+
+def rss_mb() -> Optional[float]:
+    """Текущий RSS процесса в МБ; где /proc нет — пиковый, на Windows — None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def format_rss() -> str:
+    rss = rss_mb()
+    return f"{rss:.0f} MB" if rss is not None else "n/a"
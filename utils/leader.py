@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Callable, Optional
+from utils.state_store import StateStore
+
+
+class LeaderElection:
+    """
+    Выбор ведущего процесса через аренду в общем хранилище
+
+    Ведущий продлевает аренду каждые ttl/3 секунд. Если он пропал, аренда
+    истекает и её захватывает другой процесс. Фоновые задачи, которые должны
+    выполняться ровно в одном экземпляре (напоминания, опрос цен), запускаются
+    в on_elected и останавливаются в on_demoted.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        name: str,
+        ttl: float = 30,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_demoted: Optional[Callable[[], None]] = None
+    ):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        logging.info(f"{self.owner} {'became' if leader else 'lost'} leadership of {self.name}")
+        callback = self.on_elected if leader else self.on_demoted
+        if callback:
+            callback()
+
+    async def _run(self):
+        while True:
+            try:
+                acquired = await self.store.acquire_lease(self.name, self.owner, self.ttl)
+            except Exception as e:
+                logging.error(f"Lease {self.name} renewal failed: {e}")
+                acquired = False
+            self._set_leader(acquired)
+            await asyncio.sleep(self.ttl / 3)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.is_leader:
+            self._set_leader(False)
+            await self.store.release_lease(self.name, self.owner)
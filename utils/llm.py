@@ -0,0 +1,31 @@
+import threading
+from typing import Dict, Optional
+from config import OPENAI_KEY
+from utils.lazy import lazy_import
+
+openai = lazy_import("openai")
+
+# OpenRouter — бесплатный провайдер LLM; None — api.openai.com (Whisper)
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENAI_BASE_URL = None
+
+_clients: Dict[Optional[str], object] = {}
+# Клиенты создаются и в потоках (прогрев, asyncio.to_thread) — не создаём два
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: Optional[str] = OPENROUTER_BASE_URL):
+    """
+    Общий клиент OpenAI для base_url
+
+    openai импортируется, а клиент создаётся при первом вызове; хендлеры
+    всех модулей делят один клиент и его пул соединений. Первый вызов может
+    ждать импорта openai, поэтому из async-кода звать только внутри потока.
+    """
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                client = _clients[base_url] = openai.OpenAI(api_key=OPENAI_KEY, base_url=base_url)
+    return client
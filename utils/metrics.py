@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+from aiohttp import web
+from utils.tracing import span
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+GaugeValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in self.values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # label_values -> [счётчики по корзинам..., сумма, количество]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        # Храним попадания в корзину, накопительные суммы считаем при выдаче
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                le = format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Gauge(Metric):
+    """Значение считается при каждом запросе /metrics вызовом collect()"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        collect: Callable[[], GaugeValue],
+        labels: Sequence[str] = ()
+    ):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            value = self.collect()
+        except Exception as e:
+            logging.error(f"Gauge {self.name} failed: {e}")
+            return []
+
+        if not isinstance(value, dict):
+            value = {(): value}
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {v}" for key, v in value.items()
+        ]
+
+
+class GaugeFamily(Metric):
+    """Gauge с одной меткой, значения которой регистрируют разные модули через add()"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label: str):
+        super().__init__(name, help_text, (label,))
+        self.sources: Dict[str, Callable[[], float]] = {}
+
+    def add(self, label_value: str, collect: Callable[[], float]):
+        self.sources[label_value] = collect
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for label_value, collect in self.sources.items():
+            try:
+                lines.append(f"{self.name}{format_labels(self.labels, (label_value,))} {collect()}")
+            except Exception as e:
+                logging.error(f"Gauge {self.name}/{label_value} failed: {e}")
+        return lines
+
+
+registry: List[Metric] = []
+
+CACHE_ENTRIES = GaugeFamily("bot_cache_entries", "Entries in in-memory caches", "cache")
+QUEUE_DEPTH = GaugeFamily("bot_queue_depth", "Jobs waiting in internal queues", "queue")
+SCHEDULED_JOBS = GaugeFamily("bot_scheduled_jobs", "Jobs waiting in schedulers", "scheduler")
+ASYNCIO_TASKS = Gauge("bot_asyncio_tasks", "Running asyncio tasks", lambda: len(asyncio.all_tasks()))
+
+UPSTREAM_LATENCY = Histogram(
+    "bot_upstream_request_seconds",
+    "Latency of requests to external services",
+    ("service", "target", "outcome")
+)
+
+
+@contextmanager
+def track_upstream(service: str, target: str):
+    """
+    Замеряет вызов внешнего сервиса; исключение записывается как outcome=error.
+    Внутри трассы вызов становится её span'ом.
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with span(service, target=target):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, service, target, outcome)
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Отдельный aiohttp-сервер с /metrics; слушать стоит только локальный адрес"""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
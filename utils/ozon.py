@@ -0,0 +1,68 @@
+import json
+import re
+from typing import Optional
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # orjson заметно быстрее на больших ответах, но не обязателен
+    loads = json.loads
+
+
+PRICE_WIDGETS = ("webPrice", "webAPrice")
+HEADING_WIDGETS = ("webProductHeading",)
+OUT_OF_STOCK_WIDGETS = ("webOutOfStock",)
+
+PRICE_JUNK_RE = re.compile(r"[^\d,.]")
+
+
+def parse_price(value) -> float:
+    """'1 299,50 ₽' → 1299.5"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    digits = PRICE_JUNK_RE.sub("", str(value)).replace(",", ".")
+    try:
+        return float(digits) if digits else 0
+    except ValueError:
+        return 0
+
+
+def parse_widget_states(widgets: dict) -> Optional[dict]:
+    """
+    Достаёт цену, название и наличие из widgetStates composer-api
+
+    Ключи виджетов выглядят как webPrice-3121879-default-1: сначала
+    отбираем нужные по префиксу и декодируем только их, остальные
+    сотни виджетов страницы не трогаем (ключи просматриваются все —
+    это дёшево, дорого только декодирование).
+    """
+    price_state = heading_state = None
+    out_of_stock = False
+
+    for key, value in widgets.items():
+        prefix = key.partition("-")[0]
+
+        if prefix in PRICE_WIDGETS and price_state is None:
+            price_state = loads(value) if isinstance(value, (str, bytes)) else value
+        elif prefix in HEADING_WIDGETS and heading_state is None:
+            heading_state = loads(value) if isinstance(value, (str, bytes)) else value
+        elif prefix in OUT_OF_STOCK_WIDGETS:
+            out_of_stock = True
+
+        # webOutOfStock может идти после цены и названия: выходим, только найдя всё
+        if price_state is not None and heading_state is not None and out_of_stock:
+            break
+
+    if not price_state:
+        return None
+
+    price = parse_price(price_state.get("price") or price_state.get("cardPrice") or 0)
+    name = (heading_state or {}).get("title") or price_state.get("name") or "Товар Ozon"
+    available = price_state.get("isAvailable", True) and not out_of_stock
+
+    return {"name": name, "price": price, "available": available}
+
+
+def parse_ozon_page(content: bytes) -> Optional[dict]:
+    """Разбор тела ответа composer-api целиком"""
+    return parse_widget_states(loads(content).get("widgetStates") or {})
@@ -0,0 +1,288 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from config import (
+    SLOW_UPDATE_THRESHOLD, PROFILE_USERS, PROFILE_COMMANDS, PROFILE_DIR, LOOP_LAG_THRESHOLD
+)
+from utils.metrics import Gauge
+
+SAMPLE_INTERVAL = 0.05  # секунд
+MAX_STACK_DEPTH = 25
+TOP_STACKS = 15
+TOP_FUNCTIONS = 40
+
+# Кого профилировать через cProfile; меняется командой /debug profile
+profile_users: Set[int] = set(PROFILE_USERS)
+profile_commands: Set[str] = set(PROFILE_COMMANDS)
+
+
+def frame_line(frame: FrameType) -> str:
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+def thread_stack(frame: Optional[FrameType]) -> List[FrameType]:
+    """Стек потока от внешнего вызова к текущему"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def coroutine_stack(coro: Any) -> List[FrameType]:
+    """
+    Цепочка await приостановленной корутины
+
+    Task.get_stack() отдаёт только внешний кадр, а вложенные корутины
+    видны лишь через cr_await.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+def save_report(prefix: str, text: str) -> Path:
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{prefix}-{datetime.now():%Y%m%d-%H%M%S-%f}.txt"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def format_context(context: Dict[str, Any]) -> str:
+    return "\n".join(f"{key}: {value}" for key, value in context.items())
+
+
+# ==================== МЕДЛЕННЫЕ ОБНОВЛЕНИЯ ====================
+
+class WatchedUpdate:
+    __slots__ = ("task", "context", "started", "samples")
+
+    def __init__(self, task: asyncio.Task, context: Dict[str, Any]):
+        self.task = task
+        self.context = context
+        self.started = time.perf_counter()
+        self.samples: Counter = Counter()
+
+
+class SlowUpdateSampler:
+    """
+    Сэмплирующий профайлер хендлеров, превысивших порог
+
+    Фоновый поток раз в SAMPLE_INTERVAL снимает стек каждого такого
+    хендлера. Если поток цикла событий сейчас исполняет его корутину
+    (хендлер блокирует цикл), берётся реальный стек потока с синхронными
+    вызовами, иначе — цепочка await, на которой хендлер ждёт.
+    Пока порог не превышен, хендлер стоит одной записи в словаре.
+    """
+
+    def __init__(self, threshold: float = SLOW_UPDATE_THRESHOLD, interval: float = SAMPLE_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.active: Dict[int, WatchedUpdate] = {}
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def watch(self, context: Dict[str, Any]) -> WatchedUpdate:
+        if self.thread is None:
+            self.loop_thread_id = threading.get_ident()
+            self.thread = threading.Thread(target=self._run, name="slow-update-sampler", daemon=True)
+            self.thread.start()
+
+        entry = WatchedUpdate(asyncio.current_task(), context)
+        self.active[id(entry)] = entry
+        return entry
+
+    def finish(self, entry: WatchedUpdate) -> Optional[str]:
+        """Снимает хендлер с наблюдения; для медленного возвращает отчёт"""
+        self.active.pop(id(entry), None)
+        duration = time.perf_counter() - entry.started
+        if duration < self.threshold:
+            return None
+
+        entry.context["duration"] = f"{duration:.2f}s"
+        total = sum(entry.samples.values())
+        lines = [format_context(entry.context), f"samples: {total}", ""]
+        for stack, count in entry.samples.most_common(TOP_STACKS):
+            lines.append(f"{count} ({count / total:.0%})")
+            lines.extend(f"    {line}" for line in stack)
+            lines.append("")
+        return "\n".join(lines)
+
+    def _sample(self, entry: WatchedUpdate, loop_frames: List[FrameType]) -> Tuple[str, ...]:
+        coro_frames = coroutine_stack(entry.task.get_coro()) if entry.task else []
+        coro_ids = {id(frame) for frame in coro_frames}
+        # Корутина сейчас на стеке потока цикла — значит, она его и занимает
+        for index, frame in enumerate(loop_frames):
+            if id(frame) in coro_ids:
+                frames = loop_frames[index:]
+                return ("[running]",) + tuple(frame_line(f) for f in frames[-MAX_STACK_DEPTH:])
+        return ("[await]",) + tuple(frame_line(f) for f in coro_frames[-MAX_STACK_DEPTH:])
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            slow = [entry for entry in list(self.active.values()) if now - entry.started >= self.threshold]
+            if not slow:
+                continue
+
+            loop_frames = thread_stack(sys._current_frames().get(self.loop_thread_id))
+            for entry in slow:
+                try:
+                    entry.samples[self._sample(entry, loop_frames)] += 1
+                except Exception as e:  # кадры меняются, пока мы их читаем
+                    logging.debug(f"Stack sample failed: {e}")
+
+
+slow_sampler = SlowUpdateSampler()
+
+
+# ==================== CPROFILE ====================
+
+_profiling = False
+
+
+def should_profile(user_id: Optional[int], command: Optional[str]) -> bool:
+    return (user_id in profile_users) or (command in profile_commands)
+
+
+class UpdateProfiler:
+    """
+    cProfile на время одного хендлера
+
+    cProfile видит весь поток, поэтому в отчёт попадает и то, что цикл
+    событий выполнял, пока хендлер ждал. Одновременно работает только один
+    профайлер: обновления, пришедшие в это время, идут без профилирования.
+    """
+
+    def __init__(self, context: Dict[str, Any]):
+        self.context = context
+        self.profile: Optional[cProfile.Profile] = None
+
+    async def __aenter__(self):
+        global _profiling
+        if not _profiling:
+            _profiling = True
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        global _profiling
+        if self.profile is None:
+            return
+        self.profile.disable()
+        _profiling = False
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        report = f"{format_context(self.context)}\n\n{stream.getvalue()}"
+        path = await asyncio.to_thread(save_report, "profile", report)
+        logging.info(f"Profile of update {self.context.get('update_id')} saved to {path}")
+
+
+# ==================== ЗАДЕРЖКИ ЦИКЛА СОБЫТИЙ ====================
+
+class LoopLagMonitor:
+    """
+    Сторож цикла событий
+
+    Задача в цикле отмечает «пульс» каждые interval секунд, а отдельный поток
+    проверяет его. Если пульс запаздывает больше threshold, цикл чем-то
+    заблокирован — поток снимает стек цикла прямо во время блокировки,
+    так что в лог попадает виновник (синхронный разбор PDF, запись файлов и т. п.).
+    """
+
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls: Deque[str] = deque(maxlen=20)
+        self.heartbeat = 0.0
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopped: Optional[threading.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        # У каждого запуска своё событие: старый поток не переживёт быстрый перезапуск
+        self.stopped = threading.Event()
+        self.task = asyncio.create_task(self._beat())
+        threading.Thread(
+            target=self._watch, args=(self.stopped,), name="loop-lag-watchdog", daemon=True
+        ).start()
+        logging.info("Event loop lag monitoring started")
+
+    def stop(self):
+        if not self.running:
+            return
+        self.task.cancel()
+        self.task = None
+        self.stopped.set()
+        logging.info("Event loop lag monitoring stopped")
+
+    async def _beat(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(time.monotonic() - self.heartbeat - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def _watch(self, stopped: threading.Event):
+        reported = None
+        while not stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            # Об одной блокировке сообщаем один раз
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+
+            frames = thread_stack(sys._current_frames().get(self.loop_thread_id))
+            stack = "\n".join(f"    {frame_line(frame)}" for frame in frames[-MAX_STACK_DEPTH:])
+            report = f"{datetime.now():%H:%M:%S} loop blocked for {stalled:.2f}s+\n{stack}"
+            self.stalls.append(report)
+            logging.warning(f"Event loop blocked for {stalled:.2f}s+:\n{stack}")
+
+
+lag_monitor = LoopLagMonitor()
+
+Gauge("bot_event_loop_lag_seconds", "Last measured event loop lag", lambda: lag_monitor.last_lag)
+
+
+def dump_tasks() -> str:
+    """Стеки всех задач asyncio: где каждая из них сейчас ждёт"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    lines = [f"{len(tasks)} tasks, {datetime.now():%Y-%m-%d %H:%M:%S}", ""]
+    for task in tasks:
+        coro = task.get_coro()
+        lines.append(f"{task.get_name()}: {getattr(coro, '__qualname__', coro)}")
+        lines.extend(f"    {frame_line(frame)}" for frame in coroutine_stack(coro)[-MAX_STACK_DEPTH:])
+        lines.append("")
+    return "\n".join(lines)
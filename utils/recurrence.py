@@ -0,0 +1,433 @@
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Сколько пропущенных повторов считаем при восстановлении после простоя
+MAX_MISSED_COUNT = 1000
+
+WEEKDAY_NAMES_RU = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+
+
+class Rule:
+    """Правило повтора: умеет считать следующее срабатывание после заданного момента"""
+
+    def next_after(self, after: datetime, tz: tzinfo) -> datetime:
+        raise NotImplementedError
+
+    def advance(self, last: datetime, now: datetime, tz: tzinfo) -> Tuple[datetime, int]:
+        """
+        Следующее срабатывание строго после now
+
+        Returns:
+            (время, сколько срабатываний в интервале (last, now] было пропущено)
+        """
+        missed = 0
+        next_time = self.next_after(last, tz)
+        while next_time <= now and missed < MAX_MISSED_COUNT:
+            missed += 1
+            next_time = self.next_after(next_time, tz)
+
+        if next_time <= now:
+            next_time = self.next_after(now, tz)
+        return next_time, missed
+
+    def serialize(self) -> str:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+
+class IntervalRule(Rule):
+    """Каждые N секунд от предыдущего срабатывания"""
+
+    def __init__(self, step: timedelta):
+        self.step = step
+
+    def next_after(self, after: datetime, tz: tzinfo) -> datetime:
+        return after + self.step
+
+    def advance(self, last: datetime, now: datetime, tz: tzinfo) -> Tuple[datetime, int]:
+        # O(1): число шагов считается делением, без перебора
+        if now < last + self.step:
+            return last + self.step, 0
+        steps = int((now - last) / self.step) + 1
+        return last + steps * self.step, steps - 1
+
+    def serialize(self) -> str:
+        seconds = int(self.step.total_seconds())
+        if seconds == 86400:
+            return "daily"
+        if seconds == 7 * 86400:
+            return "weekly"
+        return f"every:{seconds}"
+
+    def describe(self) -> str:
+        seconds = int(self.step.total_seconds())
+        if seconds == 86400:
+            return "каждый день"
+        if seconds == 7 * 86400:
+            return "каждую неделю"
+        if seconds % 86400 == 0:
+            return f"каждые {seconds // 86400} дн."
+        if seconds % 3600 == 0:
+            return f"каждые {seconds // 3600} ч."
+        return f"каждые {seconds // 60} мин."
+
+
+class WeekdayRule(Rule):
+    """В заданные дни недели в HH:MM по местному времени (все 7 дней — ежедневно)"""
+
+    def __init__(self, weekdays: List[int], at: time):
+        self.weekdays = sorted(set(weekdays))
+        self.at = at
+
+    def next_after(self, after: datetime, tz: tzinfo) -> datetime:
+        local = after.astimezone(tz)
+        # Не больше 8 итераций: ближайший подходящий день всегда в пределах недели
+        for days in range(8):
+            day = local.date() + timedelta(days=days)
+            if day.weekday() not in self.weekdays:
+                continue
+            candidate = datetime.combine(day, self.at, tzinfo=tz)
+            if candidate > local:
+                return candidate.astimezone(timezone.utc)
+        raise ValueError("WeekdayRule without weekdays")
+
+    def serialize(self) -> str:
+        at = self.at.strftime("%H:%M")
+        if len(self.weekdays) == 7:
+            return f"at:{at}"
+        return f"days:{','.join(map(str, self.weekdays))}:{at}"
+
+    def describe(self) -> str:
+        at = self.at.strftime("%H:%M")
+        if len(self.weekdays) == 7:
+            return f"каждый день в {at}"
+        if self.weekdays == [0, 1, 2, 3, 4]:
+            return f"по будням в {at}"
+        days = ", ".join(WEEKDAY_NAMES_RU[d] for d in self.weekdays)
+        return f"{days} в {at}"
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> List[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = int(start_str), int(end_str)
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class CronRule(Rule):
+    """Классическое cron-выражение из 5 полей по местному времени пользователя"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression must have 5 fields")
+
+        self.expression = " ".join(fields)
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        # В cron воскресенье — 0 или 7, в Python — 6
+        self.weekdays = sorted({(d - 1) % 7 for d in _parse_cron_field(fields[4], 0, 7)})
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        day_ok = day.day in self.days
+        weekday_ok = day.weekday() in self.weekdays
+        # Как в cron: если ограничены оба поля, достаточно совпадения любого
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, after: datetime, tz: tzinfo) -> datetime:
+        t = after.astimezone(tz).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+
+        # Перескакиваем целыми месяцами/днями/часами; 29 февраля ищется не дольше 8 лет
+        for _ in range(5000):
+            if t.month not in self.months:
+                index = bisect_left(self.months, t.month)
+                if index < len(self.months):
+                    t = t.replace(month=self.months[index], day=1, hour=0, minute=0)
+                else:
+                    t = t.replace(year=t.year + 1, month=self.months[0], day=1, hour=0, minute=0)
+                continue
+
+            if not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+
+            if t.hour not in self.hours:
+                index = bisect_left(self.hours, t.hour)
+                if index < len(self.hours):
+                    t = t.replace(hour=self.hours[index], minute=0)
+                else:
+                    t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+
+            index = bisect_left(self.minutes, t.minute)
+            if index < len(self.minutes):
+                t = t.replace(minute=self.minutes[index])
+                return t.replace(tzinfo=tz).astimezone(timezone.utc)
+
+            t = (t + timedelta(hours=1)).replace(minute=0)
+
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+    def serialize(self) -> str:
+        return f"cron:{self.expression}"
+
+    def describe(self) -> str:
+        return f"cron {self.expression}"
+
+
+def rule_from_string(value: Optional[str]) -> Optional[Rule]:
+    """Восстанавливает правило из строки, сохранённой в базе"""
+    if not value:
+        return None
+    if value == "daily":
+        return IntervalRule(timedelta(days=1))
+    if value == "weekly":
+        return IntervalRule(timedelta(weeks=1))
+
+    kind, _, rest = value.partition(":")
+    if kind == "every":
+        return IntervalRule(timedelta(seconds=int(rest)))
+    if kind == "at":
+        return WeekdayRule(list(range(7)), time.fromisoformat(rest))
+    if kind == "days":
+        days, _, at = rest.partition(":")
+        return WeekdayRule([int(d) for d in days.split(",")], time.fromisoformat(at))
+    if kind == "cron":
+        return CronRule(rest)
+    raise ValueError(f"Unknown recurrence rule: {value}")
+
+
+# ==================== ЧАСОВЫЕ ПОЯСА ====================
+
+OFFSET_RE = re.compile(r"^(?:utc|gmt)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def parse_timezone(value: str) -> Optional[tzinfo]:
+    """Europe/Moscow, UTC, +3, UTC+05:30 → tzinfo; None, если не распознано"""
+    value = value.strip()
+    match = OFFSET_RE.match(value)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if offset > timedelta(hours=14):
+            return None
+        return timezone(-offset if sign == "-" else offset)
+
+    try:
+        return ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def timezone_name(tz: tzinfo) -> str:
+    """Обратное к parse_timezone представление для хранения"""
+    if isinstance(tz, ZoneInfo):
+        return tz.key
+    offset = tz.utcoffset(None)
+    sign = "-" if offset < timedelta(0) else "+"
+    minutes = abs(int(offset.total_seconds())) // 60
+    return f"{sign}{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# ==================== РАЗБОР ТЕКСТА ====================
+
+UNITS = {
+    "m": 60, "min": 60, "мин": 60, "м": 60, "минут": 60, "минуты": 60, "минуту": 60,
+    "minute": 60, "minutes": 60,
+    "h": 3600, "ч": 3600, "час": 3600, "часа": 3600, "часов": 3600, "hour": 3600, "hours": 3600,
+    "d": 86400, "д": 86400, "дн": 86400, "день": 86400, "дня": 86400, "дней": 86400,
+    "day": 86400, "days": 86400,
+}
+
+WEEKDAY_FORMS = [
+    ["понедельник", "понедельникам", "пн", "monday", "mon"],
+    ["вторник", "вторникам", "вт", "tuesday", "tue"],
+    ["среду", "среда", "средам", "ср", "wednesday", "wed"],
+    ["четверг", "четвергам", "чт", "thursday", "thu"],
+    ["пятницу", "пятница", "пятницам", "пт", "friday", "fri"],
+    ["субботу", "суббота", "субботам", "сб", "saturday", "sat"],
+    ["воскресенье", "воскресеньям", "вс", "sunday", "sun"],
+]
+WEEKDAY_LOOKUP = {form: index for index, forms in enumerate(WEEKDAY_FORMS) for form in forms}
+WEEKDAY_GROUPS = {
+    "будни": [0, 1, 2, 3, 4], "будням": [0, 1, 2, 3, 4], "weekdays": [0, 1, 2, 3, 4],
+    "выходные": [5, 6], "выходным": [5, 6], "weekends": [5, 6],
+}
+
+
+def _alternation(words) -> str:
+    return "|".join(sorted((re.escape(w) for w in words), key=len, reverse=True))
+
+
+SEP = r"[\s_]+"
+UNIT = rf"(?P<unit>{_alternation(UNITS)})"
+AT = rf"(?:{SEP}(?:в{SEP}|at{SEP})?(?P<hh>\d{{1,2}})[:.](?P<mm>\d{{2}}))"
+DAY = rf"(?:{_alternation(list(WEEKDAY_LOOKUP) + list(WEEKDAY_GROUPS))})"
+END = r"(?=\s|$)"
+
+RELATIVE_RE = re.compile(rf"^(?:(?:через|in){SEP})?(?P<n>\d+)\s*{UNIT}{END}", re.IGNORECASE)
+
+GRAMMAR = [
+    ("cron", re.compile(rf"^cron{SEP}(?P<cron>\S+\s+\S+\s+\S+\s+\S+\s+\S+){END}", re.IGNORECASE)),
+    ("interval", re.compile(
+        rf"^(?:каждые|каждый|каждую|каждое|every){SEP}(?P<n>\d+)\s*{UNIT}{END}", re.IGNORECASE
+    )),
+    ("daily", re.compile(
+        rf"^(?:каждый{SEP}день|ежедневно|daily|every{SEP}day){AT}?{END}", re.IGNORECASE
+    )),
+    ("weekly", re.compile(
+        rf"^(?:каждую{SEP}неделю|еженедельно|weekly|every{SEP}week){END}", re.IGNORECASE
+    )),
+    ("weekdays", re.compile(
+        rf"^(?:(?:каждый|каждую|каждое|по|every|on){SEP})?(?P<days>{DAY}(?:\s*,\s*{DAY})*){AT}?{END}",
+        re.IGNORECASE
+    )),
+    ("relative", RELATIVE_RE),
+    ("tomorrow", re.compile(rf"^(?:завтра|tomorrow){AT}?{END}", re.IGNORECASE)),
+    ("today", re.compile(
+        rf"^(?:(?:сегодня|today){SEP})?(?:(?:в|at){SEP})?(?P<hh>\d{{1,2}})[:.](?P<mm>\d{{2}}){END}",
+        re.IGNORECASE
+    )),
+]
+
+DEFAULT_TIME = time(9, 0)
+
+
+@dataclass
+class Schedule:
+    first: datetime
+    rule: Optional[Rule]
+    text: str
+
+
+def parse_relative_time(time_str: str) -> Optional[timedelta]:
+    """10m, 2h, 1d, «5 минут» → timedelta"""
+    time_str = time_str.strip()
+    match = RELATIVE_RE.match(time_str)
+    if not match or match.end() != len(time_str):
+        return None
+    return timedelta(seconds=int(match.group("n")) * UNITS[match.group("unit").lower()])
+
+
+def _at(match: re.Match) -> Optional[time]:
+    if match.group("hh") is None:
+        return None
+    hour, minute = int(match.group("hh")), int(match.group("mm"))
+    if hour > 23 or minute > 59:
+        raise ValueError("Invalid time of day")
+    return time(hour, minute)
+
+
+def _at_local(day, at: time, tz: tzinfo) -> datetime:
+    return datetime.combine(day, at, tzinfo=tz).astimezone(timezone.utc)
+
+
+def parse_schedule(args: str, now: datetime, tz: tzinfo) -> Optional[Schedule]:
+    """
+    Разбирает «<когда> <текст>» из аргументов /remind
+
+    Args:
+        args: Всё, что после команды
+        now: Текущее время (aware)
+        tz: Часовой пояс пользователя
+
+    Returns:
+        Schedule или None, если время не распознано или текста нет
+    """
+    args = args.strip()
+    local_now = now.astimezone(tz)
+
+    for kind, pattern in GRAMMAR:
+        match = pattern.match(args)
+        if not match:
+            continue
+
+        text = args[match.end():].strip()
+        if not text:
+            return None
+
+        try:
+            rule = None
+
+            if kind == "cron":
+                rule = CronRule(match.group("cron"))
+                first = rule.next_after(now, tz)
+
+            elif kind == "interval":
+                step = timedelta(seconds=int(match.group("n")) * UNITS[match.group("unit").lower()])
+                if step <= timedelta(0):
+                    return None
+                rule = IntervalRule(step)
+                first = now + step
+
+            elif kind == "daily":
+                at = _at(match)
+                if at is None:
+                    rule = IntervalRule(timedelta(days=1))
+                    first = now + timedelta(days=1)
+                else:
+                    rule = WeekdayRule(list(range(7)), at)
+                    first = rule.next_after(now, tz)
+
+            elif kind == "weekly":
+                rule = IntervalRule(timedelta(weeks=1))
+                first = now + timedelta(weeks=1)
+
+            elif kind == "weekdays":
+                days = []
+                for word in re.split(r"\s*,\s*", match.group("days").lower()):
+                    days += WEEKDAY_GROUPS.get(word, [WEEKDAY_LOOKUP.get(word)])
+                rule = WeekdayRule(days, _at(match) or DEFAULT_TIME)
+                first = rule.next_after(now, tz)
+
+            elif kind == "relative":
+                delta = timedelta(seconds=int(match.group("n")) * UNITS[match.group("unit").lower()])
+                if delta <= timedelta(0):
+                    return None
+                first = now + delta
+
+            elif kind == "tomorrow":
+                at = _at(match)
+                if at is None:
+                    first = now + timedelta(days=1)
+                else:
+                    first = _at_local(local_now.date() + timedelta(days=1), at, tz)
+
+            else:  # today / просто HH:MM
+                first = _at_local(local_now.date(), _at(match), tz)
+                if first <= now:
+                    first = _at_local(local_now.date() + timedelta(days=1), _at(match), tz)
+
+        except ValueError:
+            return None
+
+        return Schedule(first=first, rule=rule, text=text)
+
+    return None
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class Scheduler:
+    """
+    Один таймер на все отложенные задачи
+
+    Задачи лежат в min-куче по времени срабатывания. Вставка — O(log n),
+    отмена — O(1) (запись в куче помечается устаревшей и выбрасывается,
+    когда доходит до вершины). Цикл спит ровно до ближайшей задачи и
+    просыпается раньше, только если появилась задача с более ранним временем.
+
+    Пока планировщик остановлен (процесс не ведущий), schedule() только
+    запоминает время задачи, а куча строится в start() — так повторная
+    синхронизация не наращивает кучу, которую некому чистить.
+
+    Одновременно выполняется не больше max_concurrency задач: после простоя
+    накопившиеся задачи запускаются по мере освобождения слотов, а не разом.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Hashable], Awaitable[None]],
+        name: str = "scheduler",
+        *,
+        max_concurrency: int
+    ):
+        self.callback = callback
+        self.name = name
+        self.slots = asyncio.Semaphore(max_concurrency)
+        # Запущенные, но ещё не завершившиеся вызовы callback
+        self.firing: Set[asyncio.Task] = set()
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.entries: Dict[Hashable, Tuple[float, int]] = {}
+        self.counter = itertools.count()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, job_id: Hashable) -> bool:
+        return job_id in self.entries
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    def schedule(self, job_id: Hashable, when: datetime):
+        """Ставит (или переносит) задачу на время when"""
+        entry = (when.timestamp(), next(self.counter))
+        self.entries[job_id] = entry
+        if not self.running:
+            return
+        heapq.heappush(self.heap, (entry[0], entry[1], job_id))
+
+        # Будим цикл, только если новая задача стала ближайшей
+        if self.wakeup and self.heap[0][2] == job_id and self.heap[0][1] == entry[1]:
+            self.wakeup.set()
+
+    def cancel(self, job_id: Hashable) -> bool:
+        if self.entries.pop(job_id, None) is None:
+            return False
+
+        # Не даём куче разрастись из устаревших записей
+        if self.running and len(self.heap) > 64 and len(self.heap) > 2 * len(self.entries):
+            self._compact()
+        return True
+
+    def next_fire_time(self) -> Optional[float]:
+        self._drop_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def start(self):
+        if self.task is None:
+            self._compact()
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Останавливает цикл; запланированные задачи сохраняются до следующего start()"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.wakeup = None
+            self.heap = []
+
+    def _compact(self):
+        self.heap = [
+            (ts, seq, job_id) for job_id, (ts, seq) in self.entries.items()
+        ]
+        heapq.heapify(self.heap)
+
+    def _drop_stale(self):
+        while self.heap:
+            ts, seq, job_id = self.heap[0]
+            if self.entries.get(job_id) == (ts, seq):
+                return
+            heapq.heappop(self.heap)
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            next_ts = self.next_fire_time()
+
+            if next_ts is None:
+                await self.wakeup.wait()
+                continue
+
+            delay = next_ts - datetime.now().timestamp()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.slots.acquire()
+            # Пока ждали слот, задачу могли отменить или перенести
+            if self.next_fire_time() != next_ts:
+                self.slots.release()
+                continue
+
+            _, _, job_id = heapq.heappop(self.heap)
+            del self.entries[job_id]
+            task = asyncio.create_task(self._fire(job_id))
+            self.firing.add(task)
+            task.add_done_callback(self.firing.discard)
+
+    async def _fire(self, job_id: Hashable):
+        try:
+            await self.callback(job_id)
+        except Exception as e:
+            logging.error(f"{self.name} job {job_id} failed: {e}")
+        finally:
+            self.slots.release()
@@ -0,0 +1,239 @@
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from config import STATE_BACKEND, REDIS_URL
+from utils.database import Database, db
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # нужен только для STATE_BACKEND=redis
+    aioredis = None
+
+
+class StateStore:
+    """
+    Общее состояние бота: ключ → JSON-значение с необязательным TTL
+
+    Значения всегда проходят через JSON, поэтому изменение полученного
+    объекта не меняет сохранённый — у всех бэкендов одинаковая семантика.
+    Аренда (lease) — запись, которую может продлевать только её владелец;
+    на ней построен выбор ведущего процесса.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Захватывает свободную (или продлевает свою) аренду на ttl секунд"""
+        raise NotImplementedError
+
+    async def release_lease(self, name: str, owner: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(StateStore):
+    """Хранилище внутри процесса: по умолчанию и для тестов"""
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[Optional[float], str]] = {}
+
+    def _get_raw(self, key: str) -> Optional[str]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self._get_raw(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + ttl if ttl else None
+        self.data[key] = (expires, json.dumps(value, ensure_ascii=False))
+
+    async def delete(self, key: str):
+        self.data.pop(key, None)
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        current = self._get_raw(f"lease:{name}")
+        if current is not None and json.loads(current) != owner:
+            return False
+        await self.set(f"lease:{name}", owner, ttl)
+        return True
+
+    async def release_lease(self, name: str, owner: str):
+        if await self.get(f"lease:{name}") == owner:
+            await self.delete(f"lease:{name}")
+
+
+class SQLiteStore(StateStore):
+    """Таблица kv_store в общей базе: для нескольких процессов на одной машине"""
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.execute_sync("""
+            CREATE TABLE IF NOT EXISTS kv_store (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL
+            )
+        """)
+
+    async def get(self, key: str) -> Optional[Any]:
+        rows = await self.db.execute(
+            "SELECT value FROM kv_store WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time())
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.db.execute(
+            "INSERT OR REPLACE INTO kv_store (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None)
+        )
+
+    async def delete(self, key: str):
+        await self.db.execute("DELETE FROM kv_store WHERE key = ?", (key,))
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        value = json.dumps(owner)
+        # Один UPSERT: перезаписываем только свою или истёкшую аренду
+        await self.db.execute(
+            "INSERT INTO kv_store (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE kv_store.value = excluded.value OR kv_store.expires <= ?",
+            (f"lease:{name}", value, now + ttl, now)
+        )
+        return await self.get(f"lease:{name}") == owner
+
+    async def release_lease(self, name: str, owner: str):
+        await self.db.execute(
+            "DELETE FROM kv_store WHERE key = ? AND value = ?",
+            (f"lease:{name}", json.dumps(owner))
+        )
+
+
+# Проверка владельца и запись должны быть атомарными — выполняем их скриптом на сервере
+LEASE_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+LEASE_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisStore(StateStore):
+    """
+    Redis (или совместимый сервер) для FSM, сессий и аренды
+
+    Напоминания и товары остаются в локальной SQLite, поэтому процессы
+    бота всё равно должны работать на одной машине.
+    """
+
+    def __init__(self, url: str, prefix: str = "tg_bot:"):
+        if aioredis is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the redis package")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.redis.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.redis.set(
+            self.prefix + key,
+            json.dumps(value, ensure_ascii=False),
+            px=int(ttl * 1000) if ttl else None
+        )
+
+    async def delete(self, key: str):
+        await self.redis.delete(self.prefix + key)
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        result = await self.redis.eval(
+            LEASE_ACQUIRE_SCRIPT, 1, f"{self.prefix}lease:{name}", owner, int(ttl * 1000)
+        )
+        return bool(result)
+
+    async def release_lease(self, name: str, owner: str):
+        await self.redis.eval(LEASE_RELEASE_SCRIPT, 1, f"{self.prefix}lease:{name}", owner)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_store(backend: str, redis_url: str = "") -> StateStore:
+    if backend == "memory":
+        return MemoryStore()
+    elif backend == "sqlite":
+        return SQLiteStore(db)
+    elif backend == "redis":
+        return RedisStore(redis_url)
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+
+
+class StoreFSMStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх StateStore"""
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    @staticmethod
+    def _key(key: StorageKey, part: str) -> str:
+        business = getattr(key, "business_connection_id", None)
+        return (
+            f"fsm:{key.bot_id}:{key.chat_id}:{key.user_id}:"
+            f"{key.thread_id}:{business}:{key.destiny}:{part}"
+        )
+
+    async def set_state(self, key: StorageKey, state=None):
+        if isinstance(state, State):
+            state = state.state
+        if state is None:
+            await self.store.delete(self._key(key, "state"))
+        else:
+            await self.store.set(self._key(key, "state"), state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.store.get(self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]):
+        if data:
+            await self.store.set(self._key(key, "data"), data)
+        else:
+            await self.store.delete(self._key(key, "data"))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.store.get(self._key(key, "data")) or {}
+
+    async def close(self):
+        await self.store.close()
+
+
+state_store = create_store(STATE_BACKEND, REDIS_URL)
@@ -0,0 +1,87 @@
+import codecs
+import logging
+from pathlib import Path
+from typing import Optional
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:  # charset_normalizer приходит вместе с requests, но не обязателен
+    from_bytes = None
+
+
+SAMPLE_SIZE = 64 * 1024
+TRUNCATION_MARK = "..."
+
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Определяет кодировку по началу файла
+
+    Порядок: BOM → валидный UTF-8 → charset_normalizer → cp1251
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    # Последний символ сэмпла может быть обрезан посередине — final=False это допускает
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+
+    return "cp1251"
+
+
+def read_text_prefix(file_path: Path, limit: int) -> tuple[str, bool]:
+    """
+    Читает из файла не больше limit символов
+
+    Args:
+        file_path: Путь к текстовому файлу
+        limit: Максимальное количество символов
+
+    Returns:
+        (текст, был_ли_файл_обрезан)
+    """
+    with open(file_path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+
+    encoding = detect_encoding(sample)
+    logging.info(f"Text file encoding: {file_path.name} | {encoding}")
+
+    # Текстовый режим декодирует буферами, поэтому память не зависит от размера файла
+    with open(file_path, "r", encoding=encoding, errors="replace") as f:
+        text = f.read(limit)
+        truncated = bool(f.read(1))
+
+    return text, truncated
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """Обрезает текст до limit символов, включая TRUNCATION_MARK; повторный вызов ничего не меняет"""
+    if len(text) <= limit:
+        return text
+    return text[:limit - len(TRUNCATION_MARK)] + TRUNCATION_MARK
+
+
+def read_text_file(file_path: Path, limit: int) -> Optional[str]:
+    """Обёртка над read_text_prefix: не больше limit символов с отметкой обрезки, None при ошибке"""
+    try:
+        text, truncated = read_text_prefix(file_path, limit)
+    except (OSError, LookupError) as e:
+        logging.error(f"Text file read error: {file_path} | Error: {e}")
+        return None
+
+    return text[:limit - len(TRUNCATION_MARK)] + TRUNCATION_MARK if truncated else text
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import requests
+from config import TRACE_SAMPLE_RATE, TRACE_FILE, OTLP_ENDPOINT
+
+SERVICE_NAME = "tg_bot"
+EXPORT_INTERVAL = 5  # секунд
+MAX_PENDING_SPANS = 10000
+
+
+class Span:
+    """Участок работы внутри трассы; времена — в наносекундах Unix"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "end", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = 0
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class NoopSpan:
+    """Заглушка вне трассы: span() отдаёт её, чтобы вызывающему не проверять None"""
+
+    def set(self, **attributes: Any):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Завершённые span'ы ждут выгрузки фоновой задачей
+pending: List[Span] = []
+
+
+def _finish(item: Span):
+    item.end = time.time_ns()
+    if len(pending) < MAX_PENDING_SPANS:
+        pending.append(item)
+
+
+@contextmanager
+def start_trace(name: str, sample_rate: float = TRACE_SAMPLE_RATE, **attributes: Any):
+    """Корневой span новой трассы; в выборку попадает доля sample_rate вызовов"""
+    if not sample_rate or random.random() >= sample_rate:
+        yield NOOP_SPAN
+        return
+
+    root = Span(name, os.urandom(16).hex(), None, attributes)
+    token = current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        _finish(root)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """
+    Дочерний span текущей трассы
+
+    Вне трассы (трассировка выключена или обновление не попало в выборку)
+    стоит одного чтения ContextVar. Контекст копируется в задачи asyncio
+    и в asyncio.to_thread, поэтому span'ы внутри них попадают в ту же трассу.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        _finish(child)
+
+
+# ==================== ЭКСПОРТ ====================
+
+def export_jsonl(spans: List[Span], path: str = TRACE_FILE):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for item in spans:
+            f.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(item: Span) -> Dict[str, Any]:
+    result = {
+        "traceId": item.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(item.start),
+        "endTimeUnixNano": str(item.end),
+        "attributes": [
+            {"key": key, "value": otlp_value(value)}
+            for key, value in item.attributes.items() if value is not None
+        ],
+    }
+    if item.parent_id:
+        result["parentSpanId"] = item.parent_id
+    if item.error:
+        result["status"] = {"code": 2, "message": item.error}  # STATUS_CODE_ERROR
+    return result
+
+
+def export_otlp(spans: List[Span], endpoint: str = OTLP_ENDPOINT):
+    """OTLP/HTTP в JSON-кодировке: принимают Jaeger, Tempo и OpenTelemetry Collector"""
+    payload = {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]
+            },
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [otlp_span(item) for item in spans],
+            }],
+        }]
+    }
+    response = requests.post(f"{endpoint.rstrip('/')}/v1/traces", json=payload, timeout=10)
+    response.raise_for_status()
+
+
+def export(spans: List[Span]):
+    if OTLP_ENDPOINT:
+        export_otlp(spans)
+    else:
+        export_jsonl(spans)
+
+
+async def flush():
+    global pending
+    if not pending:
+        return
+    spans, pending = pending, []
+    try:
+        await asyncio.to_thread(export, spans)
+    except Exception as e:
+        logging.error(f"Trace export failed ({len(spans)} spans): {e}")
+
+
+async def run_trace_exporter(interval: float = EXPORT_INTERVAL):
+    """Фоновая выгрузка span'ов: запись в файл или сеть не блокирует цикл событий"""
+    while True:
+        await asyncio.sleep(interval)
+        await flush()
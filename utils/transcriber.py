@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.metrics import track_upstream
+from utils.llm import get_client, OPENAI_BASE_URL
+
+
+class TranscriptionBackend:
+    """Базовый бэкенд распознавания речи"""
+
+    async def transcribe(self, audio_file: Path) -> Optional[str]:
+        raise NotImplementedError
+
+
+class WhisperBackend(TranscriptionBackend):
+    """Распознавание через OpenAI Whisper API"""
+
+    def __init__(self, client=None, model: str = "whisper-1", language: str = "ru"):
+        self._client = client
+        self.model = model
+        self.language = language
+
+    @property
+    def client(self):
+        """По умолчанию — общий клиент api.openai.com, создаётся при первом вызове"""
+        if self._client is None:
+            self._client = get_client(OPENAI_BASE_URL)
+        return self._client
+
+    async def transcribe(self, audio_file: Path) -> Optional[str]:
+        def _transcribe():
+            with open(audio_file, "rb") as audio:
+                transcript = self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=audio,
+                    language=self.language
+                )
+                return transcript.text
+
+        try:
+            with track_upstream("whisper", self.model):
+                return await asyncio.to_thread(_transcribe)
+        except Exception as e:
+            logging.error(f"Whisper API error: {e}")
+            return None
+
+
+class StubBackend(TranscriptionBackend):
+    """Локальная заглушка: возвращает заданный текст без сетевых вызовов"""
+
+    def __init__(self, text: str = "тестовая расшифровка"):
+        self.text = text
+        self.calls: List[Path] = []
+
+    async def transcribe(self, audio_file: Path) -> Optional[str]:
+        self.calls.append(audio_file)
+        return self.text
+
+
+# Ставится на место сегмента, который не удалось распознать
+PARTIAL_MARK = "[…]"
+
+SILENCE_END_RE = re.compile(r"silence_end: ([\d.]+) \| silence_duration: ([\d.]+)")
+
+
+async def find_silences(audio_file: Path, noise_db: int = -30, min_silence: float = 0.5) -> List[float]:
+    """Возвращает середины пауз (в секундах) по данным ffmpeg silencedetect"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-nostats", "-i", str(audio_file),
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+        "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+
+    midpoints = []
+    for match in SILENCE_END_RE.finditer(stderr.decode("utf-8", errors="replace")):
+        end, duration = float(match.group(1)), float(match.group(2))
+        midpoints.append(end - duration / 2)
+    return midpoints
+
+
+def choose_cut_points(silences: List[float], duration: float, target: float, tolerance: float) -> List[float]:
+    """
+    Выбирает точки разреза около каждых target секунд
+
+    Режем по ближайшей паузе в пределах tolerance, иначе — ровно по target,
+    чтобы сегмент не вырос больше, чем допускает бэкенд.
+    """
+    cuts = []
+    position = 0.0
+    while duration - position > target + tolerance:
+        wanted = position + target
+        nearby = [s for s in silences if abs(s - wanted) <= tolerance and s > position]
+        cut = min(nearby, key=lambda s: abs(s - wanted)) if nearby else wanted
+        cuts.append(cut)
+        position = cut
+    return cuts
+
+
+async def split_audio(audio_file: Path, cuts: List[float]) -> List[Path]:
+    """Режет файл на сегменты по точкам cuts без перекодирования"""
+    bounds = [0.0] + cuts + [None]
+    segments = []
+
+    for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        segment = audio_file.with_name(f"{audio_file.stem}_part{index}{audio_file.suffix}")
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", str(audio_file), "-ss", f"{start:.2f}"]
+        if end is not None:
+            args += ["-to", f"{end:.2f}"]
+        args += ["-c", "copy", str(segment)]
+
+        process = await asyncio.create_subprocess_exec(*args)
+        if await process.wait() != 0:
+            for path in segments:
+                path.unlink(missing_ok=True)
+            raise RuntimeError(f"ffmpeg failed to cut segment {index} of {audio_file}")
+        segments.append(segment)
+
+    return segments
+
+
+class Transcriber:
+    """
+    Распознавание голосовых с кэшем, лимитом параллельности и сегментацией
+
+    Кэш ключуется по file_unique_id: пересланное голосовое имеет тот же
+    идентификатор, поэтому повторно его не скачиваем и не распознаём.
+    """
+
+    def __init__(
+        self,
+        backend: TranscriptionBackend,
+        max_concurrency: int = 4,
+        cache_size: int = 1000,
+        segment_threshold: int = 120,
+        segment_length: int = 60,
+        segment_tolerance: int = 15
+    ):
+        self.backend = backend
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.cache_size = cache_size
+        self.segment_threshold = segment_threshold
+        self.segment_length = segment_length
+        self.segment_tolerance = segment_tolerance
+        self.in_flight: Dict[str, asyncio.Future] = {}
+
+    def get_cached(self, key: str) -> Optional[str]:
+        text = self.cache.get(key)
+        if text is not None:
+            self.cache.move_to_end(key)
+        return text
+
+    def _remember(self, key: str, text: str):
+        self.cache[key] = text
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def transcribe(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Path]],
+        duration: int = 0
+    ) -> Optional[str]:
+        """
+        Args:
+            key: file_unique_id голосового
+            fetch: Корутина, скачивающая файл; вызывается только при промахе кэша
+            duration: Длительность записи в секундах
+
+        Returns:
+            Текст или None, если распознать не удалось
+        """
+        cached = self.get_cached(key)
+        if cached is not None:
+            return cached
+
+        # Одно и то же голосовое, пришедшее параллельно, распознаём один раз
+        while key in self.in_flight:
+            owner = self.in_flight[key]
+            try:
+                return await asyncio.shield(owner)
+            except asyncio.CancelledError:
+                # Отменили не нас, а распознавание, которое мы ждали, — делаем сами
+                if not owner.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+
+        try:
+            audio_file = await fetch()
+            try:
+                text, partial = await self._transcribe_file(audio_file, duration)
+            finally:
+                audio_file.unlink(missing_ok=True)
+
+            # Неполную расшифровку не кэшируем: повтор может распознать всё
+            if text and not partial:
+                self._remember(key, text)
+            future.set_result(text)
+            return text
+
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже пробрасывается вызывающему, ждущие получат его из future
+            future.exception()
+            raise
+
+        finally:
+            # Отмена (CancelledError не Exception) не должна оставить ждущих висеть
+            if not future.done():
+                future.cancel()
+            del self.in_flight[key]
+
+    async def _transcribe_file(self, audio_file: Path, duration: int) -> Tuple[Optional[str], bool]:
+        """
+        Returns:
+            (текст, неполный ли он); на месте нераспознанных сегментов — PARTIAL_MARK
+        """
+        if duration <= self.segment_threshold:
+            async with self.semaphore:
+                return await self.backend.transcribe(audio_file), False
+
+        silences = await find_silences(audio_file)
+        cuts = choose_cut_points(silences, duration, self.segment_length, self.segment_tolerance)
+        segments = await split_audio(audio_file, cuts)
+        logging.info(f"Voice split into {len(segments)} segments: {audio_file.name}")
+
+        async def _segment(path: Path) -> Optional[str]:
+            try:
+                async with self.semaphore:
+                    return await self.backend.transcribe(path)
+            except Exception as e:
+                logging.error(f"Segment {path.name} transcription error: {e}")
+                return None
+            finally:
+                path.unlink(missing_ok=True)
+
+        parts = await asyncio.gather(*(_segment(path) for path in segments))
+
+        # None — ошибка бэкенда, пустая строка — сегмент без речи
+        failed = [index for index, part in enumerate(parts) if part is None]
+        if failed:
+            logging.warning(
+                f"{len(failed)} of {len(parts)} segments of {audio_file.name} "
+                f"were not transcribed: {failed}"
+            )
+        if not any(parts):
+            return None, bool(failed)
+        text = " ".join(
+            PARTIAL_MARK if part is None else part.strip()
+            for part in parts if part is None or part.strip()
+        )
+        return text, bool(failed)
@@ -0,0 +1,221 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from utils.api_client import fetch_json
+
+CARD_DETAIL_URL = "https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest=-1257786&nm={articles}"
+
+
+# Первый vol каждого basket-хоста; таблица дополняется сама при промахах
+DEFAULT_BASKET_STARTS = {
+    1: 0, 2: 144, 3: 288, 4: 432, 5: 720, 6: 1008, 7: 1062, 8: 1116,
+    9: 1170, 10: 1314, 11: 1602, 12: 1656, 13: 1920, 14: 2046, 15: 2190,
+    16: 2406, 17: 2622, 18: 2838, 19: 3054, 20: 3270, 21: 3486, 22: 3702,
+    23: 3918, 24: 4134, 25: 4350, 26: 4566,
+}
+BASKETS_FILE = Path("data/wb_baskets.json")
+PROBE_RADIUS = 3
+PROBE_RETRY_INTERVAL = 3600
+
+
+class BasketRouter:
+    """
+    Таблица vol → номер basket-хоста
+
+    Диапазоны монотонны: чем больше vol, тем больше номер хоста, поэтому
+    поиск — bisect по отсортированным началам диапазонов. Если карточка не
+    нашлась, соседние хосты опрашиваются по очереди, а найденная граница
+    сохраняется в файл.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.starts: Dict[int, int] = dict(DEFAULT_BASKET_STARTS)
+        self.failed: Dict[str, float] = {}
+        self.load()
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.starts = {int(basket): start for basket, start in json.load(f).items()}
+        except Exception as e:
+            logging.error(f"Error loading WB basket table: {e}")
+        self._rebuild()
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.starts, f)
+            tmp.replace(self.path)
+        except Exception as e:
+            logging.error(f"Error saving WB basket table: {e}")
+
+    def _rebuild(self):
+        ordered = sorted(self.starts.items(), key=lambda item: item[1])
+        self.baskets = [basket for basket, _ in ordered]
+        self.bounds = [start for _, start in ordered]
+
+    def lookup(self, vol: int) -> int:
+        index = bisect.bisect_right(self.bounds, vol) - 1
+        return self.baskets[max(index, 0)]
+
+    def learn(self, vol: int, basket: int):
+        """Запоминает, что vol лежит на хосте basket, и сдвигает соседние границы"""
+        starts = self.starts
+        starts[basket] = min(starts.get(basket, vol), vol)
+
+        # Младшие хосты должны начинаться раньше найденного
+        for other in [b for b in starts if b < basket and starts[b] >= starts[basket]]:
+            del starts[other]
+
+        # Старшие — строго после vol и по возрастанию
+        previous = vol
+        for other in sorted(b for b in starts if b > basket):
+            starts[other] = max(starts[other], previous + 1)
+            previous = starts[other]
+
+        self._rebuild()
+        self.save()
+        logging.info(f"WB basket table: vol {vol} -> basket {basket}")
+
+    def candidates(self, vol: int) -> List[int]:
+        """Соседние хосты по удалённости от предсказанного"""
+        predicted = self.lookup(vol)
+        last = max(self.baskets) + PROBE_RADIUS
+        result = []
+        for distance in range(1, PROBE_RADIUS + 1):
+            for basket in (predicted + distance, predicted - distance):
+                if 1 <= basket <= last:
+                    result.append(basket)
+        return result
+
+
+basket_router = BasketRouter(BASKETS_FILE)
+
+
+def get_wb_basket(vol: int) -> int:
+    return basket_router.lookup(vol)
+
+
+def basket_card_url(basket: int, article: str) -> str:
+    vol = article[:len(article) - 5]
+    part = article[:len(article) - 3]
+    return f"https://basket-{basket:02d}.wbbasket.ru/vol{vol}/part{part}/{article}/info/ru/card.json"
+
+
+async def fetch_basket_card(article: str) -> Optional[dict]:
+    """card.json с basket-CDN: название и описание товара, цены там нет"""
+    vol = int(article[:len(article) - 5] or 0)
+    data = await fetch_json(basket_card_url(get_wb_basket(vol), article))
+    if data:
+        return data
+
+    # Не чаще раза в час на артикул, чтобы несуществующие товары не вызывали опросов
+    now = time.monotonic()
+    if now - basket_router.failed.get(article, -PROBE_RETRY_INTERVAL) < PROBE_RETRY_INTERVAL:
+        return None
+
+    for basket in basket_router.candidates(vol):
+        data = await fetch_json(basket_card_url(basket, article))
+        if data:
+            basket_router.learn(vol, basket)
+            return data
+
+    if len(basket_router.failed) > 10000:
+        basket_router.failed.clear()
+    basket_router.failed[article] = now
+    return None
+
+
+def extract_price(product: dict) -> float:
+    """Цена со скидкой в рублях из карточки card.wb.ru (0, если товара нет в наличии)"""
+    for size in product.get("sizes") or []:
+        price = size.get("price") or {}
+        value = price.get("product") or price.get("total") or price.get("basic")
+        if value:
+            return value / 100
+
+    # Старый формат ответа (cards/v1)
+    value = product.get("salePriceU") or product.get("priceU")
+    return value / 100 if value else 0
+
+
+class WildberriesClient:
+    """
+    Группирует запросы цен по артикулам в пакеты
+
+    Артикулы, запрошенные почти одновременно (в пределах batch_window),
+    уходят одним запросом к cards/v2/detail с nm=a;b;c — до batch_size штук.
+    """
+
+    def __init__(self, batch_size: int = 50, batch_window: float = 0.05, max_concurrency: int = 5):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.pending: Dict[str, List[asyncio.Future]] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def get_card(self, article: str) -> Optional[dict]:
+        """{"id", "name", "brand", "price"} или None"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.setdefault(article, []).append(future)
+
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        pending, self.pending = self.pending, {}
+        articles = list(pending)
+
+        for start in range(0, len(articles), self.batch_size):
+            chunk = {a: pending[a] for a in articles[start:start + self.batch_size]}
+            task = asyncio.create_task(self._fetch_batch(chunk))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _fetch_batch(self, chunk: Dict[str, List[asyncio.Future]]):
+        cards: Optional[Dict[str, dict]] = None
+        try:
+            async with self.semaphore:
+                data = await fetch_json(CARD_DETAIL_URL.format(articles=";".join(chunk)))
+
+            found = {}
+            for product in ((data or {}).get("data") or {}).get("products") or []:
+                found[str(product.get("id"))] = {
+                    "id": str(product.get("id")),
+                    "name": product.get("name"),
+                    "brand": product.get("brand"),
+                    "price": extract_price(product),
+                }
+            cards = found
+            logging.info(f"WB batch: {len(chunk)} articles, {len(cards)} found")
+        except Exception as e:
+            logging.error(f"WB batch error: {e}")
+            cards = {}
+        finally:
+            # Пакет отменён (остановка бота) — отменяем и ожидания, а не оставляем их висеть
+            for article, futures in chunk.items():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if cards is None:
+                        future.cancel()
+                    else:
+                        future.set_result(cards.get(article))